@@ -0,0 +1,18 @@
+"""
+Offline performance benchmarks for uptrain. Run them with:
+
+    pytest benchmarks/
+
+The benchmarks need `pytest-benchmark`, and don't call any external service - LLM and
+embedding requests go to the fakes in `benchmarks.stubs`. Datasets are generated by
+`benchmarks.data` at 1k, 100k and 1M rows. Cases larger than each benchmark's default
+limit only run with UPTRAIN_BENCH_LARGE=1.
+
+To check for regressions against the stored baseline:
+
+    pytest benchmarks/ --benchmark-json=results.json
+    python -m benchmarks.compare results.json --max-regression 10
+
+and to record a new baseline, run the same with `--update`. Baselines are only
+comparable on the machine they were recorded on.
+"""
@@ -0,0 +1,45 @@
+"""
+Throughput of the batched `BLEUScore` operator, on synthetic generations scored against a
+small set of repeated references. Scoring doesn't need torch, which the benchmark checks.
+"""
+
+import os
+import random
+import sys
+
+import polars as pl
+import pytest
+
+from uptrain.operators import BLEUScore
+
+from benchmarks.data import record_throughput, skip_unless_large
+
+SIZES = [1_000, 10_000, 100_000]
+WORDS = [f"word{i}" for i in range(500)]
+
+
+def make_data(num_rows: int, seed: int = 0) -> pl.DataFrame:
+    rng = random.Random(seed)
+    sources = [" ".join(rng.choices(WORDS, k=60)) for _ in range(100)]
+    return pl.DataFrame(
+        {
+            "text_generated": [" ".join(rng.choices(WORDS, k=40)) for _ in range(num_rows)],
+            "text_source": [rng.choice(sources) for _ in range(num_rows)],
+        }
+    )
+
+
+@pytest.mark.parametrize("n_gram", [1, 4])
+@pytest.mark.parametrize("num_workers", [1, None])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_bleu_score(benchmark, num_rows, num_workers, n_gram):
+    skip_unless_large(num_rows, 100_000)
+
+    data = make_data(num_rows)
+    op = BLEUScore(n_gram=n_gram, num_workers=num_workers)
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert len(output) == num_rows
+    assert "torch" not in sys.modules
+    record_throughput(benchmark, num_rows)
+    benchmark.extra_info["num_workers"] = num_workers or os.cpu_count()
@@ -0,0 +1,73 @@
+"""
+End-to-end `CheckSet` runs - reading the dataset, running text, Rouge-L and LLM
+completion checks, and writing their outputs. LLM requests go to `FakeLLMClient`, with
+10ms of latency each.
+"""
+
+import os
+
+import pytest
+
+from uptrain.framework import Check, CheckSet, Settings
+from uptrain.operators import JsonReader, RougeScore, TextCompletion, TextLength, WordCount
+
+from benchmarks.data import (
+    SIZES,
+    make_qa_rows,
+    record_throughput,
+    skip_unless_large,
+    write_dataset,
+)
+from benchmarks.stubs import FakeLLMClient
+
+
+def make_checkset(fpath: str) -> CheckSet:
+    checks = [
+        Check(
+            name="text_stats",
+            operators=[TextLength(col_in_text="response"), WordCount(col_in_text="response")],
+        ),
+        Check(
+            name="rouge",
+            operators=[
+                RougeScore(
+                    score_type="f1", col_in_generated="response", col_in_source="context"
+                )
+            ],
+        ),
+        Check(
+            name="completion",
+            operators=[TextCompletion(col_in_prompt="response", temperature=0.0)],
+        ),
+    ]
+    return CheckSet(source=JsonReader(fpath=fpath), checks=checks)
+
+
+@pytest.mark.parametrize("output_format", ["jsonl", "parquet"])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_checkset_run(benchmark, tmp_path, num_rows, output_format):
+    skip_unless_large(num_rows, 1_000)
+
+    fpath = write_dataset(make_qa_rows(num_rows), str(tmp_path), "jsonl")
+    settings = Settings(
+        logs_folder=str(tmp_path / "logs"),
+        openai_api_key="sk-fake",
+        llm_cache=False,
+        rpm_limit=1_000_000,  # the fake client has no quota
+        tpm_limit=1_000_000_000,
+        output_format=output_format,
+    )
+    checkset = make_checkset(fpath)
+    fake_llm = FakeLLMClient(latency=0.01)
+    rounds = []
+
+    def setup():
+        rounds.append(1)
+        checkset.setup(settings)
+        checkset.checks[2].operators[0]._api_client.aclient = fake_llm
+
+    benchmark.pedantic(checkset.run, setup=setup, rounds=3, iterations=1)
+
+    assert fake_llm.calls == len(rounds) * num_rows  # a single round with --benchmark-disable
+    assert os.path.exists(CheckSet._get_sink_for_check(settings, checkset.checks[2]).fpath)
+    record_throughput(benchmark, num_rows)
@@ -0,0 +1,27 @@
+"""
+Throughput of the `Clustering` operator with nltk's pure python kmeans, which is only run
+on the 1k row case, and with the numpy mini-batch spherical kmeans backend.
+"""
+
+import polars as pl
+import pytest
+
+from uptrain.framework import Settings
+from uptrain.operators import Clustering
+
+from benchmarks.data import SIZES, make_vectors, record_throughput, skip_unless_large
+
+
+@pytest.mark.parametrize("backend", ["nltk", "minibatch"])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_clustering(benchmark, num_rows, backend):
+    if backend == "nltk" and num_rows > 1_000:
+        pytest.skip("nltk's kmeans takes minutes beyond a few thousand rows")
+    skip_unless_large(num_rows, 100_000)
+
+    data = pl.DataFrame({"embedding": make_vectors(num_rows, dim=64)})
+    op = Clustering(backend=backend, n_clusters=20, col_in="embedding").setup(Settings())
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert output["cluster_index"].null_count() == 0
+    record_throughput(benchmark, num_rows)
@@ -0,0 +1,45 @@
+"""
+Overhead of running an `OperatorDAG` with each scheduler - three independent text
+operators on the same input, and one more that depends on the first.
+"""
+
+import polars as pl
+import pytest
+
+from uptrain.framework import OperatorDAG
+from uptrain.framework.scheduler import get_scheduler
+from uptrain.operators import KeywordDetector, TextLength, WordCount
+
+from benchmarks.data import SIZES, make_qa_rows, record_throughput, skip_unless_large
+
+
+def make_dag() -> OperatorDAG:
+    dag = OperatorDAG(name="bench")
+    dag.add_step("length", TextLength(col_in_text="response"))
+    dag.add_step("words", WordCount(col_in_text="response"))
+    dag.add_step("keyword", KeywordDetector(col_in_text="response", keyword="word7"))
+    dag.add_step(
+        "question_length",
+        TextLength(col_in_text="question", col_out="question_length"),
+        deps=["length"],
+    )
+    return dag
+
+
+@pytest.mark.parametrize("scheduler", ["sequential", "thread"])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_dag_run(benchmark, num_rows, scheduler):
+    skip_unless_large(num_rows, 100_000)
+
+    data = make_qa_rows(num_rows)
+    dag = make_dag()
+    node_inputs = {"length": data, "words": data, "keyword": data}
+    output_nodes = ["words", "keyword", "question_length"]
+
+    def run():
+        return dag.run(node_inputs, output_nodes, scheduler=get_scheduler(scheduler))
+
+    outputs = benchmark.pedantic(run, rounds=3, iterations=1)
+
+    assert all(len(output) == num_rows for output in outputs.values())
+    record_throughput(benchmark, num_rows)
@@ -0,0 +1,70 @@
+"""
+Throughput of the `Distribution` operator, which samples pairs within each group of 10
+rows and scores them by cosine similarity of their embeddings, or by Rouge-L of their
+text, and how it scales with the number of groups.
+"""
+
+import polars as pl
+import pytest
+
+from uptrain.framework import Settings
+from uptrain.operators import Distribution
+
+from benchmarks.data import SIZES, make_qa_rows, make_vectors, record_throughput, skip_unless_large
+
+
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_distribution_cosine(benchmark, num_rows):
+    skip_unless_large(num_rows, 100_000)
+
+    data = make_qa_rows(num_rows).with_columns(
+        pl.Series("embedding", make_vectors(num_rows, dim=64))
+    )
+    op = Distribution(
+        kind="cosine_similarity",
+        col_in_embs=["embedding"],
+        col_in_groupby=["question_idx"],
+        col_out=["similarity"],
+    ).setup(Settings())
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert len(output) > 0
+    record_throughput(benchmark, num_rows)
+
+
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_distribution_rouge(benchmark, num_rows):
+    skip_unless_large(num_rows, 1_000)
+
+    data = make_qa_rows(num_rows)
+    op = Distribution(
+        kind="rouge",
+        col_in_embs=["response"],
+        col_in_groupby=["question_idx"],
+        col_out=["rouge_f1"],
+    ).setup(Settings())
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert len(output) > 0
+    record_throughput(benchmark, num_rows)
+
+
+@pytest.mark.parametrize("kind", ["cosine_similarity", "rouge"])
+@pytest.mark.parametrize("num_groups", [100, 1_000, 10_000, 100_000])
+def bench_distribution_groups(benchmark, num_groups, kind):
+    num_rows = 10 * num_groups
+    skip_unless_large(num_rows, 100_000 if kind == "cosine_similarity" else 10_000)
+
+    data = make_qa_rows(num_rows, group_size=10).with_columns(
+        pl.Series("embedding", make_vectors(num_rows, dim=64))
+    )
+    op = Distribution(
+        kind=kind,
+        col_in_embs=["embedding" if kind == "cosine_similarity" else "response"],
+        col_in_groupby=["question_idx"],
+        col_out=["score"],
+    ).setup(Settings())
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert len(output) == 10 * num_groups
+    record_throughput(benchmark, num_groups, "groups_per_sec")
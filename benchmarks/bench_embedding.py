@@ -0,0 +1,34 @@
+"""
+Throughput of the `Embedding` operator's batched `api` encoder against a local stub
+server, with batches sent one at a time vs with a concurrency window.
+"""
+
+import polars as pl
+import pytest
+
+from uptrain.framework import Settings
+from uptrain.operators import Embedding
+
+from benchmarks.data import record_throughput
+from benchmarks.stubs import embedding_server
+
+NUM_ROWS = 4096
+
+
+@pytest.mark.parametrize("max_concurrent_batches", [1, 8])
+def bench_embedding_api(benchmark, tmp_path, max_concurrent_batches):
+    data = pl.DataFrame({"text": [f"sentence number {i}" for i in range(NUM_ROWS)]})
+    with embedding_server(latency=0.02, dim=32) as url:
+        settings = Settings(
+            logs_folder=str(tmp_path),
+            embedding_compute_method="api",
+            embedding_model_url=url,
+            embedding_cache=False,
+        )
+        op = Embedding(
+            model="MiniLM-L6-v2", batch_size=128, max_concurrent_batches=max_concurrent_batches
+        ).setup(settings)
+        output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert len(output) == NUM_ROWS
+    record_throughput(benchmark, NUM_ROWS)
@@ -0,0 +1,58 @@
+"""
+Throughput of the batched `METEORScore` operator, on synthetic generations scored against
+a small set of repeated references, where half the rows repeat an earlier pair. Needs
+the NLTK punkt and wordnet data, and is skipped without them.
+"""
+
+import os
+import random
+
+import polars as pl
+import pytest
+
+from uptrain.operators import METEORScore
+
+from benchmarks.data import record_throughput, skip_unless_large
+
+SIZES = [1_000, 10_000, 100_000]
+WORDS = (
+    "the a cat dog sat ran on under mat house home quickly slowly big small large little "
+    "car automobile walk walked walking run running runs happy glad sad answer reply "
+    "question query fast rapid begin start end finish"
+).split()
+
+
+def make_data(num_rows: int, seed: int = 0) -> pl.DataFrame:
+    rng = random.Random(seed)
+    sources = [" ".join(rng.choices(WORDS, k=30)) for _ in range(100)]
+    pairs = [
+        (" ".join(rng.choices(WORDS, k=20)), rng.choice(sources))
+        for _ in range(max(num_rows // 2, 1))
+    ]
+    rows = pairs + [rng.choice(pairs) for _ in range(num_rows - len(pairs))]
+    return pl.DataFrame(rows, schema=["text_generated", "text_source"], orient="row")
+
+
+def require_nltk_data() -> None:
+    import nltk
+
+    for resource in ["tokenizers/punkt_tab", "corpora/wordnet"]:
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            pytest.skip(f"needs the NLTK {resource} data")
+
+
+@pytest.mark.parametrize("num_workers", [1, None])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_meteor_score(benchmark, num_rows, num_workers):
+    require_nltk_data()
+    skip_unless_large(num_rows, 10_000)
+
+    data = make_data(num_rows)
+    op = METEORScore(num_workers=num_workers)
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert len(output) == num_rows
+    record_throughput(benchmark, num_rows)
+    benchmark.extra_info["num_workers"] = num_workers or os.cpu_count()
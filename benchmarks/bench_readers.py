@@ -0,0 +1,62 @@
+"""
+Read throughput of the csv, ndjson and parquet readers, loading the whole file at once
+and, for the text formats, in batches of 10k rows.
+"""
+
+import polars as pl
+import pytest
+
+from uptrain.framework import Settings
+from uptrain.operators import CsvReader, JsonReader, ParquetReader
+
+from benchmarks.data import (
+    SIZES,
+    make_qa_rows,
+    record_throughput,
+    skip_unless_large,
+    write_dataset,
+)
+
+READERS = {"csv": CsvReader, "jsonl": JsonReader, "parquet": ParquetReader}
+BATCH_SIZE = 10_000
+
+
+@pytest.fixture(scope="module")
+def datasets(tmp_path_factory):
+    """Files are written once per size and format, the first time they are needed."""
+    cache = {}
+
+    def _get(num_rows: int, fmt: str) -> str:
+        if (num_rows, fmt) not in cache:
+            dirpath = tmp_path_factory.mktemp(f"{fmt}_{num_rows}")
+            cache[(num_rows, fmt)] = write_dataset(make_qa_rows(num_rows), str(dirpath), fmt)
+        return cache[(num_rows, fmt)]
+
+    return _get
+
+
+@pytest.mark.parametrize("fmt", list(READERS))
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_reader(benchmark, datasets, num_rows, fmt):
+    skip_unless_large(num_rows, 100_000)
+
+    op = READERS[fmt](fpath=datasets(num_rows, fmt)).setup(Settings())
+    output = benchmark.pedantic(op.run, rounds=3, iterations=1)["output"]
+
+    assert len(output) == num_rows
+    record_throughput(benchmark, num_rows)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_reader_batches(benchmark, datasets, num_rows, fmt):
+    skip_unless_large(num_rows, 100_000)
+
+    fpath = datasets(num_rows, fmt)
+
+    def read_all() -> int:
+        op = READERS[fmt](fpath=fpath, batch_size=BATCH_SIZE).setup(Settings())
+        return sum(len(batch) for batch in op.iter_batches())
+
+    assert benchmark.pedantic(read_all, rounds=3, iterations=1) == num_rows
+    record_throughput(benchmark, num_rows)
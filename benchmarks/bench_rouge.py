@@ -0,0 +1,43 @@
+"""
+Throughput of the batched `RougeScore` operator, on synthetic generations scored
+against a small set of repeated references. The LCS itself is pure python, so the
+100k row case takes minutes per round and only runs with UPTRAIN_BENCH_LARGE=1.
+"""
+
+import os
+import random
+
+import polars as pl
+import pytest
+
+from uptrain.operators import RougeScore
+
+from benchmarks.data import record_throughput, skip_unless_large
+
+SIZES = [1_000, 10_000, 100_000]
+WORDS = [f"word{i}" for i in range(500)]
+
+
+def make_data(num_rows: int, seed: int = 0) -> pl.DataFrame:
+    rng = random.Random(seed)
+    sources = [" ".join(rng.choices(WORDS, k=60)) for _ in range(100)]
+    return pl.DataFrame(
+        {
+            "text_generated": [" ".join(rng.choices(WORDS, k=40)) for _ in range(num_rows)],
+            "text_source": [rng.choice(sources) for _ in range(num_rows)],
+        }
+    )
+
+
+@pytest.mark.parametrize("num_workers", [1, None])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_rouge_score(benchmark, num_rows, num_workers):
+    skip_unless_large(num_rows, 10_000)
+
+    data = make_data(num_rows)
+    op = RougeScore(score_type="f1", num_workers=num_workers)
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert len(output) == num_rows
+    record_throughput(benchmark, num_rows)
+    benchmark.extra_info["num_workers"] = num_workers or os.cpu_count()
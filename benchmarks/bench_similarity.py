@@ -0,0 +1,32 @@
+"""
+Throughput of the columnar `CosineSimilarity` operator. The 1M x 384 case needs about
+3GB of memory for its inputs, so it only runs with UPTRAIN_BENCH_LARGE=1.
+"""
+
+import numpy as np
+import polars as pl
+import pytest
+
+from uptrain.operators import CosineSimilarity
+
+from benchmarks.data import record_throughput, skip_unless_large
+
+DIM = 384
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def make_vectors(num_rows: int, seed: int) -> pl.Series:
+    rng = np.random.default_rng(seed)
+    return pl.Series(rng.standard_normal((num_rows, DIM), dtype=np.float32))
+
+
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_cosine_similarity(benchmark, num_rows):
+    skip_unless_large(num_rows, 100_000)
+
+    data = pl.DataFrame({"v1": make_vectors(num_rows, 0), "v2": make_vectors(num_rows, 1)})
+    op = CosineSimilarity(col_in_vector_1="v1", col_in_vector_2="v2")
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert output["cosine_similarity"].null_count() == 0
+    record_throughput(benchmark, num_rows)
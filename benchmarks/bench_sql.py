@@ -0,0 +1,120 @@
+"""
+Throughput of `ExecuteAndCompareSQL` on a synthetic Spider-style workload - a few small
+databases, each with a fixed set of gold queries, and predicted queries that are either
+the gold query, an equivalent rewrite or a wrong answer. Results are compared either in
+memory or by streaming fingerprints. The old per-row execution, with a fresh connection
+for every row, is only run on the 1k row case.
+"""
+
+import os
+import random
+import sqlite3
+
+import polars as pl
+import pytest
+
+from uptrain.operators import ExecuteAndCompareSQL
+from uptrain.utilities.sql_utils import execute_and_compare_sql
+
+from benchmarks.data import record_throughput, skip_unless_large
+
+SIZES = [1_000, 10_000, 100_000]
+NUM_DATABASES = 10
+COUNTRIES = ["France", "Spain", "Netherlands", "United States", "Japan"]
+
+# (gold query, equivalent rewrite, wrong query)
+QUERIES = [
+    (
+        f"SELECT name, age FROM singer WHERE country = '{country}'",
+        f"SELECT age, name FROM singer WHERE country = '{country}' ORDER BY age",
+        f"SELECT name, age FROM singer WHERE country != '{country}'",
+    )
+    for country in COUNTRIES
+] + [
+    (
+        "SELECT country, count(*) FROM singer GROUP BY country",
+        "SELECT count(*) AS n, country FROM singer GROUP BY country ORDER BY n",
+        "SELECT country, count(DISTINCT age) FROM singer GROUP BY country",
+    ),
+    (
+        "SELECT avg(age), min(age), max(age) FROM singer",
+        "SELECT avg(s.age), min(s.age), max(s.age) FROM singer AS s",
+        "SELECT avg(age), min(age), max(age) FROM singer WHERE age > 30",
+    ),
+    (
+        "SELECT s.name, c.venue FROM singer AS s JOIN concert AS c ON s.singer_id = c.singer_id WHERE c.year = 2014",
+        "SELECT s.name, c.venue FROM concert AS c JOIN singer AS s ON c.singer_id = s.singer_id WHERE c.year = 2014",
+        "SELECT s.name, c.venue FROM singer AS s JOIN concert AS c ON s.singer_id = c.singer_id WHERE c.year = 2015",
+    ),
+    (
+        "SELECT venue, count(*) FROM concert GROUP BY venue ORDER BY count(*) DESC LIMIT 3",
+        "SELECT venue, count(*) AS n FROM concert GROUP BY venue ORDER BY n DESC LIMIT 3",
+        "SELECT venue, count(*) FROM concert GROUP BY venue ORDER BY count(*) LIMIT 3",
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def databases(tmp_path_factory):
+    dirpath = tmp_path_factory.mktemp("spider")
+    rng = random.Random(0)
+    db_paths = []
+    for i in range(NUM_DATABASES):
+        db_path = str(dirpath / f"db_{i}.sqlite")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE singer (singer_id INTEGER PRIMARY KEY, name TEXT, age INTEGER, country TEXT)")
+        conn.execute("CREATE TABLE concert (concert_id INTEGER PRIMARY KEY, singer_id INTEGER, venue TEXT, year INTEGER)")
+        conn.executemany(
+            "INSERT INTO singer VALUES (?, ?, ?, ?)",
+            [(j, f"singer {j}", rng.randint(18, 70), rng.choice(COUNTRIES)) for j in range(2_000)],
+        )
+        conn.executemany(
+            "INSERT INTO concert VALUES (?, ?, ?, ?)",
+            [(j, rng.randrange(2_000), f"venue {rng.randrange(50)}", rng.randint(2010, 2020)) for j in range(5_000)],
+        )
+        conn.commit()
+        conn.close()
+        db_paths.append(db_path)
+    return db_paths
+
+
+def make_data(db_paths: list, num_rows: int, seed: int = 0) -> pl.DataFrame:
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(num_rows):
+        queries = rng.choice(QUERIES)
+        rows.append((rng.choice(queries), queries[0], rng.choice(db_paths)))
+    return pl.DataFrame(rows, schema=["response", "gt", "db"], orient="row")
+
+
+@pytest.mark.parametrize("impl", ["per_row", "batched", "streaming"])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_execute_and_compare_sql(benchmark, databases, num_rows, impl):
+    if impl == "per_row" and num_rows > 1_000:
+        pytest.skip("per-row execution is only run on the 1k row case")
+    skip_unless_large(num_rows, 10_000)
+
+    data = make_data(databases, num_rows)
+    if impl == "per_row":
+
+        def run():
+            return [
+                execute_and_compare_sql(response, gt, db)
+                for response, gt, db in data.iter_rows()
+            ]
+
+        results = benchmark.pedantic(run, rounds=3, iterations=1)
+    else:
+        op = ExecuteAndCompareSQL(
+            col_in_response_sql="response",
+            col_in_gt_sql="gt",
+            col_in_db_path="db",
+            col_out_execution_accuracy="accuracy",
+            streaming=impl == "streaming",
+        )
+        output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+        results = output["accuracy"].to_list()
+
+    assert len(results) == num_rows and any(results)
+    record_throughput(benchmark, num_rows)
+    benchmark.extra_info["num_workers"] = os.cpu_count()
@@ -0,0 +1,74 @@
+"""
+Throughput of `ParseSQL` and `ParseCreateStatements` on a synthetic Spider-style workload,
+where a few schemas and gold queries repeat across every row. Each case runs with a cold
+parse cache (every distinct statement parsed once) and a warm one (read back from a
+previous run), and the old per-row parse is run for reference on the 1k row case.
+"""
+
+import random
+
+import polars as pl
+import pytest
+
+from uptrain.framework import Settings
+from uptrain.operators import ParseCreateStatements, ParseSQL
+from uptrain.utilities.sql_utils import parse_sql_tables
+
+from benchmarks.bench_sql import QUERIES
+from benchmarks.data import record_throughput, skip_unless_large
+
+SIZES = [1_000, 10_000, 100_000]
+NUM_SCHEMAS = 20
+
+
+def make_data(num_rows: int, seed: int = 0) -> pl.DataFrame:
+    rng = random.Random(seed)
+    schemas = [
+        f"CREATE TABLE singer_{i} (singer_id INTEGER, name TEXT, country TEXT, age INTEGER); "
+        f"CREATE TABLE concert_{i} (concert_id INTEGER, singer_id INTEGER, venue TEXT, year INTEGER)"
+        for i in range(NUM_SCHEMAS)
+    ]
+    sqls = [sql for queries in QUERIES for sql in queries]
+    return pl.DataFrame(
+        {
+            "sql": [rng.choice(sqls) for _ in range(num_rows)],
+            "schema": [rng.choice(schemas) for _ in range(num_rows)],
+        }
+    )
+
+
+def parse(data: pl.DataFrame, settings: Settings) -> pl.DataFrame:
+    output = ParseSQL(
+        col_in_sql="sql", col_out_tables="sql_tables", col_out_is_valid_sql="is_valid"
+    ).setup(settings).run(data)["output"]
+    return ParseCreateStatements(
+        col_in_schema_def="schema", col_out_tables="schema_tables"
+    ).setup(settings).run(output)["output"]
+
+
+@pytest.mark.parametrize("cache", ["cold", "warm"])
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_parse_sql(benchmark, tmp_path, num_rows, cache):
+    skip_unless_large(num_rows, 10_000)
+
+    data = make_data(num_rows)
+    settings = Settings(logs_folder=str(tmp_path), sql_parse_cache=cache == "warm")
+    if cache == "warm":
+        parse(data, settings)
+    output = benchmark.pedantic(parse, args=(data, settings), rounds=3, iterations=1)
+
+    assert len(output) == num_rows
+    record_throughput(benchmark, num_rows)
+
+
+def bench_parse_sql_per_row(benchmark):
+    data = make_data(1_000)
+    output = benchmark.pedantic(
+        lambda sqls: [parse_sql_tables(sql) for sql in sqls],
+        args=(data["sql"].to_list(),),
+        rounds=3,
+        iterations=1,
+    )
+
+    assert len(output) == len(data)
+    record_throughput(benchmark, len(data))
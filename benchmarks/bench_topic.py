@@ -0,0 +1,30 @@
+"""
+Throughput of `TopicAssignmentviaCluster`, finding the nearest of 100 centroids for each
+row through the exact vector index.
+"""
+
+import polars as pl
+import pytest
+
+from uptrain.framework import Settings
+from uptrain.operators import TopicAssignmentviaCluster
+
+from benchmarks.data import SIZES, make_vectors, record_throughput, skip_unless_large
+
+NUM_CENTROIDS = 100
+
+
+@pytest.mark.parametrize("num_rows", SIZES)
+def bench_topic_assignment(benchmark, tmp_path, num_rows):
+    skip_unless_large(num_rows, 100_000)
+
+    centroids = make_vectors(NUM_CENTROIDS, dim=64, seed=1)
+    data = pl.DataFrame({"embedding": make_vectors(num_rows, dim=64)})
+    op = TopicAssignmentviaCluster(
+        cluster_centroids={"default": centroids.tolist()},
+        topics={"default": [f"topic {i}" for i in range(NUM_CENTROIDS)]},
+    ).setup(Settings(logs_folder=str(tmp_path)))
+    output = benchmark.pedantic(op.run, args=(data,), rounds=3, iterations=1)["output"]
+
+    assert output["cluster_index"].min() >= 0
+    record_throughput(benchmark, num_rows)
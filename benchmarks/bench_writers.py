@@ -0,0 +1,65 @@
+"""
+Write throughput, file size and re-read time of the ndjson, parquet and arrow ipc
+sinks, on 1M rows shaped like the output of a check.
+"""
+
+import os
+
+import numpy as np
+import polars as pl
+import pytest
+
+from uptrain.framework import Settings
+from uptrain.operators import ArrowIpcWriter, JsonWriter, ParquetWriter
+
+from benchmarks.data import record_throughput
+
+NUM_ROWS = 1_000_000
+WRITERS = {"jsonl": JsonWriter, "parquet": ParquetWriter, "arrow": ArrowIpcWriter}
+
+
+def make_check_output(num_rows: int, seed: int = 0) -> pl.DataFrame:
+    rng = np.random.default_rng(seed)
+    words = np.array(["the", "model", "response", "was", "grounded", "in", "context"])
+    return pl.DataFrame(
+        {
+            "id": np.arange(num_rows),
+            "question": [" ".join(rng.choice(words, 8)) for _ in range(num_rows)],
+            "score_factual_accuracy": rng.random(num_rows),
+            "explanation_factual_accuracy": rng.choice(words, num_rows),
+        }
+    )
+
+
+def write(fmt: str, fpath: str, data: pl.DataFrame):
+    if os.path.exists(fpath):
+        os.remove(fpath)
+    sink = WRITERS[fmt](fpath=fpath).setup(Settings())
+    sink.run(data)
+    if hasattr(sink, "close"):
+        sink.close()
+    return sink
+
+
+@pytest.fixture(scope="module")
+def check_output():
+    return make_check_output(NUM_ROWS)
+
+
+@pytest.mark.parametrize("fmt", list(WRITERS))
+def bench_write(benchmark, tmp_path, check_output, fmt):
+    fpath = str(tmp_path / f"output.{fmt}")
+    benchmark.pedantic(write, args=(fmt, fpath, check_output), rounds=3, iterations=1)
+
+    record_throughput(benchmark, NUM_ROWS)
+    benchmark.extra_info["file_mb"] = os.path.getsize(fpath) / 2**20
+
+
+@pytest.mark.parametrize("fmt", list(WRITERS))
+def bench_reread(benchmark, tmp_path, check_output, fmt):
+    fpath = str(tmp_path / f"output.{fmt}")
+    reader = write(fmt, fpath, check_output).to_reader().setup(Settings())
+    output = benchmark.pedantic(reader.run, rounds=3, iterations=1)["output"]
+
+    assert len(output) == NUM_ROWS
+    record_throughput(benchmark, NUM_ROWS)
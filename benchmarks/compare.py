@@ -0,0 +1,156 @@
+"""
+Compare a benchmark run against the stored baseline, and fail if anything got slower.
+
+    pytest benchmarks --benchmark-json=results.json
+    python -m benchmarks.compare results.json --max-regression 10
+
+Exits with status 1 if any benchmark is more than `--max-regression` percent slower
+than the baseline. Benchmarks missing from either side are listed, but don't fail the
+comparison. Pass `--update` to store the run as the new baseline instead.
+
+Timings depend on the machine, so only compare runs from the machine the baseline was
+recorded on - the baseline stores a summary of it, and a mismatch is warned about.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import typing as t
+
+BASELINE_FPATH = os.path.join(os.path.dirname(__file__), "baselines", "baseline.json")
+STATS = ["min", "mean", "median"]
+
+
+def load_results(fpath: str) -> dict[str, t.Any]:
+    """Read timings from either a pytest-benchmark json report or a stored baseline, as
+    {"machine": {...}, "benchmarks": {name: {stat: seconds}}}."""
+    with open(fpath, "r") as f:
+        data = json.load(f)
+
+    if isinstance(data.get("benchmarks"), dict):  # already a baseline
+        return data
+
+    machine = data.get("machine_info", {})
+    return {
+        "machine": {
+            "cpu": machine.get("cpu", {}).get("brand_raw"),
+            "python": machine.get("python_version"),
+        },
+        "benchmarks": {
+            bench["fullname"]: {stat: bench["stats"][stat] for stat in STATS}
+            for bench in data.get("benchmarks", [])
+        },
+    }
+
+
+def compare(
+    baseline: dict[str, t.Any],
+    current: dict[str, t.Any],
+    max_regression: float,
+    stat: str = "min",
+) -> tuple[list[dict], list[str], list[str]]:
+    """Compare the timings of the benchmarks present in both runs.
+
+    Returns:
+        A row per common benchmark with its baseline and current time, percent change and
+        whether it regressed, then the benchmarks only in the baseline, and those only in
+        the current run.
+    """
+    base_benches, curr_benches = baseline["benchmarks"], current["benchmarks"]
+    rows = []
+    for name in sorted(set(base_benches) & set(curr_benches)):
+        before, after = base_benches[name][stat], curr_benches[name][stat]
+        change = 100.0 * (after - before) / before if before > 0 else 0.0
+        rows.append(
+            {
+                "name": name,
+                "baseline": before,
+                "current": after,
+                "change": change,
+                "regressed": change > max_regression,
+            }
+        )
+    only_baseline = sorted(set(base_benches) - set(curr_benches))
+    only_current = sorted(set(curr_benches) - set(base_benches))
+    return rows, only_baseline, only_current
+
+
+def _format_table(rows: list[dict], stat: str) -> str:
+    width = max([len(row["name"]) for row in rows] + [len("benchmark")])
+    lines = [
+        f"{'benchmark':<{width}}  {'baseline ' + stat:>14}  {'current ' + stat:>14}  {'change':>8}"
+    ]
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        lines.append(
+            f"{row['name']:<{width}}  {row['baseline']:>13.4f}s  {row['current']:>13.4f}s  "
+            f"{row['change']:>+7.1f}%{flag}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare a pytest-benchmark json report against the stored baseline."
+    )
+    parser.add_argument("results", help="json report written by `pytest --benchmark-json`")
+    parser.add_argument("--baseline", default=BASELINE_FPATH, help="baseline to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=10.0,
+        help="fail if a benchmark is more than this percent slower (default: 10)",
+    )
+    parser.add_argument(
+        "--stat", choices=STATS, default="min", help="timing statistic to compare (default: min)"
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="store the results as the new baseline"
+    )
+    args = parser.parse_args(argv)
+
+    current = load_results(args.results)
+    if args.update:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Stored {len(current['benchmarks'])} benchmarks as the baseline: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, store one with --update.", file=sys.stderr)
+        return 2
+    baseline = load_results(args.baseline)
+    if baseline.get("machine", {}).get("cpu") != current["machine"].get("cpu"):
+        print(
+            "WARNING: the baseline was recorded on a different machine "
+            f"({baseline.get('machine')}), timings may not be comparable.",
+            file=sys.stderr,
+        )
+
+    rows, only_baseline, only_current = compare(
+        baseline, current, args.max_regression, stat=args.stat
+    )
+    if len(rows):
+        print(_format_table(rows, args.stat))
+    for name in only_baseline:
+        print(f"not run: {name}")
+    for name in only_current:
+        print(f"no baseline: {name}")
+
+    regressed = [row["name"] for row in rows if row["regressed"]]
+    if len(regressed):
+        print(
+            f"\n{len(regressed)} benchmark(s) more than {args.max_regression:g}% slower "
+            "than the baseline."
+        )
+        return 1
+    print(f"\nNo benchmark is more than {args.max_regression:g}% slower than the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
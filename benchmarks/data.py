@@ -0,0 +1,73 @@
+"""
+Synthetic datasets for the benchmarks, generated from a fixed seed so runs are comparable.
+
+Benchmarks are parametrized over `SIZES`. Cases above a benchmark's default limit are
+skipped unless UPTRAIN_BENCH_LARGE=1 is set, so the default run stays within minutes.
+"""
+
+from __future__ import annotations
+import os
+
+import numpy as np
+import polars as pl
+import pytest
+
+SIZES = [1_000, 100_000, 1_000_000]
+WORDS = np.array([f"word{i}" for i in range(500)])
+
+
+def skip_unless_large(num_rows: int, limit: int) -> None:
+    """Skip the current benchmark for more than `limit` rows, unless large runs are enabled."""
+    if num_rows > limit and os.environ.get("UPTRAIN_BENCH_LARGE") != "1":
+        pytest.skip(f"set UPTRAIN_BENCH_LARGE=1 to run the {num_rows} row case")
+
+
+def record_throughput(benchmark, count: int, key: str = "rows_per_sec") -> None:
+    """Record items per second in the benchmark's extra info. There are no stats to read
+    when the benchmark ran once with timing disabled (`--benchmark-disable`)."""
+    if benchmark.stats is not None:
+        benchmark.extra_info[key] = count / benchmark.stats.stats.mean
+
+
+def make_sentences(num_rows: int, num_words: int, seed: int = 0) -> list[str]:
+    rng = np.random.default_rng(seed)
+    words = rng.choice(WORDS, size=(num_rows, num_words))
+    return [" ".join(row) for row in words]
+
+
+def make_qa_rows(num_rows: int, group_size: int = 10, seed: int = 0) -> pl.DataFrame:
+    """Rows shaped like an evaluation dataset - a question, retrieved context and the
+    model's response, with `group_size` responses per question."""
+    num_questions = max(num_rows // group_size, 1)
+    questions = make_sentences(num_questions, 12, seed)
+    contexts = make_sentences(num_questions, 60, seed + 1)
+    question_idx = np.arange(num_rows) % num_questions
+    return pl.DataFrame(
+        {
+            "id": np.arange(num_rows),
+            "question_idx": question_idx,
+            "question": [questions[i] for i in question_idx],
+            "context": [contexts[i] for i in question_idx],
+            "response": make_sentences(num_rows, 30, seed + 2),
+            "model": ["gpt-3.5-turbo"] * num_rows,
+        }
+    )
+
+
+def make_vectors(num_rows: int, dim: int = 384, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((num_rows, dim), dtype=np.float32)
+
+
+def write_dataset(data: pl.DataFrame, dirpath: str, fmt: str) -> str:
+    """Write the data in the given format ("csv", "jsonl" or "parquet") and return the path."""
+    fpath = os.path.join(dirpath, f"data.{fmt}")
+    if fmt == "csv":
+        data.write_csv(fpath)
+    elif fmt == "jsonl":
+        data.write_ndjson(fpath)
+    elif fmt == "parquet":
+        data.write_parquet(fpath)
+    else:
+        raise ValueError(f"Unknown dataset format: {fmt}")
+    return fpath
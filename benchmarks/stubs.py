@@ -0,0 +1,92 @@
+"""
+Local stand-ins for the remote services used by operators, so benchmarks run offline.
+"""
+
+from __future__ import annotations
+import asyncio
+import contextlib
+import json
+import threading
+import time
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@contextlib.contextmanager
+def embedding_server(latency: float = 0.02, dim: int = 384) -> t.Iterator[str]:
+    """Serves an openai-style `/embeddings` endpoint on localhost that sleeps for `latency`
+    seconds per request, and yields its url."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like a real server
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            data = [
+                {"embedding": [float(len(text) % 7)] * dim, "index": i}
+                for i, text in enumerate(body["input"])
+            ]
+            payload = json.dumps({"data": data}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/embeddings"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class FakeLLMClient:
+    """Stands in for `openai.AsyncOpenAI` as the `aclient` of an `LLMMulticlient`. Each
+    chat completion sleeps for `latency` seconds and echoes the last message back.
+
+    Example:
+        ```
+        op = TextCompletion().setup(settings)
+        op._api_client.aclient = FakeLLMClient(latency=0.01)
+        ```
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion
+
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        content = kwargs["messages"][-1]["content"]
+        return ChatCompletion.parse_obj(
+            {
+                "id": f"fake-{self.calls}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": kwargs["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "echo: " + content},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(content) // 4,
+                    "completion_tokens": len(content) // 4 + 1,
+                    "total_tokens": 2 * (len(content) // 4) + 1,
+                },
+            }
+        )
@@ -0,0 +1,223 @@
+"""
+Test the schedulers used to run an `OperatorDAG`, using synthetic operators that sleep
+instead of doing real work, incremental `CheckSet` runs and profiling.
+"""
+
+import threading
+import time
+
+import polars as pl
+import pytest
+
+from uptrain.framework import OperatorDAG, Settings
+from uptrain.framework.scheduler import (
+    AsyncioScheduler,
+    ProcessScheduler,
+    SequentialScheduler,
+    ThreadScheduler,
+)
+from uptrain.operators import TransformOp
+
+SLEEP_SECS = 0.3
+EVENTS = []
+EVENTS_LOCK = threading.Lock()
+
+
+class SleepOp(TransformOp):
+    """Sleeps, records when it started and finished, and adds a column named after itself."""
+
+    name: str
+
+    def setup(self, settings):
+        return self
+
+    def run(self, *args):
+        start = time.perf_counter()
+        time.sleep(SLEEP_SECS)
+        with EVENTS_LOCK:
+            EVENTS.append((self.name, start, time.perf_counter()))
+        data = args[0]
+        for other in args[1:]:
+            data = data.with_columns([other[c] for c in other.columns if c not in data.columns])
+        return {"output": data.with_columns(pl.lit(1).alias(self.name))}
+
+
+def make_diamond_dag() -> OperatorDAG:
+    """source -> (three independent branches) -> sink"""
+    dag = OperatorDAG(name="diamond")
+    dag.add_step("source", SleepOp(name="source"))
+    for branch in ["branch_a", "branch_b", "branch_c"]:
+        dag.add_step(branch, SleepOp(name=branch), deps=["source"])
+    dag.add_step("sink", SleepOp(name="sink"), deps=["branch_a", "branch_b", "branch_c"])
+    return dag
+
+
+def run_timed(dag: OperatorDAG, scheduler) -> tuple[pl.DataFrame, float]:
+    EVENTS.clear()
+    start = time.perf_counter()
+    outputs = dag.run(
+        node_inputs={"source": pl.DataFrame({"x": [1, 2, 3]})},
+        output_nodes=["sink"],
+        scheduler=scheduler,
+    )
+    return outputs["sink"], time.perf_counter() - start
+
+
+@pytest.mark.parametrize(
+    "scheduler", [SequentialScheduler(), ThreadScheduler(), AsyncioScheduler()]
+)
+def test_dag_ordering_constraints(scheduler):
+    dag = make_diamond_dag()
+    output, _ = run_timed(dag, scheduler)
+    assert set(output.columns) >= {"x", "source", "branch_a", "branch_b", "branch_c", "sink"}
+
+    timings = {name: (start, end) for name, start, end in EVENTS}
+    for parent, child in dag.graph.edges:
+        assert timings[child][0] >= timings[parent][1], f"{child} started before {parent} finished"
+
+
+def test_dag_concurrent_speedup():
+    dag = make_diamond_dag()
+    _, sequential_time = run_timed(dag, SequentialScheduler())
+    _, thread_time = run_timed(dag, ThreadScheduler())
+    _, asyncio_time = run_timed(dag, AsyncioScheduler(max_workers=3))
+
+    # five nodes in three generations
+    assert sequential_time >= 5 * SLEEP_SECS
+    assert thread_time < 4 * SLEEP_SECS
+    assert asyncio_time < 4 * SLEEP_SECS
+
+
+def test_dag_process_scheduler():
+    dag = make_diamond_dag()
+    output, _ = run_timed(dag, ProcessScheduler(max_workers=3))
+    assert output["sink"].to_list() == [1, 1, 1]
+    assert output["branch_b"].to_list() == [1, 1, 1]
+
+
+def test_dag_drops_intermediate_outputs():
+    dag = make_diamond_dag()
+    dag.setup(Settings(dag_scheduler="thread"))
+    assert isinstance(dag.scheduler, ThreadScheduler)
+
+    outputs = dag.run(
+        node_inputs={"source": pl.DataFrame({"x": [1]})},
+        output_nodes=["sink", "branch_a"],
+    )
+    assert set(outputs.keys()) == {"sink", "branch_a"}
+
+
+def test_checkset_incremental_runs(tmp_path):
+    from uptrain.framework import Check, CheckSet
+    from uptrain.operators import ColumnOp, JsonReader, TextLength
+
+    calls = []
+
+    class CountingLength(ColumnOp):
+        """TextLength, recording the rows it was run on."""
+
+        col_in_text: str = "text"
+        col_out: str = "counted_length"
+
+        def setup(self, settings):
+            return self
+
+        def run(self, data):
+            calls.append(data["id"].to_list())
+            lengths = data[self.col_in_text].str.len_chars()
+            return {"output": data.with_columns(lengths.alias(self.col_out))}
+
+    def run_checkset(rows: list[dict], check: Check, **kwargs) -> pl.DataFrame:
+        fpath = tmp_path / "input.jsonl"
+        pl.DataFrame(rows).write_ndjson(fpath)
+        settings = Settings(logs_folder=str(tmp_path / "logs"), incremental_runs=True, **kwargs)
+        checkset = CheckSet(source=JsonReader(fpath=str(fpath)), checks=[check])
+        checkset.setup(settings).run()
+        sink = CheckSet._get_sink_for_check(settings, check)
+        return sink.to_reader().setup(settings).run()["output"]
+
+    rows = [{"id": i, "text": "x" * i} for i in range(10)]
+    check = Check(name="length", operators=[CountingLength(), TextLength(col_in_text="text")])
+    output = run_checkset(rows, check)
+    assert calls == [list(range(10))]
+    assert output["counted_length"].to_list() == list(range(10))
+
+    # two new rows, one changed row and one removed row
+    rows = rows[1:] + [{"id": 10, "text": "y" * 10}, {"id": 11, "text": "z"}]
+    rows[2] = {"id": 3, "text": "changed"}
+    output = run_checkset(rows, check)
+    assert calls[-1] == [3, 10, 11]
+    assert output["id"].to_list() == [row["id"] for row in rows]
+    assert output["counted_length"].to_list() == [len(row["text"]) for row in rows]
+    assert output["text_length"].to_list() == [len(row["text"]) for row in rows]
+
+    # nothing to do on an unchanged dataset, even if settings that don't affect results change
+    run_checkset(rows, check)
+    run_checkset(rows, check, llm_max_concurrency=2, dag_scheduler="thread")
+    assert len(calls) == 2
+
+    # any change to the check definition reruns it on every row
+    check = Check(name="length", operators=[CountingLength(col_out="length_v2")])
+    output = run_checkset(rows, check)
+    assert calls[-1] == [row["id"] for row in rows]
+    assert output.columns == ["id", "text", "length_v2"]
+
+    # checks that aren't rowwise are rerun from scratch, without appending to old results
+    check = Check(name="length", operators=[SleepOp(name="slow")])
+    for _ in range(3):
+        output = run_checkset(rows, check)
+    assert len(output) == len(rows)
+
+
+@pytest.mark.parametrize("scheduler", [ThreadScheduler(), ProcessScheduler(max_workers=3)])
+def test_dag_profiling(scheduler):
+    from uptrain.utilities.profiling import Profiler
+
+    profiler = Profiler()
+    dag = make_diamond_dag()
+    dag.run(
+        node_inputs={"source": pl.DataFrame({"x": [1, 2, 3]})},
+        output_nodes=["sink"],
+        scheduler=scheduler,
+        profiler=profiler,
+    )
+
+    # profiles recorded in worker processes make it back to the parent
+    profiles = {p.node: p for p in profiler.profiles}
+    assert set(profiles) == {"source", "branch_a", "branch_b", "branch_c", "sink"}
+    for profile in profiles.values():
+        assert profile.dag == "diamond" and profile.op_name == "SleepOp"
+        assert profile.wall_secs >= SLEEP_SECS
+        assert profile.rows_out == 3
+    assert profiles["source"].rows_in == 3
+    assert profiles["sink"].rows_in == 9
+    assert profiles["sink"].start_us >= profiles["branch_a"].start_us + SLEEP_SECS * 1e6
+
+
+def test_checkset_profiling(tmp_path, capsys):
+    import json
+    from uptrain.framework import Check, CheckSet
+    from uptrain.operators import JsonReader, TextLength
+
+    fpath = tmp_path / "input.jsonl"
+    pl.DataFrame({"text": ["a", "bb", "ccc"]}).write_ndjson(fpath)
+    settings = Settings(logs_folder=str(tmp_path / "logs"), profile=True, profile_summary=True)
+    check = Check(name="length", operators=[TextLength(col_in_text="text"), SleepOp(name="slow")])
+    CheckSet(source=JsonReader(fpath=str(fpath)), checks=[check]).setup(settings).run()
+
+    with open(tmp_path / "logs" / "profile.json") as f:
+        nodes = {(p["dag"], p["node"]): p for p in json.load(f)["nodes"]}
+    assert set(nodes) == {
+        ("checkset", "source"),
+        ("length", "operator_0"),
+        ("length", "operator_1"),
+        ("checkset", "sink_length"),
+    }
+    assert nodes[("checkset", "source")]["rows_out"] == 3
+    assert nodes[("length", "operator_0")]["op_name"] == "TextLength"
+    assert nodes[("length", "operator_1")]["wall_secs"] >= SLEEP_SECS
+
+    with open(tmp_path / "logs" / "profile_trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == 4 and all(e["ph"] == "X" for e in events)
+    assert "operator_1 (SleepOp)" in capsys.readouterr().out
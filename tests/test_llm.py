@@ -0,0 +1,393 @@
+"""
+Test the concurrent LLM client against a fake async client that counts its invocations,
+so no requests are sent to a real provider.
+"""
+
+import asyncio
+import time
+
+from uptrain.framework import Settings
+from uptrain.operators.language.llm import LLMMulticlient, Payload
+
+
+class FakeCompletions:
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def reply(self, prompt: str) -> str:
+        return "echo: " + prompt
+
+    async def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion
+
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        content = self.reply(kwargs["messages"][-1]["content"])
+        return ChatCompletion.parse_obj(
+            {
+                "id": f"fake-{self.calls}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": kwargs["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10},
+            }
+        )
+
+
+class FakeAsyncClient:
+    def __init__(self, delay: float = 0.0):
+        self.completions = FakeCompletions(delay=delay)
+        self.chat = self
+
+    @property
+    def calls(self) -> int:
+        return self.completions.calls
+
+
+def make_client(tmp_path, **kwargs) -> tuple[LLMMulticlient, FakeAsyncClient]:
+    settings = Settings(logs_folder=str(tmp_path), openai_api_key="sk-fake", **kwargs)
+    client = LLMMulticlient(settings=settings)
+    fake = FakeAsyncClient()
+    client.aclient = fake
+    return client, fake
+
+
+def make_payloads(texts: list[str]) -> list[Payload]:
+    return [
+        Payload(
+            data={
+                "model": "gpt-3.5-turbo",
+                "messages": [{"role": "user", "content": text}],
+                "temperature": 0.0,
+            },
+            metadata={"index": i},
+        )
+        for i, text in enumerate(texts)
+    ]
+
+
+def test_llm_response_cache(tmp_path):
+    texts = ["a", "b", "c"]
+    client, fake = make_client(tmp_path)
+    outputs = client.fetch_responses(make_payloads(texts))
+    assert fake.calls == 3
+    assert client.cache_misses == 3 and client.cache_hits == 0
+
+    # a fresh client over the same logs folder is served entirely from disk
+    client_2, fake_2 = make_client(tmp_path)
+    outputs_2 = client_2.fetch_responses(make_payloads(texts + ["d"]))
+    assert fake_2.calls == 1
+    assert client_2.cache_hits == 3 and client_2.cache_misses == 1
+    assert [p.metadata["index"] for p in outputs_2] == [0, 1, 2, 3]
+    for before, after in zip(outputs, outputs_2):
+        assert after.response.choices[0].message.content == before.response.choices[0].message.content
+
+
+def test_llm_response_cache_bypass(tmp_path):
+    client, fake = make_client(tmp_path, llm_cache=False)
+    client.fetch_responses(make_payloads(["a"]))
+    client.fetch_responses(make_payloads(["a"]))
+    assert fake.calls == 2
+    assert client.cache_hits == 0
+
+    # sampled completions are never replayed from the cache
+    client, fake = make_client(tmp_path)
+    sampled = make_payloads(["b"])
+    sampled[0].data["temperature"] = 0.7
+    client.fetch_responses(sampled)
+    client.fetch_responses(sampled)
+    assert fake.calls == 2
+    seeded = make_payloads(["b"])
+    seeded[0].data.update(temperature=0.7, seed=1)
+    client.fetch_responses(seeded)
+    client.fetch_responses(seeded)
+    assert fake.calls == 3
+
+    # and responses from another provider aren't served for the same payload
+    client.fetch_responses(make_payloads(["c"]))
+    client.aclient.base_url = "https://example.openai.azure.com/"
+    client.fetch_responses(make_payloads(["c"]))
+    assert fake.calls == 5
+
+
+def test_llm_response_cache_eviction(tmp_path):
+    client, fake = make_client(tmp_path, llm_cache_max_entries=2)
+    client.fetch_responses(make_payloads(["a", "b", "c"]))
+    assert len(client._cache) == 2
+
+    client, fake = make_client(tmp_path, llm_cache_ttl=0.0)
+    time.sleep(0.01)
+    client.fetch_responses(make_payloads(["a"]))
+    assert fake.calls == 1
+
+
+def test_llm_inflight_dedup(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    client, fake = make_client(tmp_path, llm_cache=False)
+    fake.completions.delay = 0.2
+    outputs = client.fetch_responses(make_payloads(["a", "b", "a", "a", "b"]))
+    assert fake.calls == 2
+    assert client.dedup_saved == 3
+    assert [p.metadata["index"] for p in outputs] == [0, 1, 2, 3, 4]
+    assert [p.response.choices[0].message.content for p in outputs] == [
+        "echo: a", "echo: b", "echo: a", "echo: a", "echo: b"
+    ]
+
+    # sampled duplicates, e.g. several generations per prompt, each get their own completion
+    sampled = make_payloads(["s"] * 5)
+    for payload in sampled:
+        payload.data["temperature"] = 1.0
+    outputs = client.fetch_responses(sampled)
+    assert fake.calls == 7
+    assert client.dedup_saved == 3
+    assert len({id(p.response) for p in outputs}) == 5
+
+    # concurrent batches, each on its own event loop, share the same requests
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        batches = [make_payloads(["x", "y"]), make_payloads(["y", "x"])]
+        results = list(executor.map(client.fetch_responses, batches))
+    assert fake.calls == 9
+    assert all(p.error is None for batch in results for p in batch)
+
+
+class QuotaServer:
+    """Fake chat completions endpoint that allows at most `max_concurrent` requests at
+    a time, and throttles the rest with a 429 and a retry-after header."""
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.served = 0
+        self.throttled = 0
+
+    async def handle(self, request):
+        import json
+        import httpx
+
+        if self.active >= self.max_concurrent:
+            self.throttled += 1
+            return httpx.Response(
+                429,
+                headers={"retry-after-ms": "20"},
+                json={"error": {"message": "Rate limit reached", "type": "requests"}},
+            )
+        self.active += 1
+        try:
+            await asyncio.sleep(0.02)
+        finally:
+            self.active -= 1
+        self.served += 1
+        body = json.loads(request.content)
+        return httpx.Response(
+            200,
+            json={
+                "id": f"quota-{self.served}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "ok"},
+                    }
+                ],
+                "usage": {"prompt_tokens": 12, "completion_tokens": 1, "total_tokens": 13},
+            },
+        )
+
+
+def test_llm_adaptive_rate_limit(tmp_path):
+    import httpx
+    from openai import AsyncOpenAI
+
+    server = QuotaServer(max_concurrent=4)
+    settings = Settings(
+        logs_folder=str(tmp_path), openai_api_key="sk-fake", llm_cache=False, llm_max_concurrency=16
+    )
+    client = LLMMulticlient(settings=settings)
+    client.aclient = AsyncOpenAI(
+        api_key="sk-fake",
+        base_url="http://quota.local/v1",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(server.handle)),
+        max_retries=0,
+    )
+    client._max_tries = 10
+    client._backoff_base = 0.01
+
+    outputs = client.fetch_responses(make_payloads([f"question {i}" for i in range(40)]))
+    assert all(p.error is None for p in outputs)
+    assert server.served == 40
+    # the limiter backs off towards the server's quota
+    assert server.throttled > 0
+    assert client._concurrency_limit < 16
+
+
+def test_token_counter_and_retry_after():
+    import httpx
+    from uptrain.operators.language.rate_limit import (
+        AIMDLimiter,
+        HeuristicTokenCounter,
+        get_retry_after,
+    )
+
+    messages = [{"role": "user", "content": "x" * 400}]
+    counter = HeuristicTokenCounter(chars_per_token=3.0)
+    initial = counter.count(messages)
+    for _ in range(50):
+        counter.observe(messages, prompt_tokens=110)
+    assert counter.count(messages) < initial
+    assert abs(counter.count(messages) - 110) <= 2
+
+    class FakeError(Exception):
+        def __init__(self, headers):
+            self.response = httpx.Response(429, headers=headers)
+
+    assert get_retry_after(FakeError({"retry-after": "2"})) == 2.0
+    assert get_retry_after(FakeError({"retry-after-ms": "250"})) == 0.25
+    assert get_retry_after(FakeError({"x-ratelimit-reset-tokens": "6m0s"})) == 360.0
+    assert get_retry_after(FakeError({})) is None
+
+    limiter = AIMDLimiter(max_limit=8, backoff_base=1.0, backoff_max=4.0)
+    limiter.on_throttle(epoch=0)
+    limiter.on_throttle(epoch=0)  # stale, from a request started before the decrease
+    assert limiter.limit == 4.0
+    for _ in range(8):
+        limiter.on_success()
+    assert 5.0 < limiter.limit < 6.0
+    assert 0 <= limiter.backoff_delay(10) <= 4.0
+    # throttles without a retry-after hint wait long enough for a per-minute quota to reset
+    limiter = AIMDLimiter(max_limit=8)
+    no_hint = FakeError({})
+    assert sum(limiter.backoff_delay(i, no_hint, throttled=True) for i in range(3)) >= 60.0
+    assert limiter.backoff_delay(0, FakeError({"retry-after": "2"}), throttled=True) <= 2.5
+
+
+def test_text_completion_resumes_from_checkpoint(tmp_path):
+    import os
+    import polars as pl
+    from uptrain.operators import TextCompletion
+
+    class FlakyCompletions(FakeCompletions):
+        """Fails every prompt containing `fail` until it is fixed."""
+
+        broken = True
+
+        async def create(self, **kwargs):
+            if self.broken and "fail" in kwargs["messages"][-1]["content"]:
+                self.calls += 1
+                raise ValueError("simulated crash")
+            return await super().create(**kwargs)
+
+    settings = Settings(logs_folder=str(tmp_path), openai_api_key="sk-fake", llm_cache=False)
+    prompts = [f"prompt {i}" if i % 4 else f"fail {i}" for i in range(20)]
+    data = pl.DataFrame({"prompt": prompts, "model": ["gpt-3.5-turbo"] * 20})
+
+    op = TextCompletion(temperature=0.0).setup(settings)
+    flaky = FlakyCompletions()
+    op._api_client.aclient.chat.completions = flaky
+    result = op.run(data)
+    assert result["extra"]["metrics"]["rows_failed"] == 5
+    assert result["output"]["generated"].null_count() == 5
+    assert os.path.exists(op._checkpoint_fpath)
+
+    # an operator writing another column, or run on other data, doesn't share the checkpoint
+    op_other = TextCompletion(temperature=0.0, col_out_completion="other").setup(settings)
+    op_other._api_client.aclient.chat.completions = FlakyCompletions()
+    assert op_other.run(data)["extra"]["metrics"]["rows_resumed"] == 0
+    assert op_other._checkpoint_fpath != op._checkpoint_fpath
+    assert op.run(data.head(10))["extra"]["metrics"]["rows_resumed"] == 0
+
+    # a fresh operator only re-issues the rows that did not complete
+    op_2 = TextCompletion(temperature=0.0).setup(settings)
+    fixed = FlakyCompletions()
+    fixed.broken = False
+    op_2._api_client.aclient.chat.completions = fixed
+    result_2 = op_2.run(data)
+    assert fixed.calls == 5
+    assert result_2["extra"]["metrics"]["rows_resumed"] == 15
+    assert result_2["output"]["generated"].to_list() == ["echo: " + p for p in prompts]
+    assert not os.path.exists(op_2._checkpoint_fpath)
+
+    # nothing is written with checkpointing disabled, even if a path is given
+    fpath = str(tmp_path / "disabled.jsonl")
+    op_3 = TextCompletion(temperature=0.0, checkpoint=False, checkpoint_fpath=fpath).setup(settings)
+    op_3._api_client.aclient.chat.completions = FlakyCompletions()
+    assert op_3.run(data)["extra"]["metrics"]["rows_failed"] == 5
+    assert not os.path.exists(fpath)
+
+
+def test_llm_usage_is_profiled(tmp_path):
+    from uptrain.utilities.profiling import profile_node
+
+    client, fake = make_client(tmp_path)
+    with profile_node("dag", "node", client) as profile:
+        client.fetch_responses(make_payloads(["a", "b", "c"]))
+    assert profile.llm_prompt_tokens == 15 and profile.llm_completion_tokens == 15
+
+    # responses served from the cache cost no tokens
+    with profile_node("dag", "node", client) as profile:
+        client.fetch_responses(make_payloads(["a", "b", "c"]))
+    assert profile.llm_prompt_tokens == 0
+
+
+def test_model_grade_score_batches_choice_extraction(tmp_path):
+    import polars as pl
+    from uptrain.operators import ModelGradeScore
+
+    # completion of the grading prompt for each response, and the LLM's answer when asked
+    # to extract the score from a completion
+    completions = {
+        "good": "The response answers the question.\n0.5\n0.5",
+        "vague": "The response is partly relevant, so the answer is B",
+        "rambling": "I am not sure what the score should be",
+    }
+    extractions = {completions["vague"]: "0.5", completions["rambling"]: "not a number"}
+
+    class GradingCompletions(FakeCompletions):
+        def reply(self, prompt: str) -> str:
+            if prompt.strip().startswith("Extract the score"):
+                text = prompt.split("Text: ")[1].split("\n")[0]
+                return extractions[text]
+            return completions[prompt.split("Response: ")[1].split(" ")[0]]
+
+    settings = Settings(logs_folder=str(tmp_path), openai_api_key="sk-fake", llm_cache=False)
+    op = ModelGradeScore(
+        grading_prompt_template="Question: {question}\nResponse: {response} ",
+        eval_type="cot_classify",
+        choice_strings=["A", "B", "C"],
+        choice_scores={"A": 1.0, "B": 0.5, "C": 0.0},
+        context_vars={"question": "question", "response": "response"},
+    ).setup(settings)
+    fake = GradingCompletions()
+    op._api_client.aclient.chat.completions = fake
+
+    rounds = []
+    fetch_responses = op._api_client.fetch_responses
+    op._api_client.fetch_responses = lambda payloads: rounds.append(len(payloads)) or fetch_responses(payloads)
+
+    responses = ["good", "vague", "rambling", "vague", "good", "vague"]
+    data = pl.DataFrame({"question": [f"question {i}" for i in range(6)], "response": responses})
+    result = op.run(data)
+    assert result["output"]["model_grade_score"].to_list() == [0.5, 0.5, 0.0, 0.5, 0.5, 0.5]
+    # the unparsed completions are sent to the LLM in a single round, once per distinct text
+    assert rounds == [6, 2]
+    assert fake.calls == 6 + 2
+    assert result["extra"]["metrics"]["rows_unparsed"] == 4
+    assert result["extra"]["metrics"]["parse_failure_rate"] == round(4 / 6, 4)
+    assert result["extra"]["metrics"]["llm_extraction_cache_hits"] == 0
+
+    # extracted choices are reused, so a second run makes no extraction requests
+    result_2 = op.run(data)
+    assert result_2["output"]["model_grade_score"].equals(result["output"]["model_grade_score"])
+    assert rounds == [6, 2, 6]
+    assert result_2["extra"]["metrics"]["llm_extraction_cache_hits"] == 2
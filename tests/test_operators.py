@@ -50,6 +50,122 @@ def test_embedding():
     print(embeddings)
 
 
+# uptrain.operators.language.embedding
+def test_embedding_cache(tmp_path):
+    import numpy as np
+    import polars as pl
+    from uptrain.operators import Embedding
+
+    class FakeEncoder:
+        """Deterministic encoder, that records every text it was asked to encode."""
+
+        def __init__(self):
+            self.seen = []
+
+        def encode(self, texts):
+            self.seen.extend(texts)
+            return np.array([[len(x), x.count("a"), 1.0] for x in texts], dtype=np.float32)
+
+    def make_op(encoder):
+        settings = Settings(logs_folder=str(tmp_path), embedding_compute_method="api")
+        op = Embedding(model="MiniLM-L6-v2", col_in_text="text").setup(settings)
+        op._compute_method = "local"
+        op._model_obj = encoder
+        return op
+
+    df = pl.DataFrame({"text": ["banana", "apple", "banana", "kiwi", "apple"]})
+    encoder = FakeEncoder()
+    output = make_op(encoder).run(df)["output"]
+    assert encoder.seen == ["banana", "apple", "kiwi"]
+    assert output["embedding"].to_list()[2] == [6.0, 3.0, 1.0]
+    assert output["embedding"].to_list()[4] == [5.0, 1.0, 1.0]
+
+    # a fresh operator reads the stored embeddings back, and only encodes new texts
+    encoder_2 = FakeEncoder()
+    df_2 = pl.DataFrame({"text": ["kiwi", "papaya", "banana"]})
+    output_2 = make_op(encoder_2).run(df_2)["output"]
+    assert encoder_2.seen == ["papaya"]
+    assert output_2["embedding"].to_list() == [[4.0, 0.0, 1.0], [6.0, 3.0, 1.0], [6.0, 3.0, 1.0]]
+
+    # two stores open on the same directory see each other's rows
+    from uptrain.utilities.cache import EmbeddingStore
+
+    store_a = EmbeddingStore(str(tmp_path / "shared"))
+    store_b = EmbeddingStore(str(tmp_path / "shared"))
+    store_a.add_many(["k1", "k2", "k3"], np.array([[1, 1], [2, 2], [3, 3]]))
+    store_b.add_many(["k4", "k1"], np.array([[4, 4], [9, 9]]))
+    assert store_b.get_many(["k4"])["k4"].tolist() == [4.0, 4.0]
+    assert store_a.get_many(["k4"])["k4"].tolist() == [4.0, 4.0]
+    assert store_b.get_many(["k1"])["k1"].tolist() == [1.0, 1.0]
+    assert len(store_a) == len(store_b) == 4
+
+
+# uptrain.operators.language.embedding
+def test_embedding_api_batching(tmp_path):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import polars as pl
+    from uptrain.operators import Embedding
+
+    requests_seen = []
+    flaky_failures = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        """Embeds each text as [len(text), index]. Fails any batch with a poisoned text, and
+        the first request for a batch with a flaky text."""
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            requests_seen.append(len(body["input"]))
+            if any("poison" in text for text in body["input"]):
+                self.send_response(400)
+                self.end_headers()
+                return
+            if any("flaky" in text for text in body["input"]) and not flaky_failures:
+                flaky_failures.append(1)
+                self.send_response(503)
+                self.end_headers()
+                return
+            data = [{"embedding": [float(len(text)), float(i)]} for i, text in enumerate(body["input"])]
+            payload = json.dumps({"data": data}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        settings = Settings(
+            logs_folder=str(tmp_path),
+            embedding_compute_method="api",
+            embedding_model_url=f"http://127.0.0.1:{server.server_port}/embed",
+            embedding_cache=False,
+        )
+        texts = ["x" * (i + 1) for i in range(40)]
+        texts[13] = "poison"
+        texts[30] = "x" * 26 + "flaky"
+        op = Embedding(model="MiniLM-L6-v2", batch_size=8, max_retries=2).setup(settings)
+        output = op.run(pl.DataFrame({"text": texts}))["output"]
+    finally:
+        server.shutdown()
+
+    lengths = [emb[0] for emb in output["embedding"].to_list()]
+    # results come back in row order, and the poisoned row reuses the previous row's embedding
+    assert lengths[:13] == [float(i + 1) for i in range(13)]
+    assert lengths[13] == lengths[12]
+    assert lengths[14:] == [float(i + 1) for i in range(14, 40)]
+    # the batch that failed with a 503 was retried whole, and only the one that kept failing was
+    # split - 5 full batches and the retry, then 4 + 4, 2 + 2, 1 + 1. A 400 isn't transient, so
+    # the parts with the poisoned text aren't retried
+    assert sorted(requests_seen, reverse=True)[:6] == [8] * 6
+    assert len(requests_seen) == 6 + 2 + 2 + 2
+
+
 # uptrain.operators.embs
 def test_embs_cosine_distribution():
     import polars as pl
@@ -101,6 +217,61 @@ def test_embs_rouge_score():
     print(output)
 
 
+# uptrain.operators.embs
+def test_embs_distribution_parity():
+    import numpy as np
+    import polars as pl
+    from rouge_score import rouge_scorer
+    from uptrain.operators import Distribution
+    from uptrain.operators.embs import sample_pairs_in_groups
+
+    rng = np.random.default_rng(0)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon"]
+    group_ids = [3, 1, 3, 2, 1, 3, 0, 1, 3, 2]  # group 0 has a single row
+    data = pl.DataFrame(
+        {
+            "group": group_ids,
+            "embedding": rng.standard_normal((len(group_ids), 8)).tolist(),
+            "text": [" ".join(rng.choice(words, 6)) for _ in group_ids],
+        }
+    )
+    op = Distribution(
+        kind="cosine_similarity",
+        col_in_embs=["embedding"],
+        col_in_groupby=["group"],
+        col_out=["similarity"],
+        num_pairs_per_group=5,
+        seed=42,
+    )
+    output = op.setup(SETTINGS).run(data)["output"]
+    rouge_output = (
+        op.copy(update={"kind": "rouge", "col_in_embs": ["text"], "col_out": ["rouge"]})
+        .setup(SETTINGS)
+        .run(data)["output"]
+    )
+
+    # score the same pairs one by one
+    groups = list(dict.fromkeys(group_ids))
+    rows = [[i for i, g in enumerate(group_ids) if g == group] for group in groups]
+    rows_1, rows_2 = sample_pairs_in_groups(
+        np.array([len(r) for r in rows]), np.concatenate(rows), 5, np.random.default_rng(42)
+    )
+    vectors = np.array(data["embedding"].to_list())
+    scorer = rouge_scorer.RougeScorer(["rougeL"])
+    expected_similarity, expected_rouge = [], []
+    for i1, i2 in zip(rows_1, rows_2):
+        v1, v2 = vectors[i1], vectors[i2]
+        expected_similarity.append(np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2)))
+        score = scorer.score(data["text"][int(i1)], data["text"][int(i2)])["rougeL"][2]
+        expected_rouge.append(int(score * 100))
+
+    assert output["group"].to_list() == [g for g in groups for _ in range(5)]
+    assert np.allclose(output["similarity"].to_numpy(), expected_similarity, atol=1e-6)
+    assert rouge_output["rouge"].to_list() == expected_rouge
+    # pairs are of distinct rows, unless the group has only one
+    assert all((i1 != i2) or group_ids[i1] == 0 for i1, i2 in zip(rows_1, rows_2))
+
+
 # uptrain.operators.embs
 def test_embs_umap_operator():
     import polars as pl
@@ -122,6 +293,115 @@ def test_embs_umap_operator():
     print(output)
 
 
+# uptrain.operators.clustering
+def test_clustering_minibatch():
+    import numpy as np
+    import polars as pl
+    from uptrain.operators import Clustering
+
+    # three well separated directions, with a different scale for each row
+    rng = np.random.default_rng(0)
+    directions = np.eye(16)[:3]
+    labels = np.repeat([0, 1, 2], 300)
+    rng.shuffle(labels)
+    embeddings = directions[labels] + 0.05 * rng.standard_normal((900, 16))
+    embeddings *= rng.uniform(0.5, 2.0, size=(900, 1))
+    data = pl.DataFrame({"id": np.arange(900), "embedding": embeddings.tolist()})
+
+    def make_op():
+        return Clustering(
+            backend="minibatch", n_clusters=3, col_in="embedding", batch_size=128
+        ).setup(SETTINGS)
+
+    op = make_op()
+    output = op.run(data)["output"]
+    assigned = output["cluster_index"].to_numpy()
+    # each true cluster maps to a single cluster index
+    assert all(len(set(assigned[labels == l])) == 1 for l in range(3))
+    assert len(set(assigned)) == 3
+    assert output["cluster_index"].to_list() == make_op().run(data)["output"]["cluster_index"].to_list()
+
+    # the centroids are the mean embedding of each cluster, and distances are from them
+    centroids = np.array(op.cluster_centroids["default"])
+    assert np.allclose(centroids[assigned[0]], embeddings[assigned == assigned[0]].mean(axis=0), atol=1e-5)
+    assert np.allclose(
+        output["cluster_index_distance"].to_numpy(),
+        np.linalg.norm(embeddings - centroids[assigned], axis=1),
+        atol=1e-4,
+    )
+
+    # streaming the data in batches finds the same clusters
+    streamed = make_op()
+    for start in range(0, 900, 200):
+        streamed.partial_fit(data.slice(start, 200))
+    streamed_assigned = streamed.run(data)["output"]["cluster_index"].to_numpy()
+    assert len(set(zip(assigned, streamed_assigned))) == 3
+
+
+# uptrain.operators.language.topic
+def test_topic_assignment_via_cluster(tmp_path):
+    import numpy as np
+    import polars as pl
+    from uptrain.operators import TopicAssignmentviaCluster
+
+    rng = np.random.default_rng(0)
+    centroids = rng.standard_normal((20, 8))
+    embeddings = rng.standard_normal((500, 8))
+    data = pl.DataFrame(
+        {
+            "org": rng.choice(["a", "b"], size=500).tolist(),
+            "embedding": embeddings.tolist(),
+        }
+    )
+    settings = Settings(logs_folder=str(tmp_path))
+
+    def make_op():
+        return TopicAssignmentviaCluster(
+            cluster_centroids={str({"org": "a"}): centroids.tolist()},
+            topics={str({"org": "a"}): [f"topic {i}" for i in range(20)]},
+            col_aggs=["org"],
+        ).setup(settings)
+
+    output = make_op().run(data)["output"].sort("org")
+    in_a = (output["org"] == "a").to_numpy()
+    subset = np.array(output["embedding"].to_list())[in_a]
+    dists = np.linalg.norm(subset[:, None, :] - centroids[None, :, :], axis=2)
+    assert output["cluster_index"].to_list()[: in_a.sum()] == dists.argmin(axis=1).tolist()
+    assert np.allclose(output["cluster_index_distance"].to_numpy()[in_a], dists.min(axis=1))
+    assert output["topic"][0] == f"topic {dists.argmin(axis=1)[0]}"
+    # rows of groups without centroids aren't assigned a topic
+    assert set(output.filter(pl.col("org") == "b")["topic"]) == {"Not Defined"}
+    assert set(output.filter(pl.col("org") == "b")["cluster_index"]) == {-1}
+
+    # the index is built once, and loaded from the cache folder on later runs
+    [index_fpath] = (tmp_path / ".uptrain_cache" / "vector_index").glob("*/vectors.npy")
+    mtime = index_fpath.stat().st_mtime_ns
+    assert make_op().run(data)["output"].sort("org").equals(output)
+    assert index_fpath.stat().st_mtime_ns == mtime
+
+
+def test_vector_index_search(tmp_path):
+    import importlib.util
+    import numpy as np
+    from uptrain.utilities.vector_index import get_vector_index, load_vector_index
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 16))
+    queries = rng.standard_normal((50, 16))
+    dists = np.linalg.norm(queries[:, None, :] - vectors[None, :, :], axis=2)
+    expected = np.argsort(dists, axis=1)[:, :5]
+
+    for kind in ["exact", "hnswlib", "faiss"]:
+        if kind != "exact" and importlib.util.find_spec(kind) is None:
+            continue
+        index = get_vector_index(kind).build(vectors)
+        index.save(str(tmp_path / kind))
+        for idx in [index, load_vector_index(str(tmp_path / kind))]:
+            labels, distances = idx.search(queries, k=5)
+            assert (labels == expected).mean() > (0.99 if kind == "exact" else 0.9)
+            assert np.allclose(distances, np.take_along_axis(dists, labels, axis=1), atol=1e-3)
+
+
 # uptrain.operators.similarity
 def test_cosine_similarity_operator():
     import polars as pl
@@ -149,6 +429,43 @@ def test_cosine_similarity_operator():
     print(similarity_scores)
 
 
+# uptrain.operators.similarity
+def test_cosine_similarity_parity():
+    import polars as pl
+    import numpy as np
+    from uptrain.operators import CosineSimilarity
+
+    rng = np.random.default_rng(0)
+    vectors_1 = [rng.normal(size=16) for _ in range(500)]
+    vectors_2 = [rng.normal(size=16) for _ in range(500)]
+    vectors_1[3] = None
+    vectors_2[7] = None
+    vectors_1[11] = np.zeros(16)
+
+    def reference(v1, v2):
+        if v1 is None or v2 is None:
+            return None
+        denom = np.linalg.norm(v1) * np.linalg.norm(v2)
+        return float(np.dot(v1, v2) / denom) if denom > 0 else 0.0
+
+    df = pl.DataFrame(
+        {
+            "vector1": [v.tolist() if v is not None else None for v in vectors_1],
+            "vector2": [v.tolist() if v is not None else None for v in vectors_2],
+        }
+    )
+    # a tiny memory cap, to run over many chunks
+    op = CosineSimilarity(col_in_vector_1="vector1", col_in_vector_2="vector2", max_memory_mb=0.01)
+    scores = op.run(df)["output"]["cosine_similarity"].to_list()
+
+    expected = [reference(v1, v2) for v1, v2 in zip(vectors_1, vectors_2)]
+    assert scores[3] is None and scores[7] is None
+    assert scores[11] == 0.0
+    for score, ref in zip(scores, expected):
+        if ref is not None:
+            assert abs(score - ref) < 1e-5
+
+
 # uptrain.operators.metrics
 def test_accuracy_operator():
     from uptrain.operators import Accuracy
@@ -255,6 +572,36 @@ def test_rouge_operator():
     print(scores)
 
 
+def test_rouge_parity():
+    import random
+    import polars as pl
+    from rouge_score import rouge_scorer
+    from uptrain.operators import RougeScore
+
+    rng = random.Random(0)
+    words = ["the", "cat", "sat", "on", "a", "mat", "dog", "ran", "home", "quickly"]
+    sources = [" ".join(rng.choices(words, k=12)) for _ in range(5)]
+    generated = [" ".join(rng.choices(words, k=rng.randint(1, 15))) for _ in range(40)]
+    df = pl.DataFrame(
+        {
+            "text_generated": generated + [None, "text"],
+            "text_source": [rng.choice(sources) for _ in range(40)] + ["text", None],
+        }
+    )
+
+    scorer = rouge_scorer.RougeScorer(["rougeL"])
+    for index, score_type in enumerate(["precision", "recall", "f1"]):
+        expected = [
+            int(scorer.score(source, gen)["rougeL"][index] * 100)
+            if source is not None and gen is not None
+            else 0
+            for gen, source in zip(df["text_generated"], df["text_source"])
+        ]
+        # a tiny chunk size so the rows are spread over multiple chunks
+        op = RougeScore(score_type=score_type, chunk_size=7)
+        assert op.run(df)["output"]["rouge_score"].to_list() == expected
+
+
 # uptrain.operators.language.bleu
 def test_bleu_operator():
     import polars as pl
@@ -284,6 +631,61 @@ def test_bleu_operator():
     print(scores)
 
 
+# uptrain.operators.language.bleu
+def test_bleu_parity():
+    import random
+    import polars as pl
+    import pytest
+    from uptrain.operators import BLEUScore
+
+    bleu_score = pytest.importorskip("torchmetrics.functional.text").bleu_score
+
+    rng = random.Random(0)
+    words = ["the", "cat", "sat", "on", "a", "mat", "dog", "ran", "home", "quickly"]
+    sources = [" ".join(rng.choices(words, k=rng.randint(3, 15))) for _ in range(5)]
+    generated = [" ".join(rng.choices(words, k=rng.randint(0, 15))) for _ in range(200)]
+    df = pl.DataFrame(
+        {
+            "text_generated": generated + [None, "text"],
+            "text_source": [rng.choice(sources) for _ in range(200)] + ["text", None],
+        }
+    )
+
+    expected = [
+        int(bleu_score(gen, [source], n_gram=1).item() * 100)
+        if source is not None and gen is not None
+        else 0
+        for gen, source in zip(df["text_generated"], df["text_source"])
+    ]
+    # a tiny chunk size so the pairs are spread over multiple chunks
+    assert BLEUScore(chunk_size=7).run(df)["output"]["bleu_score"].to_list() == expected
+
+
+# uptrain.operators.language.bleu
+def test_bleu_ngram_orders():
+    import random
+    import numpy as np
+    from nltk.translate.bleu_score import sentence_bleu
+    from uptrain.operators.language.bleu import bleu_scores
+
+    rng = random.Random(0)
+    words = ["the", "cat", "sat", "on", "a", "mat", "dog", "ran", "home", "quickly"]
+    sources = [" ".join(rng.choices(words, k=rng.randint(3, 15))) for _ in range(5)]
+    generated = [" ".join(rng.choices(words, k=rng.randint(1, 15))) for _ in range(200)]
+    targets = [rng.choice(sources) for _ in range(200)]
+
+    for n_gram in [1, 2, 4]:
+        expected = [
+            sentence_bleu([source.split()], gen.split(), weights=[1 / n_gram] * n_gram)
+            for gen, source in zip(generated, targets)
+        ]
+        assert np.allclose(bleu_scores(generated, targets, n_gram=n_gram), expected, atol=1e-6)
+
+    # smoothing adds one to the matches and counts of the higher orders
+    assert np.isclose(bleu_scores(["the cat sat"], ["the cat ran"], n_gram=2)[0], np.sqrt(2 / 3 * 1 / 2))
+    assert np.isclose(bleu_scores(["the cat sat"], ["the cat ran"], n_gram=2, smooth=True)[0], 2 / 3)
+
+
 # uptrain.operators.language.meteor
 def test_meteor_operator():
     import polars as pl
@@ -313,6 +715,49 @@ def test_meteor_operator():
     print(scores)
 
 
+# uptrain.operators.language.meteor
+def test_meteor_parity(monkeypatch):
+    import random
+    import nltk
+    import polars as pl
+    import pytest
+    from uptrain.operators import METEORScore
+    from uptrain.operators.language import meteor
+
+    # the reference scores need the punkt tokenizer and wordnet data downloaded
+    try:
+        nltk.word_tokenize("the cat")
+        nltk.corpus.wordnet.ensure_loaded()
+    except LookupError:
+        pytest.skip("nltk punkt and wordnet data not downloaded")
+
+    rng = random.Random(0)
+    words = ["the", "cat", "sat", "on", "a", "mat", "dog", "ran", "home", "quickly", "cats", "running"]
+    sources = [" ".join(rng.choices(words, k=12)) for _ in range(5)]
+    generated = [" ".join(rng.choices(words, k=rng.randint(1, 15))) for _ in range(20)]
+    # repeated pairs, and rows with a missing text
+    df = pl.DataFrame(
+        {
+            "text_generated": [rng.choice(generated) for _ in range(60)] + [None, "text"],
+            "text_source": [rng.choice(sources) for _ in range(60)] + ["text", None],
+        }
+    )
+
+    expected = [
+        int(nltk.translate.meteor(references=[nltk.word_tokenize(source)], hypothesis=nltk.word_tokenize(gen)) * 100)
+        if source is not None and gen is not None
+        else 0
+        for gen, source in zip(df["text_generated"], df["text_source"])
+    ]
+    # a tiny chunk size so the pairs are spread over multiple chunks
+    assert METEORScore(chunk_size=7).run(df)["output"]["METEOR_score"].to_list() == expected
+
+    # and the same scores from a process pool
+    monkeypatch.setattr(meteor, "METEOR_POOL_MIN_PAIRS", 0)
+    op = METEORScore(chunk_size=7, num_workers=2)
+    assert op.run(df)["output"]["METEOR_score"].to_list() == expected
+
+
 # uptrain.operators.language.text
 def test_docs_link_version_operator():
     import polars as pl
@@ -391,3 +836,360 @@ def test_text_comparison_operator():
 
     # Print the comparison results
     print(comparison)
+
+
+# uptrain.operators.code.sql
+def test_execute_and_compare_sql(tmp_path, monkeypatch):
+    import sqlite3
+    import polars as pl
+    import pytest
+    from uptrain.operators import ExecuteAndCompareSQL
+    from uptrain.utilities import sql_utils
+
+    db_paths = []
+    for i in range(2):
+        db_path = str(tmp_path / f"db_{i}.sqlite")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE singer (name TEXT, age INTEGER, country TEXT)")
+        conn.executemany(
+            "INSERT INTO singer VALUES (?, ?, ?)",
+            [(f"singer {j}", 20 + (j * 7 + i) % 30, ["France", "Spain"][j % 2]) for j in range(50)],
+        )
+        conn.commit()
+        conn.close()
+        db_paths.append(db_path)
+
+    gt = "SELECT name, age FROM singer WHERE country = 'France'"
+    cases = [
+        (gt, True),
+        ("SELECT age, name FROM singer WHERE country = 'France' ORDER BY age", True),
+        ("SELECT name, age FROM singer WHERE country = 'Spain'", False),
+        ("SELECT name, age FROM singers", False),  # no such table
+        ("SELEC name", False),  # syntax error
+        (None, False),
+    ]
+    data = pl.DataFrame(
+        {
+            "response": [sql for sql, _ in cases] * 4,
+            "gt": [gt] * len(cases) * 4,
+            "db": [path for path in db_paths for _ in range(len(cases) * 2)],
+        }
+    )
+    expected = [
+        sql_utils.execute_and_compare_sql(response, gt, db) if response is not None else False
+        for response, gt, db in zip(data["response"], data["gt"], data["db"])
+    ]
+    assert expected == [result for _, result in cases] * 4
+
+    def run(**kwargs):
+        op = ExecuteAndCompareSQL(
+            col_in_response_sql="response",
+            col_in_gt_sql="gt",
+            col_in_db_path="db",
+            col_out_execution_accuracy="accuracy",
+            **kwargs,
+        ).setup(SETTINGS)
+        return op.run(data)["output"]["accuracy"].to_list()
+
+    assert run(chunk_size=2) == expected
+    assert run(chunk_size=2, streaming=True) == expected
+    # the databases aren't kept open after a batch
+    assert not sql_utils._local.snapshots
+
+    # databases above the size threshold are queried from the file, still read-only
+    monkeypatch.setattr(sql_utils, "SNAPSHOT_MAX_DB_BYTES", 0)
+    assert run(chunk_size=2) == expected
+    conn = sql_utils.get_snapshot(db_paths[0])
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM singer")
+    sql_utils.clear_snapshots()
+
+    # in-memory copies are evicted beyond the byte budget
+    db_size = os.path.getsize(db_paths[0])
+    monkeypatch.setattr(sql_utils, "SNAPSHOT_MAX_DB_BYTES", db_size)
+    monkeypatch.setattr(sql_utils, "MAX_SNAPSHOT_BYTES", db_size)
+    sql_utils.get_snapshot(db_paths[0])
+    sql_utils.get_snapshot(db_paths[1])
+    assert len(sql_utils._local.snapshots) == 1 and sql_utils._local.snapshot_bytes == db_size
+    sql_utils.clear_snapshots()
+
+    # and the same results from a process pool
+    monkeypatch.setattr(sql_utils, "SQL_POOL_MIN_PAIRS", 0)
+    assert run(chunk_size=2, num_workers=2) == expected
+
+    # queries can't modify the database
+    data = pl.DataFrame({"response": ["DELETE FROM singer", gt], "gt": [gt, gt], "db": db_paths[:1] * 2})
+    assert run() == [False, True]
+    assert sqlite3.connect(db_paths[0]).execute("SELECT count(*) FROM singer").fetchone() == (50,)
+
+    # queries past the time or row limits fail
+    slow = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT max(x) FROM c"
+    data = pl.DataFrame({"response": [slow, gt], "gt": [gt, gt], "db": db_paths[:1] * 2})
+    assert run(query_timeout=0.2) == [False, True]
+    assert run(query_timeout=0.2, max_rows=10) == [False, False]
+    assert run(query_timeout=0.2, max_rows=25) == [False, True]
+
+
+# uptrain.utilities.sql_utils
+def test_fingerprint_compare_sql():
+    import sqlite3
+    import time
+    from uptrain.utilities.sql_utils import compare_results, fingerprint_compare_sql, run_query
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (a INTEGER, b TEXT, c REAL)")
+    conn.executemany(
+        "INSERT INTO t VALUES (?, ?, ?)", [(i % 7, f"b{i % 5}", i / 4) for i in range(3_000)]
+    )
+
+    queries = [
+        "SELECT a, b FROM t",
+        "SELECT b, a FROM t",
+        "SELECT a, b FROM t ORDER BY c DESC",
+        "SELECT b, a FROM t ORDER BY c",
+        "SELECT a, b FROM t WHERE c < 700",
+        "SELECT DISTINCT a, b FROM t",
+        "SELECT a, b FROM t UNION ALL SELECT a, b FROM t WHERE a = 0",
+        "SELECT a, b, c FROM t",
+        "SELECT a AS b, b AS a FROM t",
+        "SELECT CAST(a AS REAL) AS a, b FROM t",
+        "SELECT a, b FROM t WHERE a < 0",
+        "SELECT a, count(*) FROM t GROUP BY a ORDER BY a",
+        "SELECT a, count(*) FROM t GROUP BY a ORDER BY a DESC",
+    ]
+    for ignore_column_order in [True, False]:
+        for ignore_row_order in [True, False]:
+            for pred in queries:
+                for gt in queries:
+                    if not ignore_row_order and "ORDER BY" not in gt:
+                        continue  # row order is only compared for sorted ground truths
+                    expected = compare_results(
+                        run_query(pred, conn), run_query(gt, conn), ignore_column_order, ignore_row_order
+                    )
+                    actual = fingerprint_compare_sql(
+                        pred, gt, conn, ignore_column_order, ignore_row_order, batch_size=128
+                    )
+                    assert actual == expected, (pred, gt, ignore_column_order, ignore_row_order)
+
+    # stops reading as soon as one result runs out, even if the other never does
+    endless = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT x FROM c"
+    start = time.monotonic()
+    assert not fingerprint_compare_sql(endless, "SELECT a FROM t LIMIT 3", conn, timeout=30)
+    assert time.monotonic() - start < 5
+
+
+# uptrain.operators.code.sql
+def test_parse_sql_cache(tmp_path, monkeypatch):
+    import json
+    import polars as pl
+    from uptrain.operators import ParseCreateStatements, ParseSQL, ValidateTables
+    from uptrain.utilities import sql_utils
+
+    schema = (
+        "CREATE TABLE singer (id INTEGER, name TEXT, age INTEGER); "
+        "CREATE TABLE concert (concert_id INTEGER, singer_id INTEGER, year INTEGER)"
+    )
+    sqls = [
+        "SELECT T1.name, T2.year FROM singer AS T1 JOIN concert AS T2 ON T1.id = T2.singer_id",
+        "SELECT count(*) FROM singer WHERE age > 30",
+        "SELECT name FROM singers",
+        "SELEC name FROM",
+        # deep enough to exceed the recursion limit, if the tree were walked recursively
+        "SELECT name FROM singer WHERE " + " OR ".join(f"age = {i}" for i in range(3_000)),
+    ]
+    data = pl.DataFrame({"sql": sqls * 3, "schema": [schema] * len(sqls) * 3})
+
+    calls = []
+    parse_sql_tables = sql_utils.parse_sql_tables
+
+    def counting_parse(sql, dialect=None):
+        calls.append(sql)
+        return parse_sql_tables(sql, dialect=dialect)
+
+    monkeypatch.setattr("uptrain.operators.code.sql.parse_sql_tables", counting_parse)
+
+    def run(data):
+        settings = Settings(logs_folder=str(tmp_path))
+        output = ParseSQL(
+            col_in_sql="sql", col_out_tables="sql_tables", col_out_is_valid_sql="is_valid"
+        ).setup(settings).run(data)["output"]
+        output = ParseCreateStatements(
+            col_in_schema_def="schema", col_out_tables="schema_tables"
+        ).setup(settings).run(output)["output"]
+        return ValidateTables(
+            col_in_response_tables="sql_tables",
+            col_in_schema_tables="schema_tables",
+            col_out_is_tables_valid="is_tables_valid",
+            col_out_is_cols_valid="is_cols_valid",
+        ).setup(settings).run(output)["output"]
+
+    output = run(data)
+    assert calls == sqls  # each distinct statement is parsed once
+    assert [json.loads(x) for x in output["sql_tables"][:3]] == [
+        {"singer": ["id", "name"], "concert": ["singer_id", "year"]},
+        {"singer": [], "PLACEHOLDER_TABLE": ["age"]},
+        {"PLACEHOLDER_TABLE": ["name"], "singers": []},
+    ]
+    assert json.loads(output["schema_tables"][0]) == {
+        "singer": ["age", "id", "name"],
+        "concert": ["concert_id", "singer_id", "year"],
+    }
+    assert output["is_valid"].to_list() == [True, True, True, False, True] * 3
+    assert output["is_tables_valid"].to_list() == [True, True, False, True, True] * 3
+    assert output["is_cols_valid"].to_list() == [True, True, False, True, True] * 3
+
+    # a second run reads every parse from the cache
+    assert run(data).equals(output)
+    assert calls == sqls
+
+    # the cache is keyed on the exact text, since whitespace outside quotes can change the
+    # parse, e.g. by ending a line comment
+    commented = ["SELECT name -- note FROM singers", "SELECT name -- note\nFROM singers"]
+    tables = [
+        json.loads(run(pl.DataFrame({"sql": [sql], "schema": [schema]}))["sql_tables"][0])
+        for sql in commented
+    ]
+    assert calls == sqls + commented
+    assert tables == [
+        {"PLACEHOLDER_TABLE": ["name"]},
+        {"singers": [], "PLACEHOLDER_TABLE": ["name"]},
+    ]
+
+    # and without the cache, large inputs are parsed on a process pool
+    monkeypatch.setattr("uptrain.operators.code.sql.parse_sql_tables", parse_sql_tables)
+    monkeypatch.setattr(sql_utils, "SQL_PARSE_POOL_MIN", 0)
+    pooled = ParseSQL(
+        col_in_sql="sql",
+        col_out_tables="sql_tables",
+        col_out_is_valid_sql="is_valid",
+        num_workers=2,
+        chunk_size=2,
+    ).setup(Settings(logs_folder=str(tmp_path), sql_parse_cache=False))
+    pooled_output = pooled.run(data)["output"]
+    assert pooled_output["sql_tables"].equals(output["sql_tables"])
+    assert pooled_output["is_valid"].equals(output["is_valid"])
+
+
+# uptrain.operators.io
+def test_text_readers_in_batches(tmp_path):
+    import polars as pl
+    from uptrain.operators import CsvReader, JsonReader
+
+    data = pl.DataFrame(
+        {
+            "id": list(range(25)),
+            "text": [f"line {i}\nwith a break" if i % 7 == 0 else f"row {i}" for i in range(25)],
+        }
+    )
+    data.write_csv(tmp_path / "data.csv")
+    data.write_ndjson(tmp_path / "data.jsonl")
+
+    for reader in [CsvReader, JsonReader]:
+        fpath = str(tmp_path / ("data.csv" if reader is CsvReader else "data.jsonl"))
+        op = reader(fpath=fpath, batch_size=10).setup(SETTINGS)
+        batches = []
+        while (batch := op.run()["output"]) is not None:
+            batches.append(batch)
+        assert [len(b) for b in batches] == [10, 10, 5]
+        assert pl.concat(batches).equals(data)
+        assert op._executor.rows_read == 25
+        assert reader(fpath=fpath).setup(SETTINGS).run()["output"].equals(data)
+
+    # a column that is null in the rows the schema is inferred from is read with pandas, in
+    # batches too
+    late = pl.DataFrame({"id": list(range(150)), "score": [None] * 120 + [i / 2 for i in range(30)]})
+    late.write_ndjson(tmp_path / "late.jsonl")
+    fpath = str(tmp_path / "late.jsonl")
+    full = JsonReader(fpath=fpath).setup(SETTINGS).run()["output"]
+    batches = list(JsonReader(fpath=fpath, batch_size=50).setup(SETTINGS).iter_batches())
+    assert full["score"].to_list() == late["score"].to_list()
+    assert pl.concat(batches, how="vertical_relaxed")["score"].to_list() == late["score"].to_list()
+
+
+def test_text_readers_memory_ceiling(tmp_path):
+    """Reading a 2GB file in batches holds at most a batch of it in memory. Writing the
+    files takes minutes, so this only runs with UPTRAIN_BENCH_LARGE=1."""
+    import subprocess
+    import sys
+    import pytest
+
+    if os.environ.get("UPTRAIN_BENCH_LARGE") != "1":
+        pytest.skip("set UPTRAIN_BENCH_LARGE=1 to read a 2GB file")
+
+    size_mb = 2048
+    rows_per_block = 10_000
+    ceiling_mb = 256
+
+    # polars allocates outside the python heap, so measure the peak RSS of a fresh process
+    script = """
+import resource, sys
+from uptrain.framework import Settings
+from uptrain.operators import CsvReader, JsonReader
+reader = {"csv": CsvReader, "jsonl": JsonReader}[sys.argv[2]]
+op = reader(fpath=sys.argv[1], batch_size=5_000).setup(Settings())
+start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+num_rows = 0
+for batch in op.iter_batches():
+    assert len(batch) <= 5_000
+    num_rows += len(batch)
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(num_rows, (peak - start) * 1024)
+"""
+    for ext in ["csv", "jsonl"]:
+        fpath = str(tmp_path / f"large.{ext}")
+        with open(fpath, "w") as f:
+            if ext == "csv":
+                f.write("id,text\n")
+            block = "".join(
+                f'{i},"{"x" * 80}"\n' if ext == "csv" else f'{{"id": {i}, "text": "{"x" * 80}"}}\n'
+                for i in range(rows_per_block)
+            )
+            num_blocks = size_mb * 1024 * 1024 // len(block)
+            for _ in range(num_blocks):
+                f.write(block)
+
+        try:
+            result = subprocess.run(
+                [sys.executable, "-c", script, fpath, ext],
+                capture_output=True, text=True, check=True,
+            )
+        finally:
+            os.remove(fpath)
+        num_rows, growth = map(int, result.stdout.split())
+
+        assert num_rows == num_blocks * rows_per_block
+        assert growth < ceiling_mb * 1024 * 1024, f"{ext} reader grew by {growth / 2**20:.1f}MB"
+
+
+def test_columnar_writers(tmp_path):
+    import polars as pl
+    import pyarrow.parquet as pq
+    from uptrain.framework import Check, CheckSet
+    from uptrain.operators import ArrowIpcWriter, JsonReader, ParquetWriter, TextLength
+
+    data = pl.DataFrame({"id": [1, 2, 3, 4, 5], "text": ["a", "bb", None, "dddd", "e"]})
+    for writer, ext in [(ParquetWriter, "parquet"), (ArrowIpcWriter, "arrow")]:
+        op = writer(fpath=str(tmp_path / f"data.{ext}"), row_group_size=2).setup(SETTINGS)
+        op.run(data.head(3))
+        # later writes are cast to the schema of the first one
+        op.run(data.tail(2).with_columns(pl.col("id").cast(pl.Float64)).select(["text", "id"]))
+        op.close()
+        assert op.to_reader().setup(SETTINGS).run()["output"].equals(data)
+
+    metadata = pq.ParquetFile(tmp_path / "data.parquet").metadata
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [2, 2, 1]
+    column = metadata.row_group(0).column(0)
+    assert column.compression == "ZSTD"
+    assert (column.statistics.min, column.statistics.max) == (1, 2)
+
+    # checkset outputs in the configured format
+    data.write_ndjson(tmp_path / "input.jsonl")
+    settings = Settings(logs_folder=str(tmp_path / "logs"), output_format="parquet")
+    check = Check(name="text length", operators=[TextLength(col_in_text="text")])
+    CheckSet(source=JsonReader(fpath=str(tmp_path / "input.jsonl")), checks=[check]).setup(
+        settings
+    ).run()
+    sink = CheckSet._get_sink_for_check(settings, check)
+    assert sink.fpath.endswith("text_length.parquet")
+    output = sink.to_reader().setup(settings).run()["output"]
+    assert output["text_length"].to_list() == [1, 2, None, 4, 1]
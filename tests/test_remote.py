@@ -0,0 +1,196 @@
+"""
+Test the chunked, concurrent requests `APIClient` makes to the Uptrain server, against
+a local stub server that is slow or fails on some chunks.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from uptrain.framework import Settings
+from uptrain.framework.remote import AdaptiveChunkSizer, APIClient
+
+
+class StubServer:
+    """Echoes each row back with a score. Chunks containing a row in `slow_ids` take
+    `slow_secs` longer, and the first attempt at a chunk containing a row in `fail_ids`
+    gets a 503."""
+
+    def __init__(self, slow_ids=(), fail_ids=(), slow_secs=0.3, latency=0.05):
+        self.slow_ids = set(slow_ids)
+        self.fail_ids = set(fail_ids)
+        self.slow_secs = slow_secs
+        self.latency = latency
+        self.chunk_sizes = []
+        self.failed = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def handle(self, body: dict) -> tuple[int, list]:
+        rows = body.get("dataset", body.get("data"))
+        ids = {row["id"] for row in rows}
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            should_fail = len(ids & self.fail_ids) > 0
+            self.fail_ids -= ids
+        try:
+            time.sleep(self.latency + (self.slow_secs if ids & self.slow_ids else 0.0))
+        finally:
+            with self._lock:
+                self.active -= 1
+        if should_fail:
+            self.failed += 1
+            return 503, [{"detail": "overloaded"}]
+        self.chunk_sizes.append(len(rows))
+        return 200, [{**row, "score": 2 * row["id"]} for row in rows]
+
+    def __enter__(self) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                status, response = stub.handle(body)
+                payload = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def make_api_client(server_url: str, **kwargs) -> APIClient:
+    settings = Settings(
+        uptrain_server_url=server_url, uptrain_access_token="up-fake", **kwargs
+    )
+    client = APIClient(settings=settings)
+    client.BACKOFF_BASE = 0.01
+    return client
+
+
+def test_evaluate_concurrent_chunks():
+    server = StubServer(slow_ids=[150, 620], fail_ids=[30, 480])
+    rows = [{"id": i, "question": f"q{i}"} for i in range(1000)]
+    with server as url:
+        client = make_api_client(url, remote_max_concurrency=4)
+        start = time.perf_counter()
+        results = client.evaluate("factual_accuracy", rows)
+        elapsed = time.perf_counter() - start
+
+    # every row comes back once, in order, despite slow and retried chunks
+    assert [r["id"] for r in results] == list(range(1000))
+    assert all(r["score"] == 2 * r["id"] for r in results)
+    assert server.failed == 2
+    assert server.max_active > 1
+    # sending the chunks one after another would wait out both slow chunks back to back
+    sequential_secs = len(server.chunk_sizes) * server.latency + 2 * server.slow_secs
+    assert elapsed < sequential_secs
+
+
+def test_log_and_evaluate_retries_and_concurrency():
+    server = StubServer(slow_ids=[10], fail_ids=[0, 260])
+    rows = [{"id": i, "question": "q", "response": "r"} for i in range(300)]
+    with server as url:
+        client = make_api_client(url, remote_max_concurrency=3)
+        results = client.log_and_evaluate("project", rows, checks=["response_relevance"])
+
+    assert [r["id"] for r in results] == list(range(300))
+    assert server.failed == 2
+    assert 1 < server.max_active <= 3
+    assert sum(server.chunk_sizes) == 300
+
+
+def test_evaluate_gives_up_on_client_errors():
+    import httpx
+
+    class BadRequestServer(StubServer):
+        def handle(self, body):
+            self.failed += 1
+            return 400, [{"detail": "bad request"}]
+
+    server = BadRequestServer()
+    with server as url:
+        client = make_api_client(url)
+        with pytest.raises(httpx.HTTPStatusError):
+            client.evaluate("factual_accuracy", [{"id": 0}])
+    assert server.failed == 1
+
+
+def test_adaptive_chunk_sizer():
+    sizer = AdaptiveChunkSizer(initial_size=50, target_secs=10.0)
+    # a fast server lets chunks grow, at most doubling each time, up to the cap
+    sizer.observe(50, latency=0.5)
+    assert sizer.size == 100
+    for _ in range(5):
+        sizer.observe(sizer.size, latency=0.5)
+    assert sizer.size == 200
+
+    # a slow server shrinks them towards the target latency
+    for _ in range(10):
+        sizer.observe(sizer.size, latency=sizer.size / 2.0)
+    assert 15 <= sizer.size <= 30
+    sizer.on_failure()
+    assert sizer.size < 15
+
+
+def test_evalllm_concurrent_batches():
+    from uptrain import EvalLLM
+
+    server = StubServer(slow_ids=[70], fail_ids=[120])
+    rows = [{"id": i, "question": "q", "response": "r"} for i in range(400)]
+    with server as url:
+        settings = Settings(
+            uptrain_server_url=url, openai_api_key="sk-fake", remote_max_concurrency=4
+        )
+        eval_llm = EvalLLM(settings=settings)
+        eval_llm.executor.BACKOFF_BASE = 0.01
+        results = eval_llm.evaluate(data=rows, checks=["response_relevance"])
+
+    assert [r["id"] for r in results] == list(range(400))
+    assert server.failed == 1
+    assert server.max_active > 1
+
+
+def test_evalllm_returns_partial_results_on_interrupt():
+    import _thread
+    from uptrain import EvalLLM
+
+    # a slow chunk near the start is still in flight when the later ones complete
+    server = StubServer(slow_ids=[60], slow_secs=2.0, latency=0.2)
+    rows = [{"id": i, "question": "q", "response": "r"} for i in range(2000)]
+    with server as url:
+        settings = Settings(
+            uptrain_server_url=url, openai_api_key="sk-fake", remote_max_concurrency=2
+        )
+        timer = threading.Timer(0.5, _thread.interrupt_main)
+        timer.start()
+        start = time.perf_counter()
+        results = EvalLLM(settings=settings).evaluate(data=rows, checks=["response_relevance"])
+        elapsed = time.perf_counter() - start
+        timer.cancel()
+
+    ids = [r["id"] for r in results]
+    # only the rows before the first unfinished chunk, without gaps
+    assert 0 < len(ids) <= 60
+    assert ids == list(range(len(ids)))
+    # in-flight requests are cancelled rather than waited out
+    assert elapsed < 1.5
@@ -26,10 +26,10 @@ from uptrain.dashboard.st_helpers import (
 
 @st.cache_data
 def load_data_for_check_local(_settings: "Settings", _check: "Check", check_name: str):
-    from uptrain.operators import DeltaWriter, JsonWriter
+    from uptrain.operators import DeltaWriter, JsonWriter, ParquetWriter, ArrowIpcWriter
 
     sink = CheckSet._get_sink_for_check(_settings, _check)
-    if isinstance(sink, (DeltaWriter, JsonWriter)):
+    if isinstance(sink, (DeltaWriter, JsonWriter, ParquetWriter, ArrowIpcWriter)):
         source = sink.to_reader()
         source.setup(_settings)
     else:
@@ -11,7 +11,10 @@ import polars as pl
 from pydantic import BaseSettings, Field
 
 from uptrain.operators.base import *
+from uptrain.operators.language.rate_limit import DEFAULT_MAX_CONCURRENCY
 from uptrain.utilities import to_py_types, jsondump, jsonload
+from uptrain.framework.scheduler import Scheduler, get_scheduler
+from uptrain.utilities.profiling import Profiler
 
 __all__ = [
     "OperatorDAG",
@@ -36,11 +39,43 @@ class Settings(BaseSettings):
 
     rpm_limit: int = 100
     tpm_limit: int = 90_000
+    # upper bound on concurrent LLM requests, adapted downwards when the provider throttles us
+    llm_max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+
+    # on-disk cache for LLM responses, kept under `logs_folder`. Only payloads that don't sample (temperature 0,
+    # or a fixed seed) are cached. Set `llm_cache` to False to bypass it.
+    llm_cache: bool = True
+    llm_cache_ttl: t.Union[float, None] = None  # in seconds, None means entries never expire
+    llm_cache_max_entries: t.Union[int, None] = 100_000
+    llm_cache_max_mb: t.Union[float, None] = 1024
     embedding_compute_method: t.Literal['local', 'replicate', 'api'] = 'local'
+    # persistent store of computed embeddings, kept under `logs_folder`
+    embedding_cache: bool = True
+    # persistent cache of the tables and columns parsed out of SQL, kept under `logs_folder`
+    sql_parse_cache: bool = True
+    sql_parse_cache_max_entries: t.Union[int, None] = 100_000
+
+    # how independent operators within a compute DAG are run
+    dag_scheduler: t.Literal["sequential", "thread", "process", "asyncio"] = "sequential"
+    dag_max_workers: t.Union[int, None] = None
+
+    # file format a `CheckSet` writes the output of each check in
+    output_format: t.Literal["jsonl", "parquet", "arrow"] = "jsonl"
+    # keep the results of previous `CheckSet` runs, and only run checks on new or changed rows
+    incremental_runs: bool = False
+
+    # profile each operator a `CheckSet` runs, and write `profile.json` and a chrome trace to `logs_folder`
+    profile: bool = False
+    # also print a summary of where the time went, at the end of the run
+    profile_summary: bool = False
 
     # uptrain managed service related
     uptrain_access_token: str = Field(None, env="UPTRAIN_ACCESS_TOKEN")
     uptrain_server_url: str = Field("https://demo.uptrain.ai/", env="UPTRAIN_SERVER_URL")
+    # large datasets are sent to the server in chunks, with this many requests in flight
+    remote_max_concurrency: int = 4
+    # chunk sizes adapt to the observed latency, so each request takes about this long
+    remote_chunk_target_secs: float = 60.0
 
     # Embedding model related, applicable if embedding_compute_method is api.
     embedding_model_url: str = Field(None, env="EMBEDDING_MODEL_URL")
@@ -118,10 +153,12 @@ class OperatorDAG:
 
     name: str
     graph: nx.DiGraph
+    scheduler: Scheduler | None
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, scheduler: Scheduler | None = None):
         self.name = name
         self.graph = nx.DiGraph()
+        self.scheduler = scheduler
 
     def add_step(
         self, name: str, node: Operator, deps: t.Optional[list[str]] = None
@@ -155,56 +192,93 @@ class OperatorDAG:
             node: "Operator" = self.graph.nodes[node_name]["op_class"]
             node.setup(settings)
 
+        if self.scheduler is None:
+            self.scheduler = get_scheduler(
+                settings.dag_scheduler, max_workers=settings.dag_max_workers
+            )
+
     def run(
         self,
         node_inputs: dict[str, pl.DataFrame | None],
         output_nodes: list[str],
+        scheduler: Scheduler | None = None,
+        profiler: Profiler | None = None,
     ) -> dict[str, pl.DataFrame]:
         """Runs the compute DAG.
+
+        Nodes are grouped into generations, where each node only depends on nodes from
+        earlier generations. The scheduler is free to run all nodes of a generation
+        concurrently.
+
         Args:
             node_inputs: A dict of input dataframes, keyed by operator name. For other operators, the output
                 from the upstream operators is used as input.
             node_outputs: A list of operator names, whose output should be returned.
+            scheduler: Scheduler to run the nodes with. Defaults to the one picked at setup, or
+                sequential execution if the DAG wasn't set up.
+            profiler: If given, the wall/cpu time, rows in/out, peak memory and LLM tokens used by
+                each node are recorded to it.
         """
+        if scheduler is None:
+            scheduler = self.scheduler if self.scheduler is not None else get_scheduler()
 
         # dict to hold the output of each node
         node_to_output = {}
-        sorted_nodes = list(nx.algorithms.dag.topological_sort(self.graph))
+        generations = [
+            list(gen)
+            for gen in nx.algorithms.dag.topological_generations(self.graph)
+        ]
         dependents_count = {
             node_name: len(self._get_node_children(node_name))
-            for node_name in sorted_nodes
+            for node_name in self.graph.nodes
         }
 
-        # run each node in topological order
-        for node_name in sorted_nodes:
-            logger.debug(f"Executing node: {node_name} for operator DAG: {self.name}")
-            node: "TransformOp" = self.graph.nodes[node_name]["op_class"]
-
-            # get input for this node from its dependencies
-            inputs_from_deps = []
-            if node_name in node_inputs:
-                inputs_from_deps.append(node_inputs[node_name])
-            else:
-                for dep in self.graph.predecessors(node_name):
-                    if dep in node_to_output:
-                        inputs_from_deps.append(node_to_output[dep])
-                    else:
-                        raise ValueError(
-                            f"Cannot find output/provided value for dependency: {dep} of node: {node_name}"
-                        )
-
-            # run the operator and store the output
-            res = node.run(*inputs_from_deps)
-            node_to_output[node_name] = res["output"]
-
-            # decrease dependents count for each dependency so we don't old onto memory
-            for parent in self.graph.predecessors(node_name):
-                dependents_count[parent] -= 1
-                if dependents_count[parent] == 0 and parent not in output_nodes:
-                    node_to_output.pop(parent, None)
+        with scheduler:
+            # run each generation after the previous one completes
+            for generation in generations:
+                tasks = {}
+                for node_name in generation:
+                    logger.debug(
+                        f"Executing node: {node_name} for operator DAG: {self.name}"
+                    )
+                    node: "TransformOp" = self.graph.nodes[node_name]["op_class"]
+                    inputs_from_deps = self._get_node_inputs(
+                        node_name, node_inputs, node_to_output
+                    )
+                    tasks[node_name] = (node, inputs_from_deps)
+
+                # run the operators and store the outputs
+                node_to_output.update(scheduler.run_generation(tasks, profiler, self.name))
+
+                # decrease dependents count for each dependency so we don't old onto memory
+                for node_name in generation:
+                    for parent in self.graph.predecessors(node_name):
+                        dependents_count[parent] -= 1
+                        if dependents_count[parent] == 0 and parent not in output_nodes:
+                            node_to_output.pop(parent, None)
 
         return {node_name: node_to_output[node_name] for node_name in output_nodes}
 
+    def _get_node_inputs(
+        self,
+        node_name: str,
+        node_inputs: dict[str, pl.DataFrame | None],
+        node_to_output: dict[str, pl.DataFrame | None],
+    ) -> list[pl.DataFrame | None]:
+        """Get input for this node from its dependencies, or the provided inputs."""
+        if node_name in node_inputs:
+            return [node_inputs[node_name]]
+
+        inputs_from_deps = []
+        for dep in self.graph.predecessors(node_name):
+            if dep in node_to_output:
+                inputs_from_deps.append(node_to_output[dep])
+            else:
+                raise ValueError(
+                    f"Cannot find output/provided value for dependency: {dep} of node: {node_name}"
+                )
+        return inputs_from_deps
+
     def _get_node_parents(self, name: str) -> list[str]:
         return list(self.graph.predecessors(name))
 
@@ -1,7 +1,10 @@
 """Implements `Check` objects used for LLM evaluation purposes.
 """
 from __future__ import annotations
+import contextlib
 from dataclasses import dataclass
+import hashlib
+import importlib.metadata
 import os
 import typing as t
 
@@ -10,11 +13,48 @@ import polars as pl
 from pydantic import BaseModel
 
 from uptrain.operators.base import *
-from uptrain.utilities import jsonload, jsondump, to_py_types, clear_directory
+from uptrain.utilities import jsonload, jsondump, jsondumps, to_py_types, clear_directory
+from uptrain.utilities.cache import CACHE_DIR_NAME, hash_key
+from uptrain.utilities.profiling import Profiler
 from uptrain.framework.base import OperatorDAG, Settings
 
 __all__ = ["Check", "CheckSet", "ExperimentArgs"]
 
+# settings that change the results a check computes, as opposed to how fast they are
+# computed, where they are logged or secrets - changing any of them invalidates the results
+# of an incremental run
+SETTINGS_FINGERPRINTED = {
+    "model",
+    "seed",
+    "response_format",
+    "azure_api_base",
+    "azure_api_version",
+    "embedding_compute_method",
+    "embedding_model_url",
+    "uptrain_server_url",
+}
+
+
+def _uptrain_version() -> str:
+    try:
+        return importlib.metadata.version("uptrain")
+    except importlib.metadata.PackageNotFoundError:  # running from a source checkout
+        return "unknown"
+
+
+def fingerprint_rows(data: pl.DataFrame) -> list[str]:
+    """Content hash of each row of the dataframe, independent of the column order."""
+    columns = sorted(data.columns)
+    try:
+        encoded = (
+            data.select(pl.struct(columns).struct.json_encode()).to_series().to_list()
+        )
+    except Exception:  # dtypes polars can't encode to json
+        encoded = [jsondumps(row, sort_keys=True) for row in data.select(columns).to_dicts()]
+    return [
+        hashlib.blake2b(row.encode("utf-8"), digest_size=16).hexdigest() for row in encoded
+    ]
+
 
 class Check:
     """A simple check that runs the given list of table operators in sequence.
@@ -55,8 +95,13 @@ class Check:
 
         return self
 
-    def run(self, data: t.Union[pl.DataFrame, None] = None) -> t.Union[pl.DataFrame, None]:
-        """Run this check on the given data."""
+    def run(
+        self,
+        data: t.Union[pl.DataFrame, None] = None,
+        profiler: t.Union[Profiler, None] = None,
+    ) -> t.Union[pl.DataFrame, None]:
+        """Run this check on the given data, recording the run of each operator to the
+        profiler if one is given."""
         node_inputs = {"operator_0": data}
 
         if len(self.operators):
@@ -65,11 +110,33 @@ class Check:
             node_outputs = self._op_dag.run(
                 node_inputs=node_inputs,
                 output_nodes=[name_final_node],
+                profiler=profiler,
             )
             return node_outputs[name_final_node]
         else:
             return data
 
+    @property
+    def is_rowwise(self) -> bool:
+        """Whether each output row is computed from the matching input row alone, so the
+        check can be run on a subset of rows and the results merged."""
+        return all(isinstance(op, ColumnOp) and op.is_rowwise for op in self.operators)
+
+    def fingerprint(self, settings: Settings) -> str:
+        """Hash of everything the results of this check depend on, besides the data - the
+        serialized operators, the settings they read and the uptrain version."""
+        return hash_key(
+            {
+                "check": self.dict(),
+                "settings": {
+                    key: value
+                    for key, value in to_py_types(settings.dict()).items()
+                    if key in SETTINGS_FINGERPRINTED
+                },
+                "uptrain_version": _uptrain_version(),
+            }
+        )
+
     def dict(self) -> dict:
         """Serialize this check to a dict."""
         return {
@@ -120,14 +187,24 @@ class CheckSet:
 
     def setup(self, settings: Settings):
         """Create the logs directory, or clear it if it already exists. Also, persist the
-        evaluation config.
+        evaluation config. Caches stored in the logs directory are retained across runs,
+        as are the results of each check if `settings.incremental_runs` is set.
         """
         self._settings = settings
         logs_dir = self._settings.logs_folder
         if not os.path.exists(logs_dir):
             os.makedirs(logs_dir)
         else:
-            clear_directory(logs_dir)
+            exclude = [CACHE_DIR_NAME]
+            if self._settings.incremental_runs:
+                # only rowwise checks are run incrementally, the others rewrite their sinks
+                for check in self.checks:
+                    if not check.is_rowwise:
+                        continue
+                    fpath = self._get_sink_for_check(self._settings, check).fpath
+                    exclude.append(os.path.basename(fpath))
+                    exclude.append(os.path.basename(self._get_fingerprint_fpath(fpath)))
+            clear_directory(logs_dir, exclude=exclude)
 
         logger.info(f"Uptrain Logs directory: {logs_dir}")
 
@@ -135,6 +212,8 @@ class CheckSet:
         self.serialize(os.path.join(logs_dir, "config.json"))
         self._settings.serialize(os.path.join(logs_dir, "settings.json"))
 
+        self._profiler = Profiler() if self._settings.profile else None
+
         self.source.setup(self._settings)
         for preprocessor in self.preprocessors:
             preprocessor.setup(self._settings)
@@ -150,7 +229,9 @@ class CheckSet:
 
         logger.info("CheckSet Status: Starting checkset")
 
-        source_output = self.source.run()["output"]
+        with self._profile("source", self.source) as profile:
+            source_output = self.source.run()["output"]
+            self._set_rows_out(profile, source_output)
         if source_output is None:
             raise RuntimeError("Dataset read from the source is: None")
         if len(source_output) == 0:
@@ -158,8 +239,10 @@ class CheckSet:
         logger.info("CheckSet Status: Dataset loaded from source")
 
         if len(self.preprocessors) > 0:
-            for preprocessor in self.preprocessors:
-                source_output = preprocessor.run(source_output)["output"]
+            for i, preprocessor in enumerate(self.preprocessors):
+                with self._profile(f"preprocessor_{i}", preprocessor, [source_output]) as profile:
+                    source_output = preprocessor.run(source_output)["output"]
+                    self._set_rows_out(profile, source_output)
                 assert source_output is not None, "Output of preprocessor is None"
 
             # persist the preprocessed input for debugging
@@ -174,9 +257,14 @@ class CheckSet:
         consolidated_output = {}
         for check in self.checks:
             logger.info(f"CheckSet Status: Check {check.name} Started")
-            check_output = check.run(source_output)
-            assert check_output is not None, f"Output of check {check.name} is None"
-            self._get_sink_for_check(self._settings, check).run(check_output)
+            if self._settings.incremental_runs and check.is_rowwise:
+                check_output = self._run_check_incremental(check, source_output)
+            else:
+                check_output = check.run(source_output, profiler=self._profiler)
+                assert check_output is not None, f"Output of check {check.name} is None"
+                sink = self._get_sink_for_check(self._settings, check)
+                with self._profile(f"sink_{check.name}", sink, [check_output]):
+                    self._write_check_output(self._settings, check, check_output)
             logger.info(f"CheckSet Status: Check {check.name} Completed")
 
             if len(self.postprocessors):
@@ -188,8 +276,12 @@ class CheckSet:
 
         if len(self.postprocessors):
             consolidated_output = pl.DataFrame(consolidated_output)
-            for postprocessor in self.postprocessors:
-                consolidated_output = postprocessor.run(consolidated_output)['output']
+            for i, postprocessor in enumerate(self.postprocessors):
+                with self._profile(
+                    f"postprocessor_{i}", postprocessor, [consolidated_output]
+                ) as profile:
+                    consolidated_output = postprocessor.run(consolidated_output)['output']
+                    self._set_rows_out(profile, consolidated_output)
                 assert consolidated_output is not None, "Output of postprocessor is None"
 
             # persist the postprocessed input for debugging
@@ -200,13 +292,120 @@ class CheckSet:
             ).setup(self._settings).run(consolidated_output)
         logger.info("CheckSet Status: Postprocessing Done")
 
+        if self._profiler is not None:
+            self._export_profile()
+
+    def _profile(self, node: str, op: t.Any, inputs: t.Sequence = ()) -> t.ContextManager:
+        """Profiles the enclosed run of an operator of the check set itself, if profiling
+        is enabled. Yields the node profile, or None."""
+        if self._profiler is None:
+            return contextlib.nullcontext()
+        return self._profiler.profile("checkset", node, op, inputs)
+
+    @staticmethod
+    def _set_rows_out(profile: t.Any, output: t.Union[pl.DataFrame, None]) -> None:
+        if profile is not None and output is not None:
+            profile.rows_out = len(output)
+
+    def _export_profile(self) -> None:
+        """Write the collected profile as json and as a chrome trace to the logs folder."""
+        assert self._profiler is not None
+        logs_dir = self._settings.logs_folder
+        self._profiler.export_json(os.path.join(logs_dir, "profile.json"))
+        self._profiler.export_chrome_trace(os.path.join(logs_dir, "profile_trace.json"))
+        logger.info(f"CheckSet Status: Profile written to {logs_dir}")
+        if self._settings.profile_summary:
+            print(self._profiler.flame_summary())
+
     @staticmethod
     def _get_sink_for_check(settings: Settings, check: Check):
-        """Get the sink operator for this check."""
-        from uptrain.operators import JsonWriter
+        """Get the sink operator for this check, as per `settings.output_format`."""
+        from uptrain.operators import JsonWriter, ParquetWriter, ArrowIpcWriter
+
+        fname = check.name.replace(" ", "_")
+        fpath = os.path.join(settings.logs_folder, fname)
+        if settings.output_format == "parquet":
+            return ParquetWriter(fpath=fpath + ".parquet")
+        elif settings.output_format == "arrow":
+            return ArrowIpcWriter(fpath=fpath + ".arrow")
+        else:
+            return JsonWriter(fpath=fpath + ".jsonl")
+
+    @classmethod
+    def _write_check_output(cls, settings: Settings, check: Check, data: pl.DataFrame):
+        """Write the output of a check to its sink, and finalize the file."""
+        from uptrain.operators import ParquetWriter, ArrowIpcWriter
+
+        sink = cls._get_sink_for_check(settings, check).setup(settings)
+        sink.run(data)
+        if isinstance(sink, (ParquetWriter, ArrowIpcWriter)):
+            sink.close()
+
+    @staticmethod
+    def _get_fingerprint_fpath(sink_fpath: str) -> str:
+        """The row fingerprints for a check are stored next to its results."""
+        return os.path.splitext(sink_fpath)[0] + ".fingerprint.json"
+
+    def _run_check_incremental(self, check: Check, data: pl.DataFrame) -> pl.DataFrame:
+        """Run the check only on the rows that weren't scored by a previous run with the
+        same check fingerprint, and merge them with the retained results, in the order
+        of the input rows.
+        """
+        sink = self._get_sink_for_check(self._settings, check)
+        fingerprint_fpath = self._get_fingerprint_fpath(sink.fpath)
+        check_hash = check.fingerprint(self._settings)
+        row_hashes = fingerprint_rows(data)
+
+        previous, previous_rows = None, {}
+        if os.path.exists(fingerprint_fpath) and os.path.exists(sink.fpath):
+            with open(fingerprint_fpath, "r") as f:
+                saved = jsonload(f)
+            if saved["check"] == check_hash:
+                previous = sink.to_reader().setup(self._settings).run()["output"]
+                if len(previous) == len(saved["rows"]):
+                    previous_rows = {row_hash: i for i, row_hash in enumerate(saved["rows"])}
+                else:
+                    logger.warning(f"Results of check {check.name} are incomplete, rerunning it")
+                    previous = None
+            else:
+                logger.info(f"Check {check.name} changed since the last run, rerunning it")
+
+        reused = [(i, previous_rows[h]) for i, h in enumerate(row_hashes) if h in previous_rows]
+        new_idxs = [i for i, h in enumerate(row_hashes) if h not in previous_rows]
+        logger.info(
+            f"CheckSet Status: Check {check.name} reuses {len(reused)} rows, "
+            f"running on {len(new_idxs)} new or changed rows"
+        )
+
+        parts = []
+        if len(new_idxs):
+            new_output = check.run(data[new_idxs], profiler=self._profiler)
+            assert new_output is not None, f"Output of check {check.name} is None"
+            parts.append(new_output.with_columns(pl.Series("__row_idx", new_idxs)))
+        if len(reused):
+            assert previous is not None
+            parts.append(
+                previous[[j for _, j in reused]].with_columns(
+                    pl.Series("__row_idx", [i for i, _ in reused])
+                )
+            )
+        columns = parts[0].columns
+        check_output = (
+            pl.concat(parts, how="diagonal_relaxed")
+            .select(columns)
+            .sort("__row_idx")
+            .drop("__row_idx")
+        )
 
-        fname = check.name.replace(" ", "_") + ".jsonl"
-        return JsonWriter(fpath=os.path.join(settings.logs_folder, fname))
+        # rewrite the results from scratch, since the sinks append to existing files
+        for fpath in [sink.fpath, fingerprint_fpath]:
+            if os.path.exists(fpath):
+                os.remove(fpath)
+        with self._profile(f"sink_{check.name}", sink, [check_output]):
+            self._write_check_output(self._settings, check, check_output)
+        with open(fingerprint_fpath, "w") as f:
+            jsondump({"check": check_hash, "rows": row_hashes}, f)
+        return check_output
 
     @classmethod
     def from_dict(cls, data: dict) -> "CheckSet":
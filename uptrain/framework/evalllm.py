@@ -47,10 +47,13 @@ class EvalLLM:
 
         Returns:
             results: List of dictionaries with each data point and corresponding evaluation results.
+                If interrupted, only the rows evaluated so far are returned.
         """
 
         if isinstance(data, pl.DataFrame):
             data = data.to_dicts()
+        elif isinstance(data, pd.DataFrame):
+            data = data.to_dict(orient="records")
 
         if schema is None:
             schema = DataSchema()
@@ -103,31 +106,11 @@ class EvalLLM:
                     f"Row {idx} is missing required all required attributes for evaluation: {req_attrs}"
                 )
 
-        # send in chunks of 50, so the connection doesn't time out waiting for the server
-        results = []
-        NUM_TRIES, BATCH_SIZE = 3, 50
-        for i in range(0, len(data), BATCH_SIZE):
-            batch_results = []
-            for try_num in range(NUM_TRIES):
-                try:
-                    logger.info(
-                        f"Sending evaluation request for rows {i} to <{i+BATCH_SIZE} to the Uptrain"
-                    )
-                    batch_results = self.executor.evaluate(
-                        data=data[i : i + BATCH_SIZE],
-                        checks=ser_checks,
-                        metadata={
-                            "schema": schema.dict(),
-                            "uptrain_settings": self.settings.dict()
-                        }
-                    )
-                    break
-                except Exception as e:
-                    logger.info("Retrying evaluation request")
-                    if try_num == NUM_TRIES - 1:
-                        logger.error(f"Evaluation failed with error: {e}")
-                        raise e
-
-            results.extend(batch_results)
-
-        return results
+        return self.executor.evaluate_in_chunks(
+            data=data,
+            checks=ser_checks,
+            metadata={
+                "schema": schema.dict(),
+                "uptrain_settings": self.settings.dict()
+            },
+        )
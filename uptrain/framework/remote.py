@@ -3,6 +3,10 @@ This module implements a simple client that can be used to schedule unit-tests/e
 on the UpTrain server. 
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import random
+import time
 import typing as t
 
 from loguru import logger
@@ -47,15 +51,220 @@ def raise_or_return(response: httpx.Response):
         return response.json()
 
 
-class APIClientWithoutAuth:
+# -----------------------------------------------------------
+# Sending large datasets to the server in concurrent chunks
+# -----------------------------------------------------------
+
+
+class AdaptiveChunkSizer:
+    """Picks the number of rows to send in the next chunk, so each request takes about
+    `target_secs` - long enough to amortize the per-request overhead, short enough not
+    to hit timeouts while the server works through it.
+
+    The server's throughput per request (rows/sec) is tracked as an exponential moving
+    average of the observed latencies. Chunks at most double in size at a time, and
+    are halved when a request fails.
+    """
+
+    def __init__(
+        self,
+        initial_size: int,
+        target_secs: float,
+        min_size: int = 1,
+        max_size: t.Optional[int] = None,
+        smoothing: float = 0.5,
+    ):
+        self.size = initial_size
+        self.target_secs = target_secs
+        self.min_size = min_size
+        self.max_size = max_size if max_size is not None else 4 * initial_size
+        self.smoothing = smoothing
+        self.rows_per_sec: t.Optional[float] = None
+
+    def observe(self, num_rows: int, latency: float) -> None:
+        rate = num_rows / max(latency, 1e-3)
+        if self.rows_per_sec is None:
+            self.rows_per_sec = rate
+        else:
+            self.rows_per_sec += self.smoothing * (rate - self.rows_per_sec)
+        ideal = int(self.rows_per_sec * self.target_secs)
+        self.size = max(self.min_size, min(ideal, 2 * self.size, self.max_size))
+
+    def on_failure(self) -> None:
+        self.size = max(self.min_size, self.size // 2)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """Network errors, timeouts, throttling and server errors are worth retrying, other
+    client errors (bad request, auth) are not."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status >= 500 or status in (408, 429)
+    return isinstance(exc, httpx.TransportError)
+
+
+class _ChunkedRequestsMixin:
+    """Posts large datasets to the server in chunks, with up to
+    `settings.remote_max_concurrency` requests in flight. Expects `self.client` and
+    `self.settings` to be set."""
+
+    client: httpx.Client
+    settings: Settings
+
+    NUM_TRIES = 3
+    BACKOFF_BASE = 1.0  # seconds, doubled on every retry
+
+    def _post_in_chunks(
+        self,
+        url: str,
+        rows: list[dict],
+        make_body: t.Callable[[list[dict]], dict],
+        initial_chunk_size: int,
+        desc: str,
+        partial_on_interrupt: bool = False,
+    ) -> list:
+        """Returns the concatenated responses for all chunks, in row order.
+
+        The requests run on an event loop in a worker thread, so this works when called
+        from within a running loop (for ex, in a notebook), and a KeyboardInterrupt
+        reaches the caller right away. On interrupt, in-flight requests are cancelled,
+        and if `partial_on_interrupt` is set the responses for the leading rows that
+        completed are returned instead of re-raising. Chunks that completed after a
+        missing one are dropped, so the result is always a prefix of the rows.
+        """
+        results: dict[int, list] = {}
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(
+            self._async_post_in_chunks(url, rows, make_body, initial_chunk_size, desc, results)
+        )
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(loop.run_until_complete, task)
+        try:
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    break
+                except FutureTimeoutError:
+                    continue
+        except KeyboardInterrupt:
+            loop.call_soon_threadsafe(task.cancel)
+            if not partial_on_interrupt:
+                raise
+            interrupted = True
+        else:
+            interrupted = False
+        finally:
+            executor.shutdown(wait=True)
+            loop.close()
+
+        output = []
+        for start in sorted(results):
+            if start != len(output):  # an earlier chunk didn't complete
+                break
+            output.extend(results[start])
+        if interrupted:
+            num_dropped = sum(len(chunk) for chunk in results.values()) - len(output)
+            logger.warning(
+                f"Interrupted, returning results for rows 0 to <{len(output)} of {len(rows)}, "
+                f"discarding {num_dropped} rows completed after the first missing one"
+            )
+        return output
+
+    async def _async_post_in_chunks(
+        self,
+        url: str,
+        rows: list[dict],
+        make_body: t.Callable[[list[dict]], dict],
+        initial_chunk_size: int,
+        desc: str,
+        results: dict[int, list],
+    ) -> None:
+        """Fills `results` with the response for each chunk, keyed by its first row."""
+        concurrency = max(self.settings.remote_max_concurrency, 1)
+        sizer = AdaptiveChunkSizer(
+            initial_chunk_size, target_secs=self.settings.remote_chunk_target_secs
+        )
+        limits = httpx.Limits(
+            max_connections=concurrency, max_keepalive_connections=concurrency
+        )
+        next_start = 0
+        pending: set[asyncio.Task] = set()
+
+        async with httpx.AsyncClient(
+            headers=self.client.headers, timeout=self.client.timeout, limits=limits
+        ) as aclient:
+            try:
+                while next_start < len(rows) or len(pending):
+                    # chunks are cut when they are sent, so they pick up the latest size
+                    while next_start < len(rows) and len(pending) < concurrency:
+                        chunk = rows[next_start : next_start + sizer.size]
+                        pending.add(
+                            asyncio.create_task(
+                                self._async_post_chunk(
+                                    aclient, url, make_body, chunk, next_start, sizer, desc
+                                )
+                            )
+                        )
+                        next_start += len(chunk)
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        start, response_json = task.result()
+                        results[start] = response_json
+            finally:
+                for task in pending:
+                    task.cancel()
+                if len(pending):
+                    await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _async_post_chunk(
+        self,
+        aclient: httpx.AsyncClient,
+        url: str,
+        make_body: t.Callable[[list[dict]], dict],
+        chunk: list[dict],
+        start: int,
+        sizer: AdaptiveChunkSizer,
+        desc: str,
+    ) -> tuple[int, list]:
+        rows_desc = f"rows {start} to <{start + len(chunk)}"
+        for try_num in range(self.NUM_TRIES):
+            logger.info(f"Sending {desc} request for {rows_desc} to the Uptrain server")
+            start_time = time.perf_counter()
+            try:
+                response = await aclient.post(url, json=make_body(chunk))
+                response_json = raise_or_return(response)
+            except httpx.HTTPError as e:
+                if not _is_retryable(e) or try_num == self.NUM_TRIES - 1:
+                    logger.error(f"Evaluation failed with error: {e}")
+                    raise e
+                sizer.on_failure()
+                delay = random.uniform(0.5, 1.0) * self.BACKOFF_BASE * 2**try_num
+                logger.info(f"Retrying {desc} request for {rows_desc} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                latency = time.perf_counter() - start_time
+                sizer.observe(len(chunk), latency)
+                logger.info(
+                    f"Received {desc} results for {rows_desc} in {latency:.1f}s, "
+                    f"next chunk size: {sizer.size}"
+                )
+                return start, response_json
+        raise AssertionError("unreachable")
+
+
+class APIClientWithoutAuth(_ChunkedRequestsMixin):
     base_url: str
     client: httpx.Client
+    settings: Settings
 
     def __init__(self, settings: Settings = None) -> None:
         if settings is None:
             settings = Settings()
 
         server_url = settings.check_and_get("uptrain_server_url")
+        self.settings = settings
         self.base_url = server_url.rstrip("/") + "/api/open"
         self.client = httpx.Client(
             timeout=httpx.Timeout(7200, connect=5),
@@ -88,9 +297,28 @@ class APIClientWithoutAuth:
 
         return response_json
 
+    def evaluate_in_chunks(
+        self,
+        data: list[dict],
+        checks: list[t.Union[Evals, ParametricEval, dict]],
+        metadata: dict,
+    ):
+        """Run an evaluation on the UpTrain server (Doesn't require UpTrain API Key), sending
+        the data in concurrent chunks so the connection doesn't time out waiting for the
+        server. If interrupted, returns the results for the rows evaluated so far.
+        """
+        url = f"{self.base_url}/evaluate_no_auth"
+        return self._post_in_chunks(
+            url,
+            data,
+            lambda chunk: {"data": chunk, "checks": checks, "metadata": metadata},
+            initial_chunk_size=50,
+            desc="evaluation",
+            partial_on_interrupt=True,
+        )
 
 
-class APIClient:
+class APIClient(_ChunkedRequestsMixin):
     base_url: str
     client: httpx.Client
 
@@ -403,43 +631,20 @@ class APIClient:
         elif isinstance(full_dataset, pd.DataFrame):
             full_dataset = full_dataset.to_dict(orient="records")
 
-        # send in chunks of 100, so the connection doesn't time out waiting for the server
-        results = []
-
         if params is not None:
             params['uptrain_settings'] = self.settings.dict()
         else:
             params = {}
             params['uptrain_settings'] = self.settings.dict()
 
-        NUM_TRIES = 3
-        for i in range(0, len(full_dataset), 100):
-            response_json = None
-            for try_num in range(NUM_TRIES):
-                try:
-                    logger.info(
-                        f"Sending evaluation request for rows {i} to <{i+100} to the Uptrain server"
-                    )
-                    response = self.client.post(
-                        url,
-                        json={
-                            "eval_name": eval_name,
-                            "dataset": full_dataset[i : i + 100],
-                            "params": params,
-                        },
-                    )
-                    response_json = raise_or_return(response)
-                    break
-                except Exception as e:
-                    logger.info("Retrying evaluation request")
-                    if try_num == NUM_TRIES - 1:
-                        logger.error(f"Evaluation failed with error: {e}")
-                        raise e
-
-            if response_json is not None:
-                results.extend(response_json)
-
-        return results
+        # send in chunks, so the connection doesn't time out waiting for the server
+        return self._post_in_chunks(
+            url,
+            full_dataset,
+            lambda chunk: {"eval_name": eval_name, "dataset": chunk, "params": params},
+            initial_chunk_size=100,
+            desc="evaluation",
+        )
 
 
     def perform_root_cause_analysis(
@@ -495,41 +700,23 @@ class APIClient:
                     f"Row {idx} is missing required all required attributes for evaluation: {req_attrs}"
                 )
 
-        # send in chunks of 50, so the connection doesn't time out waiting for the server
-        results = []
-        NUM_TRIES, BATCH_SIZE = 3, 50
-        for i in range(0, len(data), BATCH_SIZE):
-            response_json = None
-            for try_num in range(NUM_TRIES):
-                try:
-                    logger.info(
-                        f"Sending root cause analysis request for rows {i} to <{i+BATCH_SIZE} to the Uptrain server"
-                    )
-                    response = self.client.post(
-                        url,
-                        json={
-                            "data": data[i : i + BATCH_SIZE],
-                            "rca_templates": ser_templates,
-                            "metadata": {
-                                "project": project_name,
-                                "schema": schema.dict(),
-                                **metadata,
-                                "uptrain_settings": self.settings.dict(),
-                            },
-                        },
-                    )
-                    response_json = raise_or_return(response)
-                    break
-                except Exception as e:
-                    logger.info("Retrying root cause analysis request")
-                    if try_num == NUM_TRIES - 1:
-                        logger.error(f"Evaluation failed with error: {e}")
-                        raise e
-
-            if response_json is not None:
-                results.extend(response_json)
-
-        return results
+        # send in chunks, so the connection doesn't time out waiting for the server
+        return self._post_in_chunks(
+            url,
+            data,
+            lambda chunk: {
+                "data": chunk,
+                "rca_templates": ser_templates,
+                "metadata": {
+                    "project": project_name,
+                    "schema": schema.dict(),
+                    **metadata,
+                    "uptrain_settings": self.settings.dict(),
+                },
+            },
+            initial_chunk_size=50,
+            desc="root cause analysis",
+        )
 
 
     def log_and_evaluate(
@@ -613,41 +800,23 @@ class APIClient:
                     f"Row {idx} is missing required all required attributes for evaluation: {req_attrs}"
                 )
 
-        # send in chunks of 50, so the connection doesn't time out waiting for the server
-        results = []
-        NUM_TRIES, BATCH_SIZE = 3, 50
-        for i in range(0, len(data), BATCH_SIZE):
-            response_json = None
-            for try_num in range(NUM_TRIES):
-                try:
-                    logger.info(
-                        f"Sending evaluation request for rows {i} to <{i+BATCH_SIZE} to the Uptrain server"
-                    )
-                    response = self.client.post(
-                        url,
-                        json={
-                            "data": data[i : i + BATCH_SIZE],
-                            "checks": ser_checks,
-                            "metadata": {
-                                "project": project_name,
-                                "schema": schema.dict(),
-                                **metadata,
-                                "uptrain_settings": self.settings.dict(),
-                            },
-                        },
-                    )
-                    response_json = raise_or_return(response)
-                    break
-                except Exception as e:
-                    logger.info("Retrying evaluation request")
-                    if try_num == NUM_TRIES - 1:
-                        logger.error(f"Evaluation failed with error: {e}")
-                        raise e
-
-            if response_json is not None:
-                results.extend(response_json)
-
-        return results
+        # send in chunks, so the connection doesn't time out waiting for the server
+        return self._post_in_chunks(
+            url,
+            data,
+            lambda chunk: {
+                "data": chunk,
+                "checks": ser_checks,
+                "metadata": {
+                    "project": project_name,
+                    "schema": schema.dict(),
+                    **metadata,
+                    "uptrain_settings": self.settings.dict(),
+                },
+            },
+            initial_chunk_size=50,
+            desc="evaluation",
+        )
 
 
     def evaluate_experiments(
@@ -0,0 +1,260 @@
+"""Schedulers used by `OperatorDAG` to execute the nodes of a compute DAG.
+
+The DAG is split into dependency "generations" - sets of nodes whose dependencies
+all lie in earlier generations. Nodes within a generation share no edges, so a
+scheduler is free to run them concurrently.
+"""
+
+from __future__ import annotations
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import typing as t
+
+import polars as pl
+
+from uptrain.operators.base import Operator
+from uptrain.utilities.profiling import NodeProfile, Profiler, profile_node
+
+__all__ = [
+    "Scheduler",
+    "SequentialScheduler",
+    "ThreadScheduler",
+    "ProcessScheduler",
+    "AsyncioScheduler",
+    "get_scheduler",
+]
+
+# a node of a generation, as (operator, input dataframes)
+TYPE_NODE_TASK = t.Tuple[Operator, t.List[t.Union[pl.DataFrame, None]]]
+
+
+# the output of a node, along with its profile if one was asked for
+TYPE_NODE_RESULT = t.Tuple[t.Union[pl.DataFrame, None], t.Union[NodeProfile, None]]
+
+
+def _run_node(
+    node: Operator,
+    inputs: list[pl.DataFrame | None],
+    profile_as: tuple[str, str] | None = None,
+) -> TYPE_NODE_RESULT:
+    """Runs a single operator and returns its output. If `profile_as` is given, as
+    (dag name, node name), the run is profiled too. Defined at the module level so it
+    can be pickled when sent to a process pool."""
+    if profile_as is None:
+        return node.run(*inputs)["output"], None
+
+    with profile_node(*profile_as, node, inputs) as profile:
+        output = node.run(*inputs)["output"]
+        profile.rows_out = len(output) if isinstance(output, pl.DataFrame) else None
+    return output, profile
+
+
+def _collect_results(
+    results: dict[str, TYPE_NODE_RESULT], profiler: Profiler | None
+) -> dict[str, pl.DataFrame | None]:
+    outputs = {}
+    for name, (output, profile) in results.items():
+        outputs[name] = output
+        if profiler is not None and profile is not None:
+            profiler.add(profile)
+    return outputs
+
+
+def _profile_as(
+    profiler: Profiler | None, dag_name: str, node_name: str
+) -> tuple[str, str] | None:
+    return (dag_name, node_name) if profiler is not None else None
+
+
+class Scheduler:
+    """Runs one generation of mutually independent nodes at a time.
+
+    Schedulers are used as context managers by `OperatorDAG.run`, so any pools are
+    created once per DAG run and torn down after the last generation.
+    """
+
+    def __enter__(self) -> "Scheduler":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def run_generation(
+        self,
+        tasks: dict[str, TYPE_NODE_TASK],
+        profiler: Profiler | None = None,
+        dag_name: str = "",
+    ) -> dict[str, pl.DataFrame | None]:
+        """Runs the given nodes, and returns their outputs keyed by node name. If a
+        profiler is passed, the run of each node is recorded to it."""
+        raise NotImplementedError
+
+
+class SequentialScheduler(Scheduler):
+    """Runs the nodes one after another in the calling thread. This is the default."""
+
+    def run_generation(
+        self,
+        tasks: dict[str, TYPE_NODE_TASK],
+        profiler: Profiler | None = None,
+        dag_name: str = "",
+    ) -> dict[str, pl.DataFrame | None]:
+        results = {
+            name: _run_node(node, inputs, _profile_as(profiler, dag_name, name))
+            for name, (node, inputs) in tasks.items()
+        }
+        return _collect_results(results, profiler)
+
+
+class _PoolScheduler(Scheduler):
+    """Runs the nodes of a generation on a `concurrent.futures` executor. Generations
+    with a single node are run in the calling thread to skip the dispatch overhead."""
+
+    max_workers: int | None
+    _executor: Executor | None
+
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers
+        self._executor = None
+
+    def _make_executor(self) -> Executor:
+        raise NotImplementedError
+
+    def __enter__(self) -> "Scheduler":
+        self._executor = self._make_executor()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def run_generation(
+        self,
+        tasks: dict[str, TYPE_NODE_TASK],
+        profiler: Profiler | None = None,
+        dag_name: str = "",
+    ) -> dict[str, pl.DataFrame | None]:
+        if len(tasks) <= 1 or self._executor is None:
+            return SequentialScheduler().run_generation(tasks, profiler, dag_name)
+
+        futures = {
+            name: self._executor.submit(
+                _run_node, node, inputs, _profile_as(profiler, dag_name, name)
+            )
+            for name, (node, inputs) in tasks.items()
+        }
+        return _collect_results(
+            {name: fut.result() for name, fut in futures.items()}, profiler
+        )
+
+
+class ThreadScheduler(_PoolScheduler):
+    """Runs independent nodes on a thread pool. Suited to operators that spend most
+    of their time waiting on the network (LLM calls, embedding APIs) or in native code
+    that releases the GIL (polars, numpy)."""
+
+    def _make_executor(self) -> Executor:
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="uptrain-dag"
+        )
+
+
+class ProcessScheduler(_PoolScheduler):
+    """Runs independent nodes on a process pool. Suited to CPU-bound pure-python
+    operators.
+
+    NOTE: The operators and their inputs are pickled and sent to the workers, so any
+    state an operator sets on itself while running is not visible in the parent
+    process. Workers are started with `spawn` by default, since forking a process
+    with a live polars threadpool can deadlock.
+    """
+
+    mp_context: str
+
+    def __init__(self, max_workers: int | None = None, mp_context: str = "spawn"):
+        super().__init__(max_workers=max_workers)
+        self.mp_context = mp_context
+
+    def _make_executor(self) -> Executor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(self.mp_context),
+        )
+
+
+class AsyncioScheduler(Scheduler):
+    """Runs independent nodes as asyncio tasks, each offloaded to a worker thread, with
+    at most `max_workers` running at once. If an event loop is already running in the
+    calling thread (for ex, inside a notebook), the generation is run on a fresh loop
+    in a separate thread.
+    """
+
+    max_workers: int | None
+
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers
+
+    async def _async_run_generation(
+        self, tasks: dict[str, TYPE_NODE_TASK], dag_name: str | None
+    ) -> dict[str, TYPE_NODE_RESULT]:
+        limit = self.max_workers if self.max_workers is not None else len(tasks)
+        semaphore = asyncio.Semaphore(max(limit, 1))
+
+        async def _run_one(name: str, node: Operator, inputs: list[pl.DataFrame | None]):
+            profile_as = (dag_name, name) if dag_name is not None else None
+            async with semaphore:
+                # like asyncio.to_thread, which needs python 3.9
+                context = contextvars.copy_context()
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, functools.partial(context.run, _run_node, node, inputs, profile_as)
+                )
+
+        outputs = await asyncio.gather(
+            *[_run_one(name, node, inputs) for name, (node, inputs) in tasks.items()]
+        )
+        return dict(zip(tasks.keys(), outputs))
+
+    def run_generation(
+        self,
+        tasks: dict[str, TYPE_NODE_TASK],
+        profiler: Profiler | None = None,
+        dag_name: str = "",
+    ) -> dict[str, pl.DataFrame | None]:
+        if len(tasks) <= 1:
+            return SequentialScheduler().run_generation(tasks, profiler, dag_name)
+
+        profile_dag = dag_name if profiler is not None else None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop and loop.is_running():
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                results = executor.submit(
+                    asyncio.run, self._async_run_generation(tasks, profile_dag)
+                ).result()
+        else:
+            results = asyncio.run(self._async_run_generation(tasks, profile_dag))
+        return _collect_results(results, profiler)
+
+
+def get_scheduler(
+    kind: t.Literal["sequential", "thread", "process", "asyncio"] = "sequential",
+    max_workers: int | None = None,
+) -> Scheduler:
+    """Construct a scheduler by name, as specified in the settings."""
+    if kind == "sequential":
+        return SequentialScheduler()
+    elif kind == "thread":
+        return ThreadScheduler(max_workers=max_workers)
+    elif kind == "process":
+        return ProcessScheduler(max_workers=max_workers)
+    elif kind == "asyncio":
+        return AsyncioScheduler(max_workers=max_workers)
+    else:
+        raise ValueError(f"Unknown DAG scheduler: {kind}")
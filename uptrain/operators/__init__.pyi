@@ -77,6 +77,10 @@ __all__ = [
     "JsonWriter",
     "DeltaReader",
     "DeltaWriter",
+    "ParquetReader",
+    "ParquetWriter",
+    "ArrowIpcReader",
+    "ArrowIpcWriter",
     "BigQueryReader",
     "MongoDBReader",
     "DuckDBReader",
@@ -155,7 +159,17 @@ from .language.topic import TopicAssignmentviaCluster
 from .language.jailbreak import JailbreakDetectionScore
 
 from . import io
-from .io.base import CsvReader, JsonReader, DeltaReader, JsonWriter, DeltaWriter
+from .io.base import (
+    CsvReader,
+    JsonReader,
+    DeltaReader,
+    JsonWriter,
+    DeltaWriter,
+    ParquetReader,
+    ParquetWriter,
+    ArrowIpcReader,
+    ArrowIpcWriter,
+)
 from .io.excel import ExcelReader
 from .io.bq import BigQueryReader, BigQueryWriter
 from .io.mongodb import MongoDBReader
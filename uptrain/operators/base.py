@@ -107,8 +107,13 @@ class OpBaseModel(BaseModel):
 class ColumnOp(OpBaseModel):
     """Represents operations that append columns to the input dataset, and
     return it as is.
+
+    Set `is_rowwise` to False for operators whose output for a row depends on the
+    other rows (clustering, drift, etc.), so incremental runs recompute them in full.
     """
 
+    is_rowwise: t.ClassVar[bool] = True
+
     def setup(self, settings: "Settings"):
         raise NotImplementedError
 
@@ -37,6 +37,16 @@ class Clustering(ColumnOp):
         col_out (str):  The name of the column in the DataFrame to output the assigned cluster index.
         col_out_dist (str): The name of the column in the DataFrame to output the euclidean distance from its cluster centroid.
         col_aggs (list[str]): Optional, can be used to specify name of columns to aggregate by and run individual clustering, ex: if you want separate clustering for seperate organisations
+        backend (Literal["nltk", "minibatch"]): Implementation of kmeans to use. `nltk` runs nltk's
+            `KMeansClusterer`, which is pure python and only suited to a few thousand rows. `minibatch`
+            runs mini-batch spherical kmeans in numpy, and supports `partial_fit`.
+        batch_size (int): Number of rows in each mini-batch, for the `minibatch` backend.
+        max_iter (int): Maximum number of passes over the data, for the `minibatch` backend.
+        seed (int): Seed for the initial centroids and mini-batches, for the `minibatch` backend.
+
+    Both backends cluster by cosine distance. The reported centroids are the mean embedding of
+    the rows assigned to each cluster, and the distance is the euclidean distance to it.
+
     Example:
         ```
         import polars as pl
@@ -60,8 +70,19 @@ class Clustering(ColumnOp):
         # Get the output DataFrame
         assigned_clusters = output["output"]
         ```
+
+    To fit the `minibatch` backend on a dataset that doesn't fit in memory, stream it through
+    `partial_fit` first. `run` then assigns rows to the fitted clusters, instead of refitting.
+
+        ```
+        op = Clustering(backend="minibatch", col_in="embedding").setup(settings)
+        for batch in JsonReader(fpath=..., batch_size=10_000).setup(settings).iter_batches():
+            op.partial_fit(batch)
+        ```
     """
 
+    is_rowwise: t.ClassVar[bool] = False
+
     algorithm: str = 'kmeans'
     n_clusters: int = 40
     col_in: str = 'umap_embedding'
@@ -69,13 +90,20 @@ class Clustering(ColumnOp):
     col_out_dist: str = 'cluster_index_distance'
     col_aggs: list[str] = []
     min_samples_each_cluster: int = 50
+    backend: t.Literal["nltk", "minibatch"] = "nltk"
+    batch_size: int = 1024
+    max_iter: int = 100
+    seed: int = 42
+    _models: dict
 
     def setup(self, settings: Settings):
+        if self.algorithm != "kmeans":
+            raise Exception(f"{self.algorithm} is not supported yet.")
+        self._models = {}
         return self
 
-    def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:      
-
-        self.cluster_centroids = {}
+    def _iter_subsets(self, data: pl.DataFrame) -> t.Iterator[tuple[t.Any, pl.DataFrame]]:
+        """Yields the rows for each unique value of the aggregation columns."""
         unique_agg_keys = ['default']
 
         if len(self.col_aggs):
@@ -84,27 +112,67 @@ class Clustering(ColumnOp):
             agg_data = agg_data.drop("num_rows_" + self.col_in)
             unique_agg_keys = agg_data.to_dicts()
 
-        res_data_arr = []
         for unique_agg_key in unique_agg_keys:
             cond = True
             if isinstance(unique_agg_key, dict):
                 unique_agg_key = dict([(key, unique_agg_key[key]) for key in sorted(unique_agg_key)])
                 for key,val in unique_agg_key.items():
                     cond = cond & (data[key] == val)
-            data_subset = data.filter(cond)
+            yield unique_agg_key, data.filter(cond)
 
-            n_clusters = max(1, min(self.n_clusters, int(len(data_subset)/self.min_samples_each_cluster)))
+    def _num_clusters(self, num_rows: int) -> int:
+        return max(1, min(self.n_clusters, int(num_rows/self.min_samples_each_cluster)))
 
-            if self.algorithm == "kmeans":
-                algorithm_obj = nltk.cluster.KMeansClusterer(n_clusters, distance=nltk.cluster.util.cosine_distance, avoid_empty_clusters=True)
+    def partial_fit(self, data: pl.DataFrame) -> "Clustering":
+        """Update the clusters with a batch of rows, for the `minibatch` backend. The number of
+        clusters for each aggregation key is picked from the first batch it appears in."""
+        if self.backend != "minibatch":
+            raise ValueError("partial_fit is only supported by the `minibatch` backend.")
+        for unique_agg_key, data_subset in self._iter_subsets(data):
+            model = self._models.get(str(unique_agg_key))
+            if model is None:
+                model = MiniBatchSphericalKMeans(
+                    self._num_clusters(len(data_subset)),
+                    batch_size=self.batch_size,
+                    max_iter=self.max_iter,
+                    seed=self.seed,
+                )
+                self._models[str(unique_agg_key)] = model
+            model.partial_fit(stack_embeddings(data_subset[self.col_in]))
+        return self
+
+    def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:      
+
+        self.cluster_centroids = {}
+        res_data_arr = []
+        for unique_agg_key, data_subset in self._iter_subsets(data):
+            n_clusters = self._num_clusters(len(data_subset))
+
+            if self.backend == "minibatch":
+                embeddings = stack_embeddings(data_subset[self.col_in])
+                model = self._models.get(str(unique_agg_key))
+                if model is None:
+                    model = MiniBatchSphericalKMeans(
+                        n_clusters, batch_size=self.batch_size, max_iter=self.max_iter, seed=self.seed
+                    ).fit(embeddings)
+                assigned_clusters, means, scores = assign_to_mean_centroids(
+                    embeddings, model.predict(embeddings)
+                )
+                assigned_means = [[round(y, 8) for y in list(x)] for x in means.astype(np.float64)]
             else:
-                raise Exception(f"{self.algorithm} is not supported yet.")
+                algorithm_obj = nltk.cluster.KMeansClusterer(n_clusters, distance=nltk.cluster.util.cosine_distance, avoid_empty_clusters=True)
+
+                embeddings = np.asarray(data_subset[self.col_in])
+                assigned_clusters = algorithm_obj.cluster(embeddings, assign_clusters=True)
+                scores = []
+                for index in range(len(embeddings)):
+                    scores.append(np.linalg.norm(embeddings[index] - algorithm_obj.means()[assigned_clusters[index]]))
 
-            embeddings = np.asarray(data_subset[self.col_in])
-            assigned_clusters = algorithm_obj.cluster(embeddings, assign_clusters=True)
-            scores = []
-            for index in range(len(embeddings)):
-                scores.append(np.linalg.norm(embeddings[index] - algorithm_obj.means()[assigned_clusters[index]]))
+                unique_assigned_clusters = np.unique(np.array(assigned_clusters))
+                all_means = [list(x.astype(np.float64)) for x in list(algorithm_obj.means())]
+                assigned_means = []
+                for clus_idx in unique_assigned_clusters:
+                    assigned_means.append([round(y, 8) for y in all_means[clus_idx]])
 
             data_subset = data_subset.with_columns([
                         pl.Series(assigned_clusters).alias(self.col_out),
@@ -112,11 +180,6 @@ class Clustering(ColumnOp):
                         pl.Series([str(unique_agg_key)] * len(data_subset)).alias("_unique_agg_key_for_clustering")
                 ])
             res_data_arr.append(data_subset)
-            unique_assigned_clusters = np.unique(np.array(assigned_clusters))
-            all_means = [list(x.astype(np.float64)) for x in list(algorithm_obj.means())]
-            assigned_means = []
-            for clus_idx in unique_assigned_clusters:
-                assigned_means.append([round(y, 8) for y in all_means[clus_idx]])
             self.cluster_centroids[str(unique_agg_key)] = assigned_means
 
         return {
@@ -125,3 +188,160 @@ class Clustering(ColumnOp):
         }
 
 
+# -----------------------------------------------------------
+# Mini-batch spherical kmeans
+# -----------------------------------------------------------
+
+
+def stack_embeddings(series: pl.Series) -> np.ndarray:
+    """Stack a column of equal length embeddings into a float32 matrix."""
+    if isinstance(series.dtype, pl.Array):
+        series = series.cast(pl.List(series.dtype.inner))  # type: ignore
+    flat = series.explode().cast(pl.Float32).to_numpy()
+    if len(series) and len(flat) % len(series):
+        raise ValueError(f"All embeddings in column: {series.name} must have the same length.")
+    return np.ascontiguousarray(flat, dtype=np.float32).reshape(len(series), -1)
+
+
+def _normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms > 0, norms, 1.0)
+
+
+def assign_to_mean_centroids(
+    embeddings: np.ndarray, labels: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Renumber the clusters that have rows as 0..n-1, in order of their original index, and
+    compute the mean embedding of each and the euclidean distance of each row from its mean.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The new labels, the means and the distances.
+    """
+    used, labels = np.unique(labels, return_inverse=True)
+    counts = np.bincount(labels, minlength=len(used)).astype(np.float64)
+    order = np.argsort(labels, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts[:-1])]).astype(np.int64)
+    sums = np.add.reduceat(embeddings[order].astype(np.float64), starts, axis=0)
+    means = sums / counts[:, None]
+    distances = np.linalg.norm(embeddings - means[labels], axis=1)
+    return labels, means, distances
+
+
+class MiniBatchSphericalKMeans:
+    """Kmeans with cosine distance, trained on mini-batches of rows.
+
+    Rows and centroids are normalized to unit length, so the nearest centroid is the one with
+    the highest dot product - a single matrix product for a chunk of rows against all the
+    centroids. Centroids are initialized with kmeans++, and updated after each mini-batch with
+    a per-centroid learning rate of 1 / (number of rows assigned to it so far).
+
+    Attributes:
+        n_clusters (int): Number of clusters.
+        batch_size (int): Number of rows in each mini-batch.
+        max_iter (int): Maximum number of passes over the data in `fit`.
+        tol (float): `fit` stops early once no centroid moves by more than this, in a pass.
+        seed (int | None): Seed for the initialization and the order of the mini-batches.
+        chunk_size (int): Number of rows to assign at a time, to bound memory.
+        centroids (np.ndarray | None): Unit length centroids, of shape (n_clusters, dim).
+        counts (np.ndarray | None): Number of rows that have updated each centroid.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int,
+        batch_size: int = 1024,
+        max_iter: int = 100,
+        tol: float = 1e-4,
+        seed: int | None = None,
+        chunk_size: int = 8192,
+    ):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.tol = tol
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.centroids = None
+        self.counts = None
+        self._rng = np.random.default_rng(seed)
+
+    def _init_centroids(self, unit_rows: np.ndarray) -> None:
+        """kmeans++ - pick each next centroid with probability proportional to its cosine
+        distance from the nearest centroid picked so far."""
+        # a sample is plenty to seed the centroids, and keeps this linear in n_clusters
+        sample_size = min(len(unit_rows), max(3 * self.batch_size, 10 * self.n_clusters))
+        sample = unit_rows[self._rng.choice(len(unit_rows), sample_size, replace=False)]
+        n_clusters = min(self.n_clusters, len(sample))
+
+        centroids = np.empty((n_clusters, unit_rows.shape[1]), dtype=np.float32)
+        centroids[0] = sample[self._rng.integers(len(sample))]
+        min_dist = np.maximum(1.0 - sample @ centroids[0], 0.0)
+        for i in range(1, n_clusters):
+            total = min_dist.sum()
+            if total > 0:
+                idx = self._rng.choice(len(sample), p=min_dist / total)
+            else:  # fewer distinct rows than clusters
+                idx = self._rng.integers(len(sample))
+            centroids[i] = sample[idx]
+            min_dist = np.minimum(min_dist, np.maximum(1.0 - sample @ centroids[i], 0.0))
+
+        self.centroids = centroids
+        self.counts = np.zeros(n_clusters, dtype=np.float64)
+
+    def _update(self, unit_batch: np.ndarray) -> float:
+        """Move the centroids towards the rows of a mini-batch assigned to them. Returns the
+        largest distance a centroid moved."""
+        assert self.centroids is not None and self.counts is not None
+        labels = np.argmax(unit_batch @ self.centroids.T, axis=1)
+        batch_counts = np.bincount(labels, minlength=len(self.centroids))
+        # sum the rows of each cluster as a product with the one-hot assignments
+        one_hot = np.zeros((len(unit_batch), len(self.centroids)), dtype=np.float32)
+        one_hot[np.arange(len(unit_batch)), labels] = 1.0
+        sums = one_hot.T @ unit_batch
+
+        updated = batch_counts > 0
+        self.counts[updated] += batch_counts[updated]
+        rate = (batch_counts[updated] / self.counts[updated])[:, None]
+        old = self.centroids[updated]
+        new = (1 - rate) * old + rate * (sums[updated] / batch_counts[updated][:, None])
+        new = _normalize_rows(new).astype(np.float32)
+        self.centroids[updated] = new
+        return float(np.max(np.linalg.norm(new - old, axis=1))) if updated.any() else 0.0
+
+    def partial_fit(self, embeddings: np.ndarray) -> "MiniBatchSphericalKMeans":
+        """Update the centroids with one more batch of rows, in mini-batches of `batch_size`."""
+        unit_rows = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        if not len(unit_rows):
+            return self
+        if self.centroids is None:
+            self._init_centroids(unit_rows)
+        for start in range(0, len(unit_rows), self.batch_size):
+            self._update(unit_rows[start : start + self.batch_size])
+        return self
+
+    def fit(self, embeddings: np.ndarray) -> "MiniBatchSphericalKMeans":
+        """Fit the centroids with up to `max_iter` shuffled passes over the rows."""
+        unit_rows = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        if not len(unit_rows):
+            return self
+        self._init_centroids(unit_rows)
+        for _ in range(self.max_iter):
+            order = self._rng.permutation(len(unit_rows))
+            shift = 0.0
+            for start in range(0, len(order), self.batch_size):
+                batch = unit_rows[order[start : start + self.batch_size]]
+                shift = max(shift, self._update(batch))
+            if shift <= self.tol:
+                break
+        return self
+
+    def predict(self, embeddings: np.ndarray) -> np.ndarray:
+        """Index of the nearest centroid for each row, assigning `chunk_size` rows at a time."""
+        assert self.centroids is not None, "The model must be fit before predicting"
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        labels = np.empty(len(embeddings), dtype=np.int64)
+        for start in range(0, len(embeddings), self.chunk_size):
+            chunk = embeddings[start : start + self.chunk_size]
+            # normalizing the rows doesn't change the argmax, so skip it
+            labels[start : start + self.chunk_size] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return labels
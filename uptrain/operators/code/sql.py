@@ -4,6 +4,7 @@ Implement oeprators over sql data.
 
 from __future__ import annotations
 
+import functools
 import itertools
 import json
 import os
@@ -13,11 +14,13 @@ from pydantic import BaseModel
 import polars as pl
 
 from uptrain.utilities import lazy_load_dep
+from uptrain.utilities.cache import SqliteCache, get_cache_dir, hash_key
 from uptrain.utilities.sql_utils import (
-    extract_tables_and_columns,
-    extract_tables_and_columns_from_create,
     PLACEHOLDER_TABLE,
-    execute_and_compare_sql,
+    execute_and_compare_sql_batch,
+    parse_batch,
+    parse_create_statements,
+    parse_sql_tables,
 )
 
 if t.TYPE_CHECKING:
@@ -34,43 +37,78 @@ class Table(BaseModel):
     columns: list
 
 
+def _get_parse_cache(settings: t.Optional[Settings]) -> t.Optional[SqliteCache]:
+    if settings is None or not settings.sql_parse_cache:
+        return None
+    return SqliteCache(
+        os.path.join(get_cache_dir(settings.logs_folder), "sql_parse.sqlite"),
+        max_entries=settings.sql_parse_cache_max_entries,
+    )
+
+
+def _parse_with_cache(
+    cache: t.Optional[SqliteCache],
+    kind: str,
+    dialect: t.Optional[str],
+    texts: list,
+    parse_fn: t.Callable,
+    num_workers: t.Optional[int],
+    chunk_size: int,
+) -> list:
+    """Looks up the parse of each distinct text in the cache, and parses (and caches) the rest."""
+    unique_texts = list(dict.fromkeys(texts))
+    keys = {text: hash_key([kind, dialect, text]) for text in unique_texts}
+    found = cache.get_many(list(keys.values())) if cache is not None else {}
+    results = {text: json.loads(found[key]) for text, key in keys.items() if key in found}
+
+    misses = [text for text in unique_texts if text not in results]
+    if len(misses):
+        parsed = parse_batch(parse_fn, misses, num_workers=num_workers, chunk_size=chunk_size)
+        results.update(zip(misses, parsed))
+        if cache is not None:
+            cache.set_many({keys[text]: json.dumps(value) for text, value in zip(misses, parsed)})
+    return [results[text] for text in texts]
+
+
 @register_op
 class ParseCreateStatements(TransformOp):
     """
     Read tables and columns from ";" separated CREATE TABLE statements and writes a json dictionary Table -> [columns].
 
+    Each distinct schema is parsed once, and the result is cached across runs under the logs folder (see
+    `Settings.sql_parse_cache`).
+
     Attributes:
         col_in_schema_def (str): Column name of schema def containing CREATE TABLE statements.
         col_out_tables (str): Column to write parsed tables and columns.
+        dialect (str): SQL dialect of the statements, as named by sqlglot.
+        num_workers (int): Number of processes to parse large inputs with. Defaults to the cpu count.
+        chunk_size (int): Number of schemas sent to a worker at a time.
 
     """
 
     col_in_schema_def: str
     col_out_tables: str
+    dialect: str = "sqlite"
+    num_workers: t.Optional[int] = None
+    chunk_size: int = 500
+    _cache: t.Optional[SqliteCache] = None
 
     def setup(self, settings: Settings):
+        self._cache = _get_parse_cache(settings)
         return self
 
-    def __fetch_tables_columns(self, create_statements) -> t.Tuple(str, str, str):
-        tables_and_columns = {}
-        # SQL statements are separated by ';'
-        statements = create_statements.split(";")
-
-        # Create table statements
-        for statement in statements:
-            if statement.upper().strip().startswith("CREATE TABLE"):
-                # Add the statement to the list
-                statement = statement.strip()
-                # TODO: handle input database dialect instead of assuming it.
-                parsed = sqlglot.parse(statement, read=sqlglot.Dialects.SQLITE)
-                table, columns = extract_tables_and_columns_from_create(parsed[0])
-                tables_and_columns[table] = list(columns)
-
-        return json.dumps(tables_and_columns)
-
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
-        schemas = data.get_column(self.col_in_schema_def)
-        tables = [self.__fetch_tables_columns(schema) for schema in schemas]
+        schemas = data.get_column(self.col_in_schema_def).to_list()
+        tables = _parse_with_cache(
+            self._cache,
+            "create",
+            self.dialect,
+            schemas,
+            functools.partial(parse_create_statements, dialect=self.dialect),
+            self.num_workers,
+            self.chunk_size,
+        )
         return {"output": data.with_columns([pl.Series(self.col_out_tables, tables)])}
 
 
@@ -81,39 +119,46 @@ class ParseSQL(TransformOp):
     Note that we don't use table schema definition to do this but instead simply parse the SQL. Output might have a
     placeholder table to include columns that are accessed without a table descriptor.
 
+    Each distinct statement is parsed once, and the result is cached across runs under the logs folder (see
+    `Settings.sql_parse_cache`).
+
     This is typically used along with ValidateTables to validate tables and columns in the predicted SQL.
 
     Attributes:
         col_in_sql (str): Column of input SQL containing SQL SELECT statement.
         col_out_tables (str): Column to write parsed tables and columns.
         col_out_is_valid_sql (str): Column to store if sql is valid as per sql parser.
+        dialect (str): SQL dialect of the statements, as named by sqlglot. None for sqlglot's default dialect.
+        num_workers (int): Number of processes to parse large inputs with. Defaults to the cpu count.
+        chunk_size (int): Number of statements sent to a worker at a time.
 
     """
 
     col_in_sql: str
     col_out_tables: str
     col_out_is_valid_sql: str
+    dialect: t.Optional[str] = None
+    num_workers: t.Optional[int] = None
+    chunk_size: int = 500
+    _cache: t.Optional[SqliteCache] = None
 
     def setup(self, settings: Settings):
+        self._cache = _get_parse_cache(settings)
         return self
 
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
-        sqls = data.get_column(self.col_in_sql)
-        tables = []
-        is_valid = []
-        for sql in sqls:
-            try:
-                # TODO: parse using expected dialect
-                parsed = sqlglot.parse(sql)
-                tables_and_columns = extract_tables_and_columns(parsed[0])
-                # Since sets are not serializable, convert to list
-                for table, columns in tables_and_columns.items():
-                    tables_and_columns[table] = list(columns)
-                tables.append(json.dumps(tables_and_columns))
-                is_valid.append(True)
-            except sqlglot.errors.ParseError:
-                tables.append(json.dumps({}))
-                is_valid.append(False)
+        sqls = data.get_column(self.col_in_sql).to_list()
+        results = _parse_with_cache(
+            self._cache,
+            "sql",
+            self.dialect,
+            sqls,
+            functools.partial(parse_sql_tables, dialect=self.dialect),
+            self.num_workers,
+            self.chunk_size,
+        )
+        tables = [tables for tables, _ in results]
+        is_valid = [is_valid for _, is_valid in results]
 
         return {
             "output": data.with_columns(
@@ -210,6 +255,13 @@ class ExecuteAndCompareSQL(TransformOp):
         col_out_execution_accuracy (str): Column to store if columns are valid.
         ignore_column_order (bool): Boolean param to ignore column order when comparing SQL output. True by default.
         ignore_row_order (bool): Boolean param to ignore row order when comparing SQL output. True by default.
+        query_timeout (float): Seconds after which a query is interrupted and counted as failed. None for no limit.
+        max_rows (int): Queries returning more rows than this are counted as failed. None for no limit.
+        num_workers (int): Number of processes to execute large inputs with. Defaults to the cpu count.
+        chunk_size (int): Number of rows of a database sent to a worker at a time.
+        streaming (bool): Compare fingerprints of the query results computed while reading them, instead of loading
+            both results in memory. Rows are compared in order only if row order isn't ignored and the ground truth
+            query has an ORDER BY.
 
     """
 
@@ -219,25 +271,31 @@ class ExecuteAndCompareSQL(TransformOp):
     col_out_execution_accuracy: str
     ignore_column_order: bool = True
     ignore_row_order: bool = True
+    query_timeout: t.Optional[float] = 30.0
+    max_rows: t.Optional[int] = None
+    num_workers: t.Optional[int] = None
+    chunk_size: int = 200
+    streaming: bool = False
 
     def setup(self, settings: Settings):
         return self
 
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
-        response_sqls = data.get_column(self.col_in_response_sql)
-        gt_sqls = data.get_column(self.col_in_gt_sql)
-        db_paths = data.get_column(self.col_in_db_path)
-        results = []
-        for response_sql, gt_sql, db_path in zip(response_sqls, gt_sqls, db_paths):
-            results.append(
-                execute_and_compare_sql(
-                    response_sql,
-                    gt_sql,
-                    db_path,
-                    ignore_column_order=self.ignore_column_order,
-                    ignore_row_order=self.ignore_row_order,
-                )
-            )
+        response_sqls = data.get_column(self.col_in_response_sql).to_list()
+        gt_sqls = data.get_column(self.col_in_gt_sql).to_list()
+        db_paths = data.get_column(self.col_in_db_path).to_list()
+        results = execute_and_compare_sql_batch(
+            response_sqls,
+            gt_sqls,
+            db_paths,
+            ignore_column_order=self.ignore_column_order,
+            ignore_row_order=self.ignore_row_order,
+            timeout=self.query_timeout,
+            max_rows=self.max_rows,
+            num_workers=self.num_workers,
+            chunk_size=self.chunk_size,
+            streaming=self.streaming,
+        )
         return {
             "output": data.with_columns(
                 [pl.Series(self.col_out_execution_accuracy, results)]
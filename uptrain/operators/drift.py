@@ -114,6 +114,8 @@ class ConceptDrift(ColumnOp):
         ```
     """
 
+    is_rowwise: t.ClassVar[bool] = False
+
     algorithm: t.Literal["DDM", "ADWIN"]
     params: t.Union[ParamsDDM, ParamsADWIN]
     col_in_measure: str = "metric"
@@ -20,10 +20,11 @@ from pydantic import root_validator
 if t.TYPE_CHECKING:
     from uptrain.framework import Settings
 from uptrain.operators.base import *
+from uptrain.operators.language.rouge import rouge_l_scores
+from uptrain.operators.similarity import cosine_similarity_columns
 from uptrain.utilities import lazy_load_dep
 
 umap = lazy_load_dep("umap", "umap-learn")
-rouge_scorer = lazy_load_dep("rouge_score.rouge_scorer", "rouge_score")
 
 
 @register_op
@@ -36,6 +37,13 @@ class Distribution(TransformOp):
         col_in_embs (list[str]): The input columns containing embeddings.
         col_in_groupby (list[str]): The columns to group by.
         col_out (list[str] | None): The output columns. If None, automatically generated column names will be used.
+        num_pairs_per_group (int): The number of pairs of rows to sample from each group.
+        seed (int | None): Seed for sampling the pairs, for reproducible outputs.
+        num_workers (int | None): Number of processes to score rouge pairs with. Defaults to the cpu count.
+
+    Pairs are sampled for all groups at once, and each pair is scored on every input column.
+    Cosine similarities are computed in batches over the stacked vectors, and Rouge-L f1
+    scores with the tokenizer shared by `RougeScore`.
 
     Raises:
         AssertionError: If the number of output columns does not match the number of input embedding columns.
@@ -91,6 +99,9 @@ class Distribution(TransformOp):
     col_in_embs: list[str]
     col_in_groupby: list[str]
     col_out: list[str] | None = None
+    num_pairs_per_group: int = 10
+    seed: t.Optional[int] = None
+    num_workers: t.Optional[int] = None
 
     @root_validator(pre=True)
     def _check_cols(cls, values):
@@ -107,18 +118,14 @@ class Distribution(TransformOp):
             AssertionError: If the number of output columns does not match the number of input embedding columns.
 
         """
-        if values["col_out"] is not None:
+        if values.get("col_out") is not None:
             assert len(values["col_out"]) == len(
                 values["col_in_embs"]
             ), "Distribution Op needs as many output columns as input embedding columns"
         return values
 
     def setup(self, settings: Settings):
-        if self.kind == "cosine_similarity":
-            self._agg_func = get_cosine_sim_dist
-        elif self.kind == "rouge":
-            self._agg_func = get_rouge_score
-        else:
+        if self.kind not in ("cosine_similarity", "rouge"):
             raise NotImplementedError(
                 f"Similarity metric: {self.kind} not supported for now."
             )
@@ -130,16 +137,41 @@ class Distribution(TransformOp):
         else:
             agg_cols = self.col_out
 
-        dist_df = (
-            data.groupby(self.col_in_groupby, maintain_order=True)
-            .agg(
-                [
-                    pl.col(_col_in).apply(self._agg_func).alias(_col_out)
-                    for _col_in, _col_out in zip(self.col_in_embs, agg_cols)
-                ]
-            )
-            .explode(agg_cols)
+        # row indices of each group, with the groups in order of first appearance
+        groups = (
+            data.select(self.col_in_groupby)
+            .with_columns(pl.Series("__row_idx", np.arange(len(data))))
+            .group_by(self.col_in_groupby, maintain_order=True)
+            .agg(pl.col("__row_idx"))
         )
+        group_rows = groups.get_column("__row_idx")
+        rows_1, rows_2 = sample_pairs_in_groups(
+            group_rows.list.len().to_numpy(),
+            group_rows.explode().to_numpy(),
+            self.num_pairs_per_group,
+            np.random.default_rng(self.seed),
+        )
+
+        # one output row per sampled pair, the same pairs are used for every column
+        group_idx = np.repeat(np.arange(len(groups)), self.num_pairs_per_group)
+        dist_df = groups.drop("__row_idx")[group_idx]
+        for col_in, col_out in zip(self.col_in_embs, agg_cols):
+            values = data.get_column(col_in)
+            if self.kind == "cosine_similarity":
+                scores = pl.Series(
+                    col_out,
+                    cosine_similarity_columns(values.gather(rows_1), values.gather(rows_2)),
+                    nan_to_null=True,
+                )
+            else:
+                texts = values.to_list()
+                f1 = rouge_l_scores(
+                    [texts[i] for i in rows_2],
+                    [texts[i] for i in rows_1],
+                    num_workers=self.num_workers,
+                )[:, 2]
+                scores = pl.Series(col_out, (f1 * 100).astype(np.int64))
+            dist_df = dist_df.with_columns(scores)
         return {"output": dist_df}
 
 
@@ -189,6 +221,8 @@ class UMAP(ColumnOp):
 
     """
 
+    is_rowwise: t.ClassVar[bool] = False
+
     col_in_embs: str = 'embedding'
     n_components: int = 6
     col_out: str = 'umap_embedding' 
@@ -213,70 +247,33 @@ class UMAP(ColumnOp):
 # -----------------------------------------------------------
 
 
-def sample_pairs_from_values(n_values: int, n_pairs: int):
-    """
-    Sample pairs of indices from a given number of values.
-
-    Args:
-        n_values (int): The total number of values.
-        n_pairs (int): The number of pairs to sample.
-
-    Returns:
-        Tuple[np.ndarray, np.ndarray]: The sampled pairs of indices.
-
-    """
-    indices_1 = np.random.choice(n_values, n_pairs)
-    indices_2 = np.random.choice(n_values, n_pairs)
-    invalid = indices_1 == indices_2
-    indices_2[invalid] = (indices_2[invalid] + 1) % n_values
-    return indices_1, indices_2
-
-
-def get_cosine_sim_dist(col_vectors: pl.Series, num_pairs_per_group: int = 10):
-    """
-    Compute cosine similarity distances between pairs of vectors.
-
-    Args:
-        col_vectors (pl.Series): The column containing the vectors.
-        num_pairs_per_group (int): The number of pairs to sample per group.
-
-    Returns:
-        List[float]: The computed cosine similarity distances.
-
-    """
-    array_vectors = col_vectors.to_numpy()
-    indices_1, indices_2 = sample_pairs_from_values(
-        len(array_vectors), num_pairs_per_group
-    )
-    values = []
-    for i1, i2 in zip(indices_1, indices_2):
-        v1 = array_vectors[i1]
-        v2 = array_vectors[i2]
-        values.append(np.dot(v1, v2) / np.linalg.norm(v1) * np.linalg.norm(v2))
-    return values
-
-
-def get_rouge_score(col_vectors: pl.Series, num_pairs_per_group: int = 10):
+def sample_pairs_in_groups(
+    group_sizes: np.ndarray,
+    group_rows: np.ndarray,
+    num_pairs_per_group: int,
+    rng: np.random.Generator,
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    Compute ROUGE scores between pairs of vectors.
+    Sample pairs of distinct rows within each group, all groups at once.
 
     Args:
-        col_vectors (pl.Series): The column containing the vectors.
+        group_sizes (np.ndarray): The number of rows in each group.
+        group_rows (np.ndarray): The row indices of all groups, concatenated in group order.
         num_pairs_per_group (int): The number of pairs to sample per group.
+        rng (np.random.Generator): The random number generator to sample with.
 
     Returns:
-        List[int]: The computed ROUGE scores.
+        Tuple[np.ndarray, np.ndarray]: The row indices of the sampled pairs, `num_pairs_per_group`
+            consecutive pairs for each group. Groups with a single row pair it with itself.
 
     """
-    array_vectors = col_vectors.to_numpy()
-    indices_1, indices_2 = sample_pairs_from_values(
-        len(array_vectors), num_pairs_per_group
-    )
-    values = []
-    for i1, i2 in zip(indices_1, indices_2):
-        v1 = array_vectors[i1]
-        v2 = array_vectors[i2]
-
-        scorer = rouge_scorer.RougeScorer(["rougeL"])  # type: ignore
-        values.append(int(scorer.score(v1, v2)["rougeL"][2] * 100))
-    return values
+    sizes = np.asarray(group_sizes, dtype=np.int64)[:, None]
+    starts = np.cumsum(sizes) - sizes.ravel()
+    shape = (len(sizes), num_pairs_per_group)
+    offsets_1 = rng.integers(0, sizes, size=shape)
+    offsets_2 = rng.integers(0, sizes, size=shape)
+    same = offsets_1 == offsets_2
+    offsets_2[same] = ((offsets_2 + 1) % sizes)[same]
+    rows_1 = group_rows[(starts[:, None] + offsets_1).ravel()]
+    rows_2 = group_rows[(starts[:, None] + offsets_2).ravel()]
+    return rows_1, rows_2
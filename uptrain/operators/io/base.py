@@ -1,6 +1,8 @@
 """Basic IO operators for reading and writing data from Uptrain."""
 
 from __future__ import annotations
+import io
+import os
 import typing as t
 
 import polars as pl
@@ -35,6 +37,10 @@ class CsvReader(TransformOp):
     def run(self) -> TYPE_TABLE_OUTPUT:
         return {"output": self._executor.run()}
 
+    def iter_batches(self) -> t.Iterator[pl.DataFrame]:
+        """Yields the file as dataframes of at most `batch_size` rows."""
+        return self._executor.iter_batches()
+
 
 @register_op
 class JsonReader(TransformOp):
@@ -56,41 +62,115 @@ class JsonReader(TransformOp):
     def run(self) -> TYPE_TABLE_OUTPUT:
         return {"output": self._executor.run()}
 
+    def iter_batches(self) -> t.Iterator[pl.DataFrame]:
+        """Yields the file as dataframes of at most `batch_size` rows."""
+        return self._executor.iter_batches()
+
 
 class TextReaderExecutor:
+    """Reads a csv or ndjson file, either whole or in batches.
+
+    The schema comes from a lazy scan of the head of the file, so every batch has the
+    same column types as a full read. Batches are read forward from an open file
+    handle, holding only the raw lines of the current batch in memory - slicing a lazy
+    scan at an offset re-parses the file from the start on every call, so both its time
+    and memory grow with the offset.
+    """
+
     op: t.Union[CsvReader, JsonReader]
-    dataset: pl.DataFrame
     rows_read: int
+    _schema: dict[str, t.Any]
+    _batches: t.Optional[t.Iterator[pl.DataFrame]]
 
     def __init__(self, op: t.Union[CsvReader, JsonReader]):
         self.op = op
         self.rows_read = 0
-        if isinstance(self.op, CsvReader):
-            self.dataset = pl.read_csv(self.op.fpath)
-        elif isinstance(self.op, JsonReader):
-            self.dataset = pl.read_ndjson(self.op.fpath)
-            null_count = self.dataset.null_count().to_dicts()[0]
-            for _, value in null_count.items():
-                if value == self.dataset.shape[0]:
-                    ## read from pandas
-                    pd_df = pd.read_json(self.op.fpath, lines=True)
-                    self.dataset = pl.DataFrame(pd_df)
-                    break
+        self._schema = dict(self._scan().schema)
+        self._batches = None
 
     @property
     def is_incremental(self) -> bool:
         return self.op.batch_size is not None
 
+    @property
+    def is_csv(self) -> bool:
+        return isinstance(self.op, CsvReader)
+
+    def _scan(self) -> pl.LazyFrame:
+        if self.is_csv:
+            return pl.scan_csv(self.op.fpath)
+        else:
+            return pl.scan_ndjson(self.op.fpath)
+
+    @staticmethod
+    def _has_null_column(dataset: pl.DataFrame) -> bool:
+        null_count = dataset.null_count().to_dicts()[0]
+        return any(value == dataset.shape[0] for value in null_count.values())
+
+    def _read_all(self) -> pl.DataFrame:
+        dataset = self._scan().collect()
+        if not self.is_csv and self._has_null_column(dataset):
+            ## read from pandas
+            pd_df = pd.read_json(self.op.fpath, lines=True)
+            dataset = pl.DataFrame(pd_df)
+        return dataset
+
+    def _parse(self, header: bytes, lines: list[bytes]) -> pl.DataFrame:
+        buffer = io.BytesIO(header + b"".join(lines))
+        if self.is_csv:
+            return pl.read_csv(buffer, schema=self._schema)
+        batch = pl.read_ndjson(buffer, schema=self._schema)
+        if len(batch) and self._has_null_column(batch):
+            # same fallback as a full read, for the batch. Columns that are null throughout
+            # the batch keep the file's type, so batches can still be concatenated
+            buffer.seek(0)
+            batch = pl.DataFrame(pd.read_json(buffer, lines=True))
+            batch = batch.with_columns(
+                [
+                    pl.lit(None, dtype=self._schema[name]).alias(name)
+                    for name in batch.columns
+                    if name in self._schema and batch[name].null_count() == len(batch)
+                ]
+            )
+        return batch
+
+    def iter_batches(self) -> t.Iterator[pl.DataFrame]:
+        """Yields the rows of the file in order, as dataframes of `batch_size` rows (the
+        last one may be shorter)."""
+        assert self.op.batch_size is not None and self.op.batch_size > 0
+        with open(self.op.fpath, "rb") as f:
+            header = f.readline() if self.is_csv else b""
+            lines: list[bytes] = []
+            pending = b""
+            for line in f:
+                if self.is_csv:
+                    # a quoted field can span lines; a record is complete once its quotes balance
+                    pending += line
+                    if pending.count(b'"') % 2:
+                        continue
+                    line, pending = pending, b""
+                if not line.strip():
+                    continue
+                if not line.endswith(b"\n"):
+                    line += b"\n"
+                lines.append(line)
+                if len(lines) == self.op.batch_size:
+                    yield self._parse(header, lines)
+                    lines = []
+            if pending.strip():
+                lines.append(pending)
+            if len(lines):
+                yield self._parse(header, lines)
+
     def run(self) -> pl.DataFrame | None:
         if not self.is_incremental:
-            data = self.dataset
-        else:
-            if self.rows_read >= len(self.dataset):
-                data = None
-            else:
-                assert self.op.batch_size is not None
-                self.rows_read += self.op.batch_size
-                data = self.dataset.slice(self.rows_read, self.op.batch_size)
+            return self._read_all()
+
+        if self._batches is None:
+            self._batches = self.iter_batches()
+        data = next(self._batches, None)
+        if data is not None:
+            self.rows_read += len(data)
         return data
 
 
@@ -186,3 +266,221 @@ class JsonWriter(OpBaseModel):
         with open(self.fpath, "a") as f:
             f.write(data.write_ndjson())
         return {"output": data}
+
+
+# -----------------------------------------------------------
+# Columnar formats - parquet, arrow ipc
+# -----------------------------------------------------------
+
+
+@register_op
+class ParquetReader(TransformOp):
+    """Reads data from a parquet file.
+
+    Attributes:
+        fpath (str): Path to the parquet file.
+
+    """
+
+    fpath: str
+
+    def setup(self, settings: Settings):
+        return self
+
+    def run(self) -> TYPE_TABLE_OUTPUT:
+        return {"output": pl.scan_parquet(self.fpath).collect()}
+
+
+@register_op
+class ArrowIpcReader(TransformOp):
+    """Reads data from an Arrow IPC (feather v2) file.
+
+    Attributes:
+        fpath (str): Path to the Arrow IPC file.
+
+    """
+
+    fpath: str
+
+    def setup(self, settings: Settings):
+        return self
+
+    def run(self) -> TYPE_TABLE_OUTPUT:
+        # compressed files can't be memory-mapped
+        return {"output": pl.scan_ipc(self.fpath, memory_map=False).collect()}
+
+
+@register_op
+class ParquetWriter(TransformOp):
+    """Appends data to a parquet file, one row group at a time. Rows are buffered until
+    a full row group is available, so many small writes don't create tiny row groups.
+
+    The schema is fixed by the first dataframe written, and later ones are cast to it.
+    The file is only readable once the writer is closed, which `CheckSet` does after
+    writing the output of a check. If the file already exists when the writer is
+    opened, its rows are carried over into the new file.
+
+    Attributes:
+        fpath (str): Path to the parquet file.
+        columns (Optional[list[str]]): Columns to write. Defaults to the columns of the first dataframe.
+        compression (str): Compression codec. Defaults to zstd.
+        compression_level (Optional[int]): Compression level for the codec. Defaults to the codec's default.
+        row_group_size (int): Maximum number of rows in a row group.
+        statistics (bool): Whether to record min/max/null count statistics for each column chunk.
+
+    """
+
+    fpath: str
+    columns: t.Optional[list[str]] = None
+    compression: t.Literal["zstd", "lz4", "snappy", "gzip", "none"] = "zstd"
+    compression_level: t.Optional[int] = None
+    row_group_size: int = 100_000
+    statistics: bool = True
+
+    def setup(self, settings: Settings):
+        self._executor = ArrowWriterExecutor(self)
+        return self
+
+    def to_reader(self):
+        return ParquetReader(fpath=self.fpath)  # type: ignore
+
+    def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
+        self._executor.write(data)
+        return {"output": data}
+
+    def close(self) -> None:
+        """Finalizes the file, after which it can be read."""
+        self._executor.close()
+
+
+@register_op
+class ArrowIpcWriter(TransformOp):
+    """Appends data to an Arrow IPC (feather v2) file, one record batch at a time.
+
+    Behaves like `ParquetWriter`, but stores data in Arrow's in-memory layout, so
+    reading it back needs no decoding beyond decompression. Arrow IPC files don't
+    carry column statistics.
+
+    Attributes:
+        fpath (str): Path to the Arrow IPC file.
+        columns (Optional[list[str]]): Columns to write. Defaults to the columns of the first dataframe.
+        compression (str): Compression codec for the record batches. Defaults to zstd.
+        row_group_size (int): Maximum number of rows in a record batch.
+
+    """
+
+    fpath: str
+    columns: t.Optional[list[str]] = None
+    compression: t.Literal["zstd", "lz4", "none"] = "zstd"
+    row_group_size: int = 100_000
+
+    def setup(self, settings: Settings):
+        self._executor = ArrowWriterExecutor(self)
+        return self
+
+    def to_reader(self):
+        return ArrowIpcReader(fpath=self.fpath)  # type: ignore
+
+    def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
+        self._executor.write(data)
+        return {"output": data}
+
+    def close(self) -> None:
+        """Finalizes the file, after which it can be read."""
+        self._executor.close()
+
+
+class ArrowWriterExecutor:
+    """Keeps a pyarrow file writer open across `write` calls, and appends rows to it in
+    full row groups (parquet) or record batches (arrow ipc). The remainder is flushed
+    when the writer is closed."""
+
+    op: t.Union[ParquetWriter, ArrowIpcWriter]
+    rows_written: int
+    _schema: t.Any  # pyarrow schema
+    _writer: t.Any  # pyarrow file writer
+    _pending: list[t.Any]  # pyarrow tables not written yet
+
+    def __init__(self, op: t.Union[ParquetWriter, ArrowIpcWriter]):
+        lazy_load_dep("pyarrow", "pyarrow>=10.0.0")
+        self.op = op
+        self.rows_written = 0
+        self._schema = None
+        self._writer = None
+        self._pending = []
+
+    @property
+    def is_parquet(self) -> bool:
+        return isinstance(self.op, ParquetWriter)
+
+    def _open(self, schema: t.Any) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        existing = None
+        if os.path.exists(self.op.fpath):
+            reader = ParquetReader if self.is_parquet else ArrowIpcReader
+            existing = reader(fpath=self.op.fpath).run()["output"].to_arrow()  # type: ignore
+            schema = existing.schema
+
+        compression = None if self.op.compression == "none" else self.op.compression
+        if self.is_parquet:
+            self._writer = pq.ParquetWriter(
+                self.op.fpath,
+                schema,
+                compression=compression,
+                compression_level=self.op.compression_level,  # type: ignore
+                write_statistics=self.op.statistics,  # type: ignore
+            )
+        else:
+            self._writer = pa.ipc.new_file(
+                self.op.fpath, schema, options=pa.ipc.IpcWriteOptions(compression=compression)
+            )
+        self._schema = schema
+        if existing is not None:
+            self._write_table(existing)
+
+    def _write_table(self, table: t.Any) -> None:
+        if self.is_parquet:
+            self._writer.write_table(table, row_group_size=self.op.row_group_size)
+        else:
+            self._writer.write_table(table, max_chunksize=self.op.row_group_size)
+        self.rows_written += table.num_rows
+
+    def _flush(self, final: bool = False) -> None:
+        import pyarrow as pa
+
+        num_pending = sum(table.num_rows for table in self._pending)
+        if num_pending == 0 or (num_pending < self.op.row_group_size and not final):
+            return
+        pending = pa.concat_tables(self._pending).combine_chunks()
+        num_full = (num_pending // self.op.row_group_size) * self.op.row_group_size
+        num_to_write = num_pending if final else num_full
+        self._write_table(pending.slice(0, num_to_write))
+        self._pending = [pending.slice(num_to_write)] if num_to_write < num_pending else []
+
+    def write(self, data: pl.DataFrame) -> None:
+        if self.op.columns is None:
+            self.op.columns = list(data.columns)
+        assert set(self.op.columns) == set(data.columns)
+
+        table = data.select(self.op.columns).to_arrow()
+        if self._writer is None:
+            self._open(table.schema)
+        if not table.schema.equals(self._schema):
+            try:
+                table = table.select(self._schema.names).cast(self._schema)
+            except (KeyError, ValueError, NotImplementedError) as exc:
+                raise ValueError(
+                    f"Data written to {self.op.fpath} doesn't match the schema of the file: {exc}"
+                ) from exc
+        self._pending.append(table)
+        self._flush()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._flush(final=True)
+            self._writer.close()
+            self._writer = None
+            self._schema = None
+
@@ -6,9 +6,16 @@ This module provides the `BLEUScore` class, which allows comparing a generated t
 """
 
 from __future__ import annotations
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import functools
+from itertools import repeat
+import multiprocessing
+import os
 import typing as t
 
 from loguru import logger
+import numpy as np
 import polars as pl
 from uptrain.framework import Settings
 
@@ -17,8 +24,136 @@ if t.TYPE_CHECKING:
 from uptrain.operators.base import *
 from uptrain.utilities import lazy_load_dep
 
-# blue_score = lazy_load_dep("nltk.translate.bleu_score", "nltk")
-torchmetircs_text = lazy_load_dep("torchmetrics.functional.text", "torchmetrics")
+# counting n-grams is cheap, so only inputs this large are worth spawning processes for
+BLEU_POOL_MIN_PAIRS = 20_000
+
+
+# -----------------------------------------------------------
+# Batched sentence BLEU
+# -----------------------------------------------------------
+
+
+def _count_ngrams(tokens: t.Sequence[str], n_gram: int) -> list[Counter]:
+    """Counts of the n-grams of each order from 1 to `n_gram`."""
+    return [Counter(zip(*[tokens[i:] for i in range(n)])) for n in range(1, n_gram + 1)]
+
+
+@functools.lru_cache(maxsize=16_384)
+def _reference_ngrams(text: str, n_gram: int) -> tuple[int, list[Counter]]:
+    """The same reference is often scored against many generations, so its tokens and
+    n-gram counts are memoised. Callers must not modify the returned counters."""
+    tokens = text.split()
+    return len(tokens), _count_ngrams(tokens, n_gram)
+
+
+def _count_chunk(pairs: list[tuple[str, str]], n_gram: int) -> np.ndarray:
+    """Counts the clipped and total n-gram matches of (generated, source) pairs. Defined
+    at the module level so it can be sent to a process pool.
+
+    Returns:
+        np.ndarray: Array of shape (num_pairs, 2 * n_gram + 2) - the clipped matches per
+            n-gram order, the n-grams in the generated text per order, then the generated
+            and source lengths.
+    """
+    stats = np.zeros((len(pairs), 2 * n_gram + 2), dtype=np.int64)
+    for row, (generated, source) in enumerate(pairs):
+        tokens = generated.split()
+        ref_len, ref_counters = _reference_ngrams(source, n_gram)
+        for n, (counter, ref_counter) in enumerate(zip(_count_ngrams(tokens, n_gram), ref_counters)):
+            # the same as sum((counter & ref_counter).values()), without python level loops
+            stats[row, n] = sum(map(min, counter.values(), map(ref_counter.get, counter, repeat(0))))
+            stats[row, n_gram + n] = max(len(tokens) - n, 0)
+        stats[row, -2:] = len(tokens), ref_len
+    return stats
+
+
+def _log32(x: np.ndarray) -> np.ndarray:
+    return np.log(x.astype(np.float64)).astype(np.float32)
+
+
+def _exp32(x: np.ndarray) -> np.ndarray:
+    return np.exp(x.astype(np.float64)).astype(np.float32)
+
+
+def _bleu_from_counts(stats: np.ndarray, n_gram: int, smooth: bool) -> np.ndarray:
+    """Sentence BLEU per row from its n-gram counts, with uniform weights. Follows the
+    float32 arithmetic of `torchmetrics.functional.text.bleu_score`, with the logs and
+    exponentials rounded to float32 from double precision."""
+    numerator = stats[:, :n_gram].astype(np.float32)
+    denominator = stats[:, n_gram : 2 * n_gram].astype(np.float32)
+    preds_len = stats[:, -2].astype(np.float32)
+    target_len = stats[:, -1].astype(np.float32)
+    has_matches = numerator.min(axis=1) > 0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if smooth:
+            precision = (numerator + np.float32(1)) / (denominator + np.float32(1))
+            precision[:, 0] = numerator[:, 0] / denominator[:, 0]
+        else:
+            precision = numerator / denominator
+        log_precision = np.float32(1.0 / n_gram) * _log32(precision)
+        log_sum = log_precision[:, 0]
+        for n in range(1, n_gram):
+            log_sum = log_sum + log_precision[:, n]
+        geometric_mean = _exp32(log_sum)
+        brevity_penalty = np.where(
+            preds_len > target_len,
+            np.float32(1.0),
+            _exp32(np.float32(1) - target_len / preds_len),
+        )
+        scores = brevity_penalty * geometric_mean
+    return np.where(has_matches, scores, np.float32(0.0))
+
+
+def bleu_scores(
+    text_generated: list[str | None],
+    text_source: list[str | None],
+    n_gram: int = 1,
+    smooth: bool = False,
+    num_workers: int | None = None,
+    chunk_size: int = 5000,
+) -> np.ndarray:
+    """Computes the sentence BLEU score of each generated text against its source text,
+    with the whitespace tokenization and scores of torchmetrics' `bleu_score`. Pairs with
+    a missing text score 0.
+
+    Each distinct (generated, source) pair is counted once. The distinct pairs are sorted
+    by their source text and split into chunks, so repeated sources share their
+    tokenization. Large inputs are counted on a process pool of `num_workers` processes
+    (defaults to the cpu count), and the scores are computed for all rows at once.
+
+    Returns:
+        np.ndarray: Array of shape (num_rows,) with the scores, as float32.
+    """
+    assert len(text_generated) == len(text_source), "Expected one source per generated text"
+    assert 1 <= n_gram <= 4, "n_gram must be between 1 and 4"
+    pair_index: dict[tuple[str, str], int] = {}
+    inverse = np.array(
+        [
+            pair_index.setdefault((gen, src), len(pair_index)) if gen is not None and src is not None else -1
+            for gen, src in zip(text_generated, text_source)
+        ],
+        dtype=np.int64,
+    )
+    pairs = sorted(pair_index, key=lambda pair: (pair[1], pair[0]))
+    chunks = [pairs[start : start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+
+    count_chunk = functools.partial(_count_chunk, n_gram=n_gram)
+    num_workers = num_workers or os.cpu_count() or 1
+    if len(pairs) < BLEU_POOL_MIN_PAIRS or num_workers <= 1 or len(chunks) <= 1:
+        chunk_stats = [count_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(num_workers, len(chunks)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            chunk_stats = list(executor.map(count_chunk, chunks))
+
+    # one extra row of zeros, that rows with a missing text point to
+    stats = np.zeros((len(pair_index) + 1, 2 * n_gram + 2), dtype=np.int64)
+    if len(pairs):
+        stats[[pair_index[pair] for pair in pairs]] = np.concatenate(chunk_stats)
+    return _bleu_from_counts(stats, n_gram, smooth)[inverse]
 
 
 @register_op
@@ -31,6 +166,10 @@ class BLEUScore(ColumnOp):
         col_in_generated (str): The name of the input column containing the generated text.
         col_in_source (str): The name of the input column containing the source text.
         col_out (str): The name of the output column containing the BLEU scores.
+        n_gram (int): Highest n-gram order to score, from 1 to 4. Orders are weighted uniformly.
+        smooth (bool): Whether to add one to the matches and counts of n-grams above unigrams.
+        num_workers (int | None): Number of processes to count n-grams for large inputs with. Defaults to the cpu count.
+        chunk_size (int): Number of distinct pairs sent to a worker at a time.
 
     Returns:
         dict: A dictionary containing the BLEU scores for each pair of generated and source text.
@@ -71,28 +210,26 @@ class BLEUScore(ColumnOp):
     col_in_generated: str = "text_generated"
     col_in_source: str = "text_source"
     col_out: str = "bleu_score"
+    n_gram: int = 1
+    smooth: bool = False
+    num_workers: t.Optional[int] = None
+    chunk_size: int = 5000
 
     def setup(self, settings: Settings):
         return self
 
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
-        text_generated = data.get_column(self.col_in_generated)  # candidate/preds
-        text_source = data.get_column(self.col_in_source)  # reference/target
-
-        results = []
-        scores = []
-        for i in range(len(text_generated)):
-            # scorer = blue_score.sentence_bleu  # type: ignore
-            scorer = torchmetircs_text.bleu_score
-            if text_source[i] is None or text_generated[i] is None:
-                scores.append({"bleu": 0})
-            else:
-                # scores.append({"bleu": scorer(references=[text_source[i].split()], hypothesis=text_generated[i].split(), weights=(1,0,0,0))})
-                preds = text_generated[i]
-                target = [text_source[i]]
-                scores.append(
-                    {"bleu": scorer(preds, target, n_gram=1).item()}
-                )  # Same as nltk's blue_score with weights (1,0,0,0)
-
-        results = pl.Series([int(x["bleu"] * 100) for x in scores])
+        text_generated = data.get_column(self.col_in_generated).to_list()  # candidate/preds
+        text_source = data.get_column(self.col_in_source).to_list()  # reference/target
+
+        scores = bleu_scores(
+            text_generated,
+            text_source,
+            n_gram=self.n_gram,
+            smooth=self.smooth,
+            num_workers=self.num_workers,
+            chunk_size=self.chunk_size,
+        )
+        # widened to double before scaling, as the scores used to be read with `.item()`
+        results = pl.Series((scores.astype(np.float64) * 100).astype(np.int64))
         return {"output": data.with_columns([results.alias(self.col_out)])}
@@ -8,18 +8,34 @@ generated for a specified text column in a DataFrame.
 """
 
 from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import os
+import random
 import typing as t
 import numpy as np
 
 from loguru import logger
+import httpx
 import polars as pl
 import json
-import requests
 
 if t.TYPE_CHECKING:
     from uptrain.framework import Settings
 from uptrain.operators.base import *
 from uptrain.utilities import lazy_load_dep
+from uptrain.utilities.cache import EmbeddingStore, get_cache_dir, hash_key
+from uptrain.operators.language.rate_limit import get_retry_after
+
+# used to fill in rows that failed to embed, when nothing else is known about the model
+EMBEDDING_DIMS = {
+    "MiniLM-L6-v2": 384,
+    "mpnet-base-v2": 768,
+    "instructor-xl": 768,
+    "instructor-large": 768,
+    "bge-large-zh-v1.5": 1024,
+}
 
 
 @register_op
@@ -27,10 +43,23 @@ class Embedding(ColumnOp):
     """
     Column operation that generates embeddings for text using pre-trained models.
 
+    Texts are deduplicated before encoding, and embeddings are kept in a persistent store
+    under the logs folder keyed by (model, text hash), so only unique texts that haven't
+    been seen before are sent to the encoder. Set `embedding_cache` to False in the
+    settings to skip the store.
+
     Attributes:
         model (Literal["MiniLM-L6-v2", "instructor-xl", "mpnet-base-v2", "bge-large-zh-v1.5"]): The name of the pre-trained model to use.
         col_in_text (str): The name of the text column in the DataFrame.
         col_out (str): The name of the output column in the DataFrame.
+        batch_size (int): Number of texts sent to the encoder at once.
+        max_concurrent_batches (int): For the `api` and `replicate` compute methods, the number
+            of batches in flight at once.
+        max_retries (int): For the `api` and `replicate` compute methods, the number of attempts
+            for a batch that fails with a transient error (throttling, 5xx, connection errors),
+            with backoff between them. An `api` batch that keeps failing is split in halves, and
+            only the halves that fail again are split further, to isolate the texts that can't be
+            embedded. A `replicate` batch that keeps failing raises the error.
 
     Raises:
         Exception: If the specified model is not supported.
@@ -77,6 +106,8 @@ class Embedding(ColumnOp):
     col_in_text: str = "text"
     col_out: str = "embedding"
     batch_size: int = 128
+    max_concurrent_batches: int = 8
+    max_retries: int = 3
 
     def setup(self, settings: Settings):
         self._compute_method = settings.embedding_compute_method
@@ -116,66 +147,193 @@ class Embedding(ColumnOp):
                 'model': self.model,
                 'authorization_key':settings.embedding_model_api_token
             }
+
+        self._store = None
+        if settings.embedding_cache:
+            store_name = self.model
+            if settings.embedding_compute_method == "api":
+                # the same model name can be served by different endpoints
+                store_name += "-" + hash_key(settings.embedding_model_url)[:16]
+            self._store = EmbeddingStore(
+                os.path.join(get_cache_dir(settings.logs_folder), "embeddings", store_name)
+            )
         return self
 
-    def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
-        text = data.get_column(self.col_in_text)
+    def _make_inputs(self, text: pl.Series) -> list:
         if self.model in ["instructor-xl", "instructor-large", "bge-large-zh-v1.5"]:
-            inputs = [
+            return [
                 ["Represent the sentence: ", x] for x in text
             ]
         elif self.model == "MiniLM-L6-v2" or self.model == "mpnet-base-v2":
-            inputs = list(text)
+            return list(text)
         else:
             raise Exception("Embeddings model not supported")
 
+    def _encode(self, inputs: list) -> list[t.Optional[list[float]]]:
+        """Run the encoder over the inputs in batches. Rows that failed to embed are None."""
+        if self._compute_method in ["api", "replicate"]:
+            return self._run_async(self._async_encode(inputs))
+
         results = []
         BATCH_SIZE = self.batch_size
-        if self.model == "bge-large-zh-v1.5":
-            emb_length = 1024
-        elif self.model in ["instructor-xl", "instructor-large"]:
-            emb_length = 768
         for idx in range(int(np.ceil(len(inputs)/BATCH_SIZE))):
-            if self._compute_method == "local":
-                run_res = self._model_obj.encode(inputs[idx*BATCH_SIZE:(idx+1)*BATCH_SIZE])
-            elif self._compute_method == "replicate":
-                run_res = [x['embedding'] for x in self._model_obj.run(
-                        self._model_url,
-                        input = {"text_batch": json.dumps(inputs[idx*BATCH_SIZE:(idx+1)*BATCH_SIZE])}
-                    )]
-            elif self._compute_method == "api":
-                try:
-                    run_res = [x['embedding'] for x in requests.post(
-                        self._model_obj['embedding_model_url'],
-                        json={
-                            'model': self.model,
-                            'input': inputs[idx*BATCH_SIZE:(idx+1)*BATCH_SIZE]
-                        },
-                        headers={
-                            'Authorization': f"Bearer {self._model_obj['authorization_key']}"
-                        }
-                    ).json()['data']]
-                    emb_length = len(run_res[0])
-                except:
-                    run_res = []
-                    for elem_idx in range(idx*BATCH_SIZE, (idx+1)*BATCH_SIZE):
-                        if elem_idx < len(inputs):
-                            try:
-                                run_res.extend([x['embedding'] for x in requests.post(
-                                    self._model_obj['embedding_model_url'],
-                                    json={
-                                        'model': self.model,
-                                        'input': [inputs[elem_idx]]
-                                    },
-                                    headers={
-                                        'Authorization': f"Bearer {self._model_obj['authorization_key']}"
-                                    }
-                                ).json()['data']])
-                            except:
-                                if len(run_res)!=0:
-                                    run_res.append(run_res[-1])
-                                else:
-                                    run_res.append([0]*emb_length)
-            results.extend(run_res)
+            results.extend(list(self._model_obj.encode(inputs[idx*BATCH_SIZE:(idx+1)*BATCH_SIZE])))
             logger.info(f"Running batch: {idx} out of {int(np.ceil(len(inputs)/BATCH_SIZE))} for operator Embedding")
+        return results
+
+    @staticmethod
+    def _run_async(coro: t.Coroutine) -> t.Any:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop and loop.is_running():
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                return executor.submit(asyncio.run, coro).result()
+        else:
+            return asyncio.run(coro)
+
+    async def _async_encode(self, inputs: list) -> list[t.Optional[list[float]]]:
+        """Send batches to the remote encoder with at most `max_concurrent_batches` requests
+        in flight, and put the results back in input order."""
+        BATCH_SIZE = self.batch_size
+        num_batches = int(np.ceil(len(inputs)/BATCH_SIZE))
+        results: list[t.Optional[list[float]]] = [None] * len(inputs)
+        semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+        num_done = 0
+
+        async with self._make_http_client() as client:
+
+            async def _run_batch(idx: int):
+                nonlocal num_done
+                start = idx * BATCH_SIZE
+                batch = inputs[start : start + BATCH_SIZE]
+                results[start : start + len(batch)] = await self._encode_with_split(
+                    client, semaphore, batch
+                )
+                num_done += 1
+                logger.info(f"Completed batch: {num_done} out of {num_batches} for operator Embedding")
+
+            await asyncio.gather(*[_run_batch(idx) for idx in range(num_batches)])
+        return results
+
+    def _make_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrent_batches,
+                max_keepalive_connections=self.max_concurrent_batches,
+            ),
+        )
+
+    def _is_transient_error(self, exc: Exception) -> bool:
+        """Whether the request may succeed if sent again as is."""
+        if self._compute_method == "replicate":
+            return True
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code == 429 or exc.response.status_code >= 500
+        return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError, ConnectionError))
+
+    async def _encode_with_retries(
+        self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, batch: list
+    ) -> list[list[float]]:
+        """Encode a batch, retrying transient errors with backoff. Each attempt takes a slot
+        of the semaphore, and the last error is raised if every attempt fails."""
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    embeddings = await self._encode_batch(client, batch)
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+                return embeddings
+            except Exception as exc:
+                attempt += 1
+                if attempt >= self.max_retries or not self._is_transient_error(exc):
+                    raise
+                retry_after = get_retry_after(exc)
+                if retry_after is None:
+                    retry_after = random.uniform(0, min(30.0, 0.5 * 2 ** (attempt - 1)))
+                await asyncio.sleep(min(retry_after, 60.0))
+
+    async def _encode_with_split(
+        self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, batch: list
+    ) -> list[t.Optional[list[float]]]:
+        """Encode a batch. If it still fails after retrying, split it in halves and encode each
+        half on its own, so one bad text only costs the part of the batch it is in."""
+        try:
+            return await self._encode_with_retries(client, semaphore, batch)
+        except Exception as exc:
+            if self._compute_method == "replicate":
+                raise
+            if len(batch) > 1:
+                mid = len(batch) // 2
+                halves = await asyncio.gather(
+                    self._encode_with_split(client, semaphore, batch[:mid]),
+                    self._encode_with_split(client, semaphore, batch[mid:]),
+                )
+                return halves[0] + halves[1]
+            logger.error(f"Error when embedding text, giving up on it: {exc}")
+            return [None]
+
+    async def _encode_batch(self, client: httpx.AsyncClient, batch: list) -> list[list[float]]:
+        if self._compute_method == "replicate":
+            # asyncio.to_thread needs python 3.9
+            output = await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self._model_obj.run,
+                    self._model_url,
+                    input = {"text_batch": json.dumps(batch)}
+                ),
+            )
+            return [x['embedding'] for x in output]
+        else:
+            response = await client.post(
+                self._model_obj['embedding_model_url'],
+                json={
+                    'model': self.model,
+                    'input': batch
+                },
+                headers={
+                    'Authorization': f"Bearer {self._model_obj['authorization_key']}"
+                }
+            )
+            response.raise_for_status()
+            return [x['embedding'] for x in response.json()['data']]
+
+    def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
+        text = data.get_column(self.col_in_text)
+        inputs = self._make_inputs(text)
+
+        # only encode unique texts that aren't in the store already
+        keys = [hash_key(x) for x in inputs]
+        unique_inputs = dict(zip(keys, inputs))
+        vectors = self._store.get_many(list(unique_inputs)) if self._store is not None else {}
+        missing = [key for key in unique_inputs if key not in vectors]
+        logger.info(
+            f"Embedding {len(missing)} new texts for {len(inputs)} rows ({len(unique_inputs)} unique)"
+        )
+
+        encoded = self._encode([unique_inputs[key] for key in missing])
+        new_vectors = {
+            key: np.asarray(vec, dtype=np.float32)
+            for key, vec in zip(missing, encoded)
+            if vec is not None
+        }
+        if self._store is not None and len(new_vectors):
+            self._store.add_many(list(new_vectors), np.stack(list(new_vectors.values())))
+        vectors.update(new_vectors)
+
+        # scatter back in row order, rows that failed to embed reuse the previous row's embedding
+        emb_length = next(
+            (len(vec) for vec in vectors.values()), EMBEDDING_DIMS.get(self.model, 0)
+        )
+        results = []
+        for key in keys:
+            vec = vectors.get(key)
+            if vec is None:
+                vec = results[-1] if len(results) else np.zeros(emb_length, dtype=np.float32)
+            results.append(vec)
         return {"output": data.with_columns([pl.Series(results).alias(self.col_out)])}
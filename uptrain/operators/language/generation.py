@@ -5,6 +5,8 @@ prompts/LLM-input-parameters for gnerating text.
 
 from __future__ import annotations
 import itertools
+import os
+import time
 import typing as t
 import json
 import numpy as np 
@@ -17,6 +19,8 @@ if t.TYPE_CHECKING:
     from uptrain.framework import Settings
 from uptrain.operators.base import *
 from uptrain.operators.language.llm import LLMMulticlient, Payload
+from uptrain.utilities import jsondumps, jsonloads
+from uptrain.utilities.cache import get_cache_dir, hash_key
 
 
 @register_op
@@ -109,27 +113,51 @@ class TextCompletion(TransformOp):
     """
     Takes a table of prompts and LLM model to use, generates output text.
 
+    Completed responses are appended to a checkpoint file as they arrive, keyed by the row
+    index and a hash of the payload. If a run is interrupted, the next run over the same
+    data only issues the rows that hadn't finished. The checkpoint is removed once every
+    row completes.
+
     Attributes:
         col_in_prompt (str): The name of the column containing the prompt template.
         col_in_model (str): The name of the column containing the model name.
         col_out_completion (str): The name of the column containing the generated text.
         temperature (float): Temperature for the LLM to generate responses.
+        checkpoint (bool): Whether to checkpoint completed responses, so the run can be resumed.
+        checkpoint_fpath (Optional[str]): Path to the checkpoint file. Defaults to a file in
+            the cache directory under the logs folder, named by a hash of the operator's config
+            and the payloads it sends.
 
     Returns:
-        TYPE_TABLE_OUTPUT: A dictionary containing the dataset with the output text.
+        TYPE_TABLE_OUTPUT: A dictionary containing the dataset with the output text. The
+            `extra` key holds the progress/throughput metrics for the run.
     """
 
     col_in_prompt: str = "prompt"
     col_in_model: str = "model"
     col_out_completion: str = "generated"
     temperature: float = 1.0
+    checkpoint: bool = True
+    checkpoint_fpath: t.Optional[str] = None
     _api_client: LLMMulticlient
 
     def setup(self, settings: Settings):
         self._api_client = LLMMulticlient(settings=settings)
         self._settings = settings
+        self._checkpoint_fpath = None
+        self._checkpoint_dir = None
+        if self.checkpoint:
+            self._checkpoint_fpath = self.checkpoint_fpath
+            if self._checkpoint_fpath is None:
+                self._checkpoint_dir = get_cache_dir(settings.logs_folder)
         return self
 
+    def _default_checkpoint_fpath(self, payload_hashes: list[str]) -> str:
+        """Checkpoint file for this operator's config and these payloads (models, prompts and
+        sampling params), so different ops or experiments in one logs folder don't share it."""
+        key = hash_key([self.dict(), payload_hashes])
+        return os.path.join(self._checkpoint_dir, f"text_completion_{key[:16]}.jsonl")
+
     def _make_payload(self, id: t.Any, text: str, model: str) -> Payload:
         if self._settings.seed is not None:
             return Payload(
@@ -151,6 +179,20 @@ class TextCompletion(TransformOp):
                 metadata={"index": id},
             )
 
+    def _load_checkpoint(self) -> dict[int, tuple[str, str]]:
+        """Read completed rows from the checkpoint, as {row index: (payload hash, completion)}."""
+        completed = {}
+        if self._checkpoint_fpath is None or not os.path.exists(self._checkpoint_fpath):
+            return completed
+        with open(self._checkpoint_fpath, "r") as f:
+            for line in f:
+                try:
+                    record = jsonloads(line)
+                except ValueError:
+                    continue  # partially written line, if the last run crashed mid-write
+                completed[record["index"]] = (record["hash"], record["completion"])
+        return completed
+
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
         prompt_ser = data.get_column(self.col_in_prompt)
         model_ser = data.get_column(self.col_in_model)
@@ -158,9 +200,62 @@ class TextCompletion(TransformOp):
             self._make_payload(idx, text, model)
             for idx, (text, model) in enumerate(zip(prompt_ser, model_ser))
         ]
-        output_payloads = self._api_client.fetch_responses(input_payloads)
+        payload_hashes = [hash_key(payload.data) for payload in input_payloads]
+        if self._checkpoint_dir is not None:
+            self._checkpoint_fpath = self._default_checkpoint_fpath(payload_hashes)
+
+        # skip the rows that completed in an earlier, interrupted run
+        completed = self._load_checkpoint()
+        results = {}
+        to_fetch = []
+        for idx, (payload, payload_hash) in enumerate(zip(input_payloads, payload_hashes)):
+            if idx in completed and completed[idx][0] == payload_hash:
+                results[idx] = completed[idx][1]
+            else:
+                to_fetch.append(payload)
+        if len(results):
+            logger.info(
+                f"Resuming from checkpoint: {len(results)} of {len(input_payloads)} rows were already completed."
+            )
+
+        progress = {"done": 0, "failed": 0, "last_log": time.perf_counter()}
+        start_time = time.perf_counter()
+        log_every = max(len(to_fetch) // 20, 1)
+        checkpoint_file = (
+            open(self._checkpoint_fpath, "a") if self._checkpoint_fpath is not None else None
+        )
+
+        def on_response(res: Payload):
+            idx = res.metadata["index"]
+            progress["done"] += 1
+            if res.error is not None:
+                progress["failed"] += 1
+            elif checkpoint_file is not None:
+                record = {
+                    "index": idx,
+                    "hash": payload_hashes[idx],
+                    "completion": res.response.choices[0].message.content,
+                }
+                checkpoint_file.write(jsondumps(record) + "\n")
+                checkpoint_file.flush()
+
+            now = time.perf_counter()
+            if progress["done"] % log_every == 0 or now - progress["last_log"] > 30:
+                progress["last_log"] = now
+                rate = progress["done"] / max(now - start_time, 1e-6)
+                logger.info(
+                    f"TextCompletion progress: {progress['done']}/{len(to_fetch)} rows, "
+                    f"{progress['failed']} failed, {rate:.2f} rows/s"
+                )
+
+        try:
+            output_payloads = self._api_client.fetch_responses(
+                to_fetch, on_response=on_response
+            )
+        finally:
+            if checkpoint_file is not None:
+                checkpoint_file.close()
 
-        results = []
         for res in output_payloads:
             assert (
                 res is not None
@@ -170,16 +265,33 @@ class TextCompletion(TransformOp):
                 logger.error(
                     f"Error when processing payload at index {idx}: {res.error}"
                 )
-                results.append((idx, None))
+                results[idx] = None
             else:
                 resp_text = res.response.choices[0].message.content
-                results.append((idx, resp_text))
+                results[idx] = resp_text
+
+        # a clean run leaves nothing to resume
+        if progress["failed"] == 0 and self._checkpoint_fpath is not None:
+            if os.path.exists(self._checkpoint_fpath):
+                os.remove(self._checkpoint_fpath)
+
+        elapsed = time.perf_counter() - start_time
+        metrics = {
+            "rows_total": len(input_payloads),
+            "rows_resumed": len(input_payloads) - len(to_fetch),
+            "rows_fetched": len(to_fetch),
+            "rows_failed": progress["failed"],
+            "elapsed_secs": round(elapsed, 3),
+            "rows_per_sec": round(len(to_fetch) / elapsed, 3) if elapsed > 0 else None,
+        }
+        logger.info(f"TextCompletion finished: {metrics}")
 
         output_text = pl.Series(
-            values=[val for _, val in sorted(results, key=lambda x: x[0])]
+            values=[results[idx] for idx in range(len(input_payloads))]
         )
         return {
-            "output": data.with_columns([output_text.alias(self.col_out_completion)])
+            "output": data.with_columns([output_text.alias(self.col_out_completion)]),
+            "extra": {"metrics": metrics},
         }
 
 
@@ -199,6 +311,8 @@ class TopicGenerator(ColumnOp):
     Returns:
         TYPE_TABLE_OUTPUT: A dictionary containing the dataset with the output text.
     """
+
+    is_rowwise: t.ClassVar[bool] = False
     col_in_cluster_index: str = 'cluster_index'
     col_in_dist: str = 'cluster_index_distance'
     col_in_text: str = 'question'
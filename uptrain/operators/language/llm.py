@@ -4,8 +4,11 @@ Implement checks to test language quality.
 
 from __future__ import annotations
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import random
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
+import os
+import threading
+from types import SimpleNamespace
 import typing as t
 
 from loguru import logger
@@ -14,7 +17,16 @@ from pydantic import BaseModel, Field
 if t.TYPE_CHECKING:
     from uptrain.framework import Settings
 from uptrain.operators.base import *
-from uptrain.utilities import lazy_load_dep
+from uptrain.utilities import lazy_load_dep, jsondumps, jsonloads
+from uptrain.utilities.cache import SqliteCache, get_cache_dir, hash_key
+from uptrain.utilities.profiling import record_llm_usage
+from uptrain.operators.language.rate_limit import (
+    DEFAULT_MAX_CONCURRENCY,
+    AIMDLimiter,
+    HeuristicTokenCounter,
+    TokenCounter,
+    get_token_counter,
+)
 
 openai = lazy_load_dep("openai", "openai")
 litellm = lazy_load_dep("litellm", "litellm")
@@ -24,6 +36,7 @@ tqdm_asyncio = lazy_load_dep("tqdm.asyncio", "tqdm>=4.0")
 
 from openai import AsyncOpenAI
 from openai import AsyncAzureOpenAI
+from openai.types.chat import ChatCompletion
 import openai
 #import openai.error
 
@@ -44,22 +57,121 @@ class Payload(BaseModel):
     error: t.Optional[str] = None
 
 
+class InflightRequests:
+    """Registry of payloads currently being sent to the LLM API, so identical payloads
+    share a single request. Uses thread-safe futures, so payloads are coalesced across
+    batches even when each batch runs its own event loop in a separate thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: dict[str, Future] = {}
+        self.saved = 0  # number of requests that were coalesced into another one
+
+    def claim(self, key: str) -> tuple[Future, bool]:
+        """Returns the future for this key, and whether the caller is the one that must
+        send the request and resolve it."""
+        with self._lock:
+            if key in self._futures:
+                self.saved += 1
+                return self._futures[key], False
+            fut = Future()
+            self._futures[key] = fut
+            return fut, True
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._futures.pop(key, None)
+
+
 async def async_process_payload(
     payload: Payload,
     rpm_limiter: aiolimiter.AsyncLimiter,
     tpm_limiter: aiolimiter.AsyncLimiter,
     aclient: t.Union[AsyncOpenAI, AsyncAzureOpenAI, None],
     max_retries: int,
+    inflight: t.Optional[InflightRequests] = None,
+    concurrency: t.Optional[AIMDLimiter] = None,
+    token_counter: t.Optional[TokenCounter] = None,
+) -> Payload:
+    """Send the payload to the LLM API and fill in its response/error. If `inflight` is
+    given and an identical deterministic payload is already being sent, wait for that request
+    instead of making another one - the caller's payload keeps its own metadata. Sampled
+    payloads each get their own completion.
+
+    `concurrency` caps the requests in flight and adapts to throttling by the provider, and
+    `token_counter` sizes each request for the TPM limiter.
+    """
+    if inflight is None or not _is_deterministic(payload.data):
+        return await _async_send_payload(
+            payload, rpm_limiter, tpm_limiter, aclient, max_retries, concurrency, token_counter
+        )
+
+    key = hash_key(payload.data)
+    fut, is_leader = inflight.claim(key)
+    if not is_leader:
+        result: Payload = await asyncio.wrap_future(fut)
+        payload.response, payload.error = result.response, result.error
+        return payload
+
+    try:
+        await _async_send_payload(
+            payload, rpm_limiter, tpm_limiter, aclient, max_retries, concurrency, token_counter
+        )
+        fut.set_result(payload)
+    except BaseException as exc:
+        fut.set_exception(exc)
+        raise
+    finally:
+        inflight.release(key)
+    return payload
+
+
+def _retryable_errors() -> tuple:
+    errors = (
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+        openai.RateLimitError,
+        openai.UnprocessableEntityError,
+    )
+    try:
+        errors += (litellm.RateLimitError, litellm.Timeout, litellm.APIConnectionError)
+    except ModuleNotFoundError:
+        pass  # litellm isn't installed, so it can't have raised anything
+    return errors
+
+
+def _is_throttle_error(exc: Exception) -> bool:
+    """Whether the error signals that the provider is overloaded, so we should slow down."""
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    return type(exc).__name__ in ("RateLimitError", "APITimeoutError", "Timeout")
+
+
+async def _async_send_payload(
+    payload: Payload,
+    rpm_limiter: aiolimiter.AsyncLimiter,
+    tpm_limiter: aiolimiter.AsyncLimiter,
+    aclient: t.Union[AsyncOpenAI, AsyncAzureOpenAI, None],
+    max_retries: int,
+    concurrency: t.Optional[AIMDLimiter] = None,
+    token_counter: t.Optional[TokenCounter] = None,
 ) -> Payload:
+    if concurrency is None:
+        concurrency = AIMDLimiter(max_limit=DEFAULT_MAX_CONCURRENCY)
+    if token_counter is None:
+        token_counter = HeuristicTokenCounter()
+
     messages = payload.data["messages"]
-    total_chars = sum(len(msg["role"]) + len(msg["content"]) for msg in messages)
-    total_tokens = total_chars // 3  # average token length is 3, conservatively
+    total_tokens = token_counter.count(messages)
     await rpm_limiter.acquire(1)
     # TODO: we should also count the response tokens, but this is a good baseline
     # since our use-case is evaluations mostly, not generation
-    await tpm_limiter.acquire(total_tokens)
+    await tpm_limiter.acquire(min(total_tokens, tpm_limiter.max_rate))
 
     for count in range(max_retries):  # failed requests don't count towards rate limit
+        epoch = await concurrency.acquire()
         try:
             if aclient is not None:
                 payload.response = await aclient.chat.completions.create(**payload.data, timeout=180)
@@ -67,24 +179,14 @@ async def async_process_payload(
                 payload.response = await litellm.acompletion(
                     **payload.data,
                 )
-            break
         except Exception as exc:
+            await concurrency.release()
             logger.error(f"Error when sending request to LLM API: {exc}")
-            if (
-                isinstance(
-                    exc,
-                    (
-                        litellm.RateLimitError,
-                        openai.APIConnectionError,
-                        openai.APITimeoutError,
-                        openai.InternalServerError,
-                        openai.RateLimitError,
-                        openai.UnprocessableEntityError
-                    ),
-                )
-                and count < max_retries - 1
-            ):
-                await asyncio.sleep(random.uniform(5, 30) * count + 60)
+            if isinstance(exc, _retryable_errors()) and count < max_retries - 1:
+                throttled = _is_throttle_error(exc)
+                if throttled:
+                    concurrency.on_throttle(epoch)
+                await asyncio.sleep(concurrency.backoff_delay(count, exc, throttled=throttled))
             elif (
                 isinstance(exc, openai.BadRequestError)
                 and exc.code is not None 
@@ -115,10 +217,53 @@ async def async_process_payload(
             else:
                 payload.error = str(exc)
                 break
+        else:
+            await concurrency.release()
+            concurrency.on_success()
+            usage = getattr(payload.response, "usage", None)
+            if getattr(usage, "prompt_tokens", None):
+                token_counter.observe(messages, usage.prompt_tokens)
+            record_llm_usage(usage)
+            break
 
     return payload
 
 
+def _serialize_response(response: t.Any) -> str:
+    """Serialize a chat completion response (openai or litellm) to json."""
+    if hasattr(response, "model_dump"):
+        response = response.model_dump()
+    elif hasattr(response, "dict"):
+        response = response.dict()
+    return jsondumps(response)
+
+
+def _is_deterministic(data: dict) -> bool:
+    """Only responses to payloads without sampling (temperature 0, or a fixed seed) are
+    cached or shared between identical payloads - reusing a sampled completion would change
+    the results."""
+    return data.get("temperature", 1.0) == 0 or data.get("seed") is not None
+
+
+def _to_namespace(obj: t.Any) -> t.Any:
+    if isinstance(obj, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in obj.items()})
+    elif isinstance(obj, list):
+        return [_to_namespace(v) for v in obj]
+    return obj
+
+
+def _deserialize_response(value: t.Union[str, bytes]) -> t.Any:
+    """Reconstruct a response object from its cached json, so callers can keep using
+    `response.choices[0].message.content`."""
+    response = jsonloads(value)
+    try:
+        return ChatCompletion.parse_obj(response)
+    except Exception:
+        # responses from other providers via litellm needn't fit the openai schema
+        return _to_namespace(response)
+
+
 class LLMMulticlient:
     """Uses asyncio to send requests to LLM APIs concurrently."""
 
@@ -127,6 +272,14 @@ class LLMMulticlient:
         # TODO: consult for accurate limits - https://platform.openai.com/account/rate-limits
         self._rpm_limit = 200
         self._tpm_limit = 90_000
+        self._max_concurrency = DEFAULT_MAX_CONCURRENCY
+        self._concurrency_limit = None  # learnt across batches by the AIMD limiter
+        self._backoff_base = 1.0
+        self._backoff_max = 60.0
+        self._throttle_backoff_min = 20.0
+        self._token_counter = get_token_counter(
+            settings.model if settings is not None else ""
+        )
         self.aclient = None
         if settings is not None:
             if settings.model.startswith("gpt") and settings.check_and_get("openai_api_key") is not None:
@@ -142,8 +295,102 @@ class LLMMulticlient:
 
             self._rpm_limit = settings.check_and_get("rpm_limit")
             self._tpm_limit = settings.check_and_get("tpm_limit")
+            self._max_concurrency = settings.check_and_get("llm_max_concurrency")
+
+        self._inflight = InflightRequests()
+        self._cache = None
+        if settings is not None and settings.llm_cache:
+            max_mb = settings.llm_cache_max_mb
+            self._cache = SqliteCache(
+                os.path.join(get_cache_dir(settings.logs_folder), "llm_responses.sqlite"),
+                ttl=settings.llm_cache_ttl,
+                max_entries=settings.llm_cache_max_entries,
+                max_bytes=int(max_mb * 1024 * 1024) if max_mb is not None else None,
+            )
+
+    def _cache_scope(self) -> list[str]:
+        """Identifies the provider the requests go to, so the same payload sent to different
+        providers (ex: openai and azure) is cached separately."""
+        if self.aclient is None:
+            return ["litellm", os.environ.get("OPENAI_API_BASE", "")]
+        return [type(self.aclient).__name__, str(getattr(self.aclient, "base_url", "") or "")]
+
+    @property
+    def cache_hits(self) -> int:
+        return self._cache.hits if self._cache is not None else 0
+
+    @property
+    def cache_misses(self) -> int:
+        return self._cache.misses if self._cache is not None else 0
+
+    @property
+    def dedup_saved(self) -> int:
+        """Number of API calls saved by coalescing identical in-flight payloads."""
+        return self._inflight.saved
+
+    def fetch_responses(
+        self,
+        input_payloads: list[Payload],
+        on_response: t.Optional[t.Callable[[Payload], None]] = None,
+    ) -> list[Payload]:
+        """Fetch responses for all the payloads, serving whatever we can from the cache.
+
+        Args:
+            input_payloads: Payloads to send to the LLM API.
+            on_response: Called with each payload as soon as its response/error is available,
+                in completion order. Useful to persist results while the rest are in flight.
+        """
+        scope = self._cache_scope()
+        cache_keys = [
+            hash_key([scope, payload.data]) if _is_deterministic(payload.data) else None
+            for payload in input_payloads
+        ]
+        if self._cache is not None:
+            cached = self._cache.get_many([key for key in cache_keys if key is not None])
+        else:
+            cached = {}
+
+        output_payloads: list[t.Optional[Payload]] = [None] * len(input_payloads)
+        to_fetch = []
+        for i, (payload, key) in enumerate(zip(input_payloads, cache_keys)):
+            if key in cached:
+                payload.response = _deserialize_response(cached[key])
+                output_payloads[i] = payload
+                if on_response is not None:
+                    on_response(payload)
+            else:
+                to_fetch.append(i)
+
+        if len(cached):
+            logger.info(
+                f"Served {len(input_payloads) - len(to_fetch)} of {len(input_payloads)} payloads from the LLM response cache."
+            )
+
+        if len(to_fetch):
+            fetched = self._run_async_fetch(
+                [input_payloads[i] for i in to_fetch], on_response
+            )
+            for i, payload in zip(to_fetch, fetched):
+                output_payloads[i] = payload
 
-    def fetch_responses(self, input_payloads: list[Payload]) -> list[Payload]:
+            if self._cache is not None:
+                self._cache.set_many(
+                    {
+                        cache_keys[i]: _serialize_response(payload.response)
+                        for i, payload in zip(to_fetch, fetched)
+                        if payload.error is None
+                        and payload.response is not None
+                        and cache_keys[i] is not None
+                    }
+                )
+
+        return output_payloads  # type: ignore
+
+    def _run_async_fetch(
+        self,
+        input_payloads: list[Payload],
+        on_response: t.Optional[t.Callable[[Payload], None]] = None,
+    ) -> list[Payload]:
         try:
             loop = asyncio.get_running_loop()
         except RuntimeError:
@@ -153,21 +400,60 @@ class LLMMulticlient:
             logger.warning(
                 "Detected a running event loop, scheduling requests in a separate thread."
             )
+            # carry over the context, so token usage is attributed to the operator being profiled
+            context = contextvars.copy_context()
             with ThreadPoolExecutor(max_workers=1) as executor:
                 return executor.submit(
-                    asyncio.run, self.async_fetch_responses(input_payloads)
+                    context.run,
+                    asyncio.run,
+                    self.async_fetch_responses(input_payloads, on_response),
                 ).result()
         else:
-            return asyncio.run(self.async_fetch_responses(input_payloads))
+            return asyncio.run(self.async_fetch_responses(input_payloads, on_response))
 
     async def async_fetch_responses(
-        self, input_payloads: list[Payload]
+        self,
+        input_payloads: list[Payload],
+        on_response: t.Optional[t.Callable[[Payload], None]] = None,
     ) -> list[Payload]:
         rpm_limiter = aiolimiter.AsyncLimiter(self._rpm_limit, time_period=60)
         tpm_limiter = aiolimiter.AsyncLimiter(self._tpm_limit, time_period=60)
+        concurrency = AIMDLimiter(
+            max_limit=self._max_concurrency,
+            initial_limit=self._concurrency_limit,
+            backoff_base=self._backoff_base,
+            backoff_max=self._backoff_max,
+            throttle_backoff_min=self._throttle_backoff_min,
+        )
         async_outputs = [
-            async_process_payload(data, rpm_limiter, tpm_limiter, self.aclient, self._max_tries)
+            async_process_payload(
+                data,
+                rpm_limiter,
+                tpm_limiter,
+                self.aclient,
+                self._max_tries,
+                self._inflight,
+                concurrency,
+                self._token_counter,
+            )
             for data in input_payloads
         ]
+        if on_response is not None:
+            async_outputs = [
+                self._notify_when_done(coro, on_response) for coro in async_outputs
+            ]
         output_payloads = await tqdm_asyncio.tqdm_asyncio.gather(*async_outputs)
+        self._concurrency_limit = concurrency.limit
+        if concurrency.num_throttled > 0:
+            logger.info(
+                f"LLM API throttled {concurrency.num_throttled} requests, concurrency limit is now {int(concurrency.limit)}."
+            )
         return output_payloads
+
+    @staticmethod
+    async def _notify_when_done(
+        coro: t.Awaitable[Payload], on_response: t.Callable[[Payload], None]
+    ) -> Payload:
+        payload = await coro
+        on_response(payload)
+        return payload
@@ -9,9 +9,14 @@ of generated text based on the alignment between the generated text and the refe
 """
 
 from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import multiprocessing
+import os
 import typing as t
 
 from loguru import logger
+import numpy as np
 import polars as pl
 from uptrain.framework import Settings
 
@@ -22,6 +27,116 @@ from uptrain.utilities import lazy_load_dep
 
 nltk = lazy_load_dep("nltk", "nltk")
 
+# METEOR is slow per pair, so the pool pays for itself on much smaller inputs than rouge
+METEOR_POOL_MIN_PAIRS = 500
+# bound on the number of entries in each of the tokenization, stemming and synonym caches
+METEOR_CACHE_SIZE = 65_536
+
+
+# -----------------------------------------------------------
+# Batched METEOR scoring
+# -----------------------------------------------------------
+
+
+class _CachedStemmer:
+    """A porter stemmer that memoises its output. METEOR stems every word left
+    unmatched, for every pair."""
+
+    def __init__(self, maxsize: int):
+        self.stem = functools.lru_cache(maxsize=maxsize)(nltk.stem.porter.PorterStemmer().stem)
+
+
+class _CachedWordNet:
+    """Memoises the synset lookups METEOR makes for every word that isn't matched by its
+    exact or stemmed form."""
+
+    def __init__(self, maxsize: int):
+        wordnet = nltk.corpus.wordnet
+        wordnet.ensure_loaded()
+        self.synsets = functools.lru_cache(maxsize=maxsize)(wordnet.synsets)
+
+
+_STEMMER: t.Optional[_CachedStemmer] = None
+_WORDNET: t.Optional[_CachedWordNet] = None
+_TOKENIZE: t.Optional[t.Callable[[str], tuple[str, ...]]] = None
+
+
+def _init_worker(cache_size: int = METEOR_CACHE_SIZE) -> None:
+    """Loads the NLTK data and sets up the caches, once per process."""
+    global _STEMMER, _WORDNET, _TOKENIZE
+    if _TOKENIZE is None:
+        _STEMMER = _CachedStemmer(cache_size)
+        _WORDNET = _CachedWordNet(cache_size)
+        _TOKENIZE = functools.lru_cache(maxsize=cache_size)(
+            lambda text: tuple(nltk.word_tokenize(text))
+        )
+
+
+def _score_chunk(pairs: list[tuple[str | None, str | None]]) -> list[float]:
+    """Scores (generated, source) pairs. Defined at the module level so it can be sent
+    to a process pool."""
+    _init_worker()
+    scores = []
+    for generated, source in pairs:
+        if generated is None or source is None:
+            scores.append(0.0)
+        else:
+            scores.append(
+                nltk.translate.meteor_score.meteor_score(
+                    references=[_TOKENIZE(source)],  # type: ignore
+                    hypothesis=_TOKENIZE(generated),  # type: ignore
+                    stemmer=_STEMMER,
+                    wordnet=_WORDNET,
+                )
+            )
+    return scores
+
+
+def meteor_scores(
+    text_generated: list[str | None],
+    text_source: list[str | None],
+    num_workers: int | None = None,
+    chunk_size: int = 500,
+) -> np.ndarray:
+    """Computes the METEOR score of each generated text against its source text, with the
+    same tokenization and scores as `nltk.translate.meteor`. Pairs with a missing text
+    score 0.
+
+    Each distinct (generated, source) pair is scored once. The distinct pairs are sorted
+    by their source text and split into chunks, so repeated sources land in the same
+    worker and hit its caches. Large inputs are scored on a process pool of `num_workers`
+    processes (defaults to the cpu count).
+
+    Returns:
+        np.ndarray: Array of shape (num_rows,) with the scores.
+    """
+    assert len(text_generated) == len(text_source), "Expected one source per generated text"
+    pair_index: dict[tuple[str | None, str | None], int] = {}
+    inverse = np.array(
+        [pair_index.setdefault(pair, len(pair_index)) for pair in zip(text_generated, text_source)],
+        dtype=np.int64,
+    )
+    pairs = sorted(pair_index, key=lambda pair: (pair[1] or "", pair[0] or ""))
+    chunks = [pairs[start : start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+
+    num_workers = num_workers or os.cpu_count() or 1
+    if len(pairs) < METEOR_POOL_MIN_PAIRS or num_workers <= 1 or len(chunks) <= 1:
+        chunk_scores = [_score_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(num_workers, len(chunks)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        ) as executor:
+            chunk_scores = list(executor.map(_score_chunk, chunks))
+
+    unique_scores = np.zeros(len(pair_index), dtype=np.float64)
+    if len(pairs):
+        unique_scores[[pair_index[pair] for pair in pairs]] = [
+            s for chunk in chunk_scores for s in chunk
+        ]
+    return unique_scores[inverse]
+
 
 @register_op
 class METEORScore(ColumnOp):
@@ -33,6 +148,8 @@ class METEORScore(ColumnOp):
         col_in_generated (str): The name of the input column containing the generated text.
         col_in_source (str): The name of the input column containing the source text.
         col_out (str): The name of the output column containing the METEOR scores.
+        num_workers (int | None): Number of processes to score large inputs with. Defaults to the cpu count.
+        chunk_size (int): Number of distinct pairs sent to a worker at a time.
 
     Returns:
         dict: A dictionary containing the METEOR scores for each pair of generated and source text.
@@ -72,24 +189,21 @@ class METEORScore(ColumnOp):
     col_in_generated: str = "text_generated"
     col_in_source: str = "text_source"
     col_out: str = "METEOR_score"
+    num_workers: t.Optional[int] = None
+    chunk_size: int = 500
 
     def setup(self, settings: Settings):
         return self
 
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
-        text_generated = data.get_column(self.col_in_generated)  # candidate/preds
-        text_source = data.get_column(self.col_in_source)  # reference/target
-
-        results = []
-        scores = []
-        for i in range(len(text_generated)):
-            scorer = nltk.translate.meteor
-            if text_source[i] is None or text_generated[i] is None:
-                scores.append({"METEOR": 0})
-            else:
-                preds = nltk.word_tokenize(text_generated[i])
-                target = [nltk.word_tokenize(text_source[i])]
-                scores.append({"METEOR": scorer(references=target, hypothesis=preds)})
-
-        results = pl.Series([int(x["METEOR"] * 100) for x in scores])
+        text_generated = data.get_column(self.col_in_generated).to_list()  # candidate/preds
+        text_source = data.get_column(self.col_in_source).to_list()  # reference/target
+
+        scores = meteor_scores(
+            text_generated,
+            text_source,
+            num_workers=self.num_workers,
+            chunk_size=self.chunk_size,
+        )
+        results = pl.Series((scores * 100).astype(np.int64))
         return {"output": data.with_columns([results.alias(self.col_out)])}
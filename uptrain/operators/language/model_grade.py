@@ -34,6 +34,10 @@ MATCH_FNS = {
     "starts_or_endswith": lambda x, y: x.startswith(y) or x.endswith(y),
 }
 INVALID_STR = "__invalid__"
+# values get_choice returns when the regexes can't find a choice, per eval type
+INVALID_CHOICES = {"tot_score": -5, "tot_classify": -1}
+# number of (completion -> choice) mappings extracted by the LLM that each operator keeps
+CHOICE_CACHE_SIZE = 4096
 
 ANSWER_PROMPTS = {
     # e.g. "Yes"
@@ -221,6 +225,10 @@ class ModelGradeScore(ColumnOp):
     for grading. It is a wrapper using the same utilities from the OpenAI evals library,
     replacing just the completion call.
 
+    The choice is parsed out of each completion with regexes first. Completions the regexes can't parse are
+    sent to the LLM together, in a single concurrent round, to extract the choice from them. How many
+    completions couldn't be parsed is reported in the `metrics` of the `extra` output.
+
     Attributes:
         grading_prompt_template (str): Template for the grading prompt.
         eval_type (Literal["cot_classify", "classify", "classify_cot"]): The type of evaluation for grading ("cot_classify" by default).
@@ -240,6 +248,7 @@ class ModelGradeScore(ColumnOp):
     def setup(self, settings: Settings):
         self._api_client = LLMMulticlient(settings=settings)
         self._settings = settings
+        self._choice_cache = {}
         self.model = settings.model.replace("azure/", "")
         if not (self.eval_type in ["cot_classify", "tot_classify", 'tot_score']):
             raise Exception("Only eval_type: cot_classify and tot_classify is supported for model grading check")
@@ -271,9 +280,7 @@ class ModelGradeScore(ColumnOp):
                 metadata={"index": id},
             )
 
-    def get_choice_via_llm(self, text: str, grading_prompt_template: str) -> str:
-        """Queries LLM to get score from the text"""
-
+    def _make_extraction_payload(self, id: t.Any, text: str, grading_prompt_template: str) -> Payload:
         prompt = f"""
         Extract the score from the given text. The available choices and associated scores is present in the context.
 
@@ -282,22 +289,62 @@ class ModelGradeScore(ColumnOp):
 
         Score:
         """
+        return self._make_payload(id, [{"role": "user", "content": prompt}])
 
-        payload = self._make_payload(0, [{"role": "user", "content": prompt}])
-        output_payload = self._api_client.fetch_responses([payload])[0]
-
-        try:
-            score = output_payload.response.choices[0].message.content
-            float(score)
-            return score
-        except:
-            return str(0.0)
+    def _fetch_choices_via_llm(self, texts: list[str], grading_prompt_template: str) -> dict[str, str]:
+        input_payloads = [
+            self._make_extraction_payload(idx, text, grading_prompt_template)
+            for idx, text in enumerate(texts)
+        ]
+        choices = {}
+        for output_payload in self._api_client.fetch_responses(input_payloads):
+            text = texts[output_payload.metadata["index"]]
+            if output_payload.error is not None:
+                logger.error(f"Error when extracting the choice via LLM: {output_payload.error}")
+                continue
+            try:
+                score = output_payload.response.choices[0].message.content
+                float(score)
+            except:
+                score = str(0.0)
+            choices[text] = score
+        return choices
 
+    def get_choice_via_llm(self, text: str, grading_prompt_template: str) -> str:
+        """Queries LLM to get score from the text"""
+        if grading_prompt_template == self.grading_prompt_template:
+            return self.get_choices_via_llm([text])[0]
+        return self._fetch_choices_via_llm([text], grading_prompt_template).get(text, str(0.0))
+
+    def get_choices_via_llm(self, texts: list[str]) -> list[str]:
+        """Queries LLM to get the scores from multiple texts, with a single concurrent round of
+        requests. Scores extracted before are served from a local cache, and texts without a
+        valid score (or whose request failed) score 0."""
+        to_fetch = list(dict.fromkeys(text for text in texts if text not in self._choice_cache))
+        choices = {text: self._choice_cache[text] for text in texts if text in self._choice_cache}
+        if len(to_fetch):
+            fetched = self._fetch_choices_via_llm(to_fetch, self.grading_prompt_template)
+            choices.update(fetched)
+            # failed requests aren't cached, so they are retried on the next run
+            for text, score in fetched.items():
+                if len(self._choice_cache) >= CHOICE_CACHE_SIZE:
+                    del self._choice_cache[next(iter(self._choice_cache))]
+                self._choice_cache[text] = score
+        return [choices.get(text, str(0.0)) for text in texts]
 
     def get_choice(
         self, text: str, eval_type: str, match_fn: Union[str, Callable], choice_strings: Iterable[str], choice_scores: dict = {}
     ) -> str:
         """Clean the answer string to a choice string to one of choice_strings. Return '__invalid__.' if no match."""
+        choice = self._parse_choice(text, eval_type, match_fn, choice_strings, choice_scores)
+        if choice is None:
+            return self.get_choice_via_llm(text, self.grading_prompt_template)
+        return choice
+
+    def _parse_choice(
+        self, text: str, eval_type: str, match_fn: Union[str, Callable], choice_strings: Iterable[str], choice_scores: dict = {}
+    ) -> t.Optional[str]:
+        """Same as `get_choice` using the regexes alone, returns None where it needs the LLM to extract the choice."""
         if eval_type == "tot_score":
             score = ''
             if len(score) == 0:
@@ -381,12 +428,12 @@ class ModelGradeScore(ColumnOp):
                         try:
                             float(choice)
                             if float(choice) > 1.0 or float(choice) < 0.0:
-                                return self.get_choice_via_llm(text, self.grading_prompt_template)
+                                return None
                             return str(choice)
                         except:
-                            return self.get_choice_via_llm(text, self.grading_prompt_template)
+                            return None
                     else:
-                        return self.get_choice_via_llm(text, self.grading_prompt_template)
+                        return None
                 else:
                     line = "".join(c for c in line if c not in string.punctuation)
                     if not line:
@@ -419,31 +466,72 @@ class ModelGradeScore(ColumnOp):
         ]
         output_payloads = self._api_client.fetch_responses(input_payloads)
 
-        results = []
+        # first pass: parse the choice out of every completion with the regexes, and
+        # collect those that need the LLM to extract it
+        parsed = []
+        to_extract = []
+        num_errors = num_unparsed = 0
         for res in output_payloads:
             idx = res.metadata["index"]
             if res.error is not None:
                 logger.error(
                     f"Error when processing payload at index {idx}: {res.error}"
                 )
+                num_errors += 1
+                parsed.append((idx, None, None))
+                continue
+            try:
+                resp_text = res.response.choices[0].message.content
+                choice = self._parse_choice(
+                    text=resp_text,
+                    eval_type=self.eval_type,
+                    match_fn="extract_score",
+                    choice_strings=self.choice_strings,
+                    choice_scores = self.choice_scores
+                )
+            except Exception as e:
+                logger.error(
+                    f"Error when processing payload at index {idx}, not API error: {e}"
+                )
+                parsed.append((idx, None, None))
+                continue
+            if choice is None:
+                to_extract.append(resp_text)
+            if choice is None or choice == INVALID_CHOICES.get(self.eval_type, INVALID_STR):
+                num_unparsed += 1
+            parsed.append((idx, choice, resp_text))
+
+        # second pass: a single concurrent round of requests for all the unparsed completions
+        num_cached = sum(1 for text in dict.fromkeys(to_extract) if text in self._choice_cache)
+        extracted = iter(self.get_choices_via_llm(to_extract))
+
+        results = []
+        for idx, choice, resp_text in parsed:
+            if resp_text is None:
                 results.append((idx, None, None))
-            else:
-                try:
-                    resp_text = res.response.choices[0].message.content
-                    choice = self.get_choice(
-                        text=resp_text,
-                        eval_type=self.eval_type,
-                        match_fn="extract_score",
-                        choice_strings=self.choice_strings,
-                        choice_scores = self.choice_scores
-                    )
-                    score = float(choice)
-                    results.append((idx, score, resp_text))
-                except Exception as e:
-                    logger.error(
-                        f"Error when processing payload at index {idx}, not API error: {e}"
-                    )
-                    results.append((idx, None, None))
+                continue
+            if choice is None:
+                choice = next(extracted)
+            try:
+                score = float(choice)
+                results.append((idx, score, resp_text))
+            except Exception as e:
+                logger.error(
+                    f"Error when processing payload at index {idx}, not API error: {e}"
+                )
+                results.append((idx, None, None))
+
+        num_responses = len(output_payloads) - num_errors
+        metrics = {
+            "rows_total": len(output_payloads),
+            "rows_errored": num_errors,
+            "rows_unparsed": num_unparsed,
+            "parse_failure_rate": round(num_unparsed / num_responses, 4) if num_responses else None,
+            "rows_extracted_via_llm": len(to_extract),
+            "llm_extraction_cache_hits": num_cached,
+        }
+        if num_unparsed:
+            logger.info(f"ModelGradeScore could not parse the choice from some completions: {metrics}")
 
         results = sorted(results, key=lambda x: x[0])
         if isinstance(self.col_out, list):
@@ -468,4 +556,4 @@ class ModelGradeScore(ColumnOp):
                     self.col_out + "_explanation"
                 ),
             ]
-        return {"output": data.with_columns(result_scores)}
+        return {"output": data.with_columns(result_scores), "extra": {"metrics": metrics}}
@@ -0,0 +1,234 @@
+"""
+Helpers to keep concurrent LLM requests within the provider's quotas - token counting
+for the TPM limiter, backoff delays on errors, and an AIMD concurrency limiter.
+"""
+
+from __future__ import annotations
+import asyncio
+from email.utils import parsedate_to_datetime
+import importlib.util
+import random
+import re
+import time
+import typing as t
+
+__all__ = [
+    "TokenCounter",
+    "HeuristicTokenCounter",
+    "TiktokenCounter",
+    "get_token_counter",
+    "get_retry_after",
+    "AIMDLimiter",
+    "DEFAULT_MAX_CONCURRENCY",
+]
+
+# default upper bound on concurrent LLM requests, see `Settings.llm_max_concurrency`
+DEFAULT_MAX_CONCURRENCY = 64
+
+# -----------------------------------------------------------
+# Counting prompt tokens
+# -----------------------------------------------------------
+
+# openai adds a few tokens per message for the role/separators, and primes the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+class TokenCounter:
+    """Counts the prompt tokens of a list of chat messages."""
+
+    def count(self, messages: list[dict]) -> int:
+        raise NotImplementedError
+
+    def observe(self, messages: list[dict], prompt_tokens: int) -> None:
+        """Feedback with the token count reported by the API for these messages."""
+        pass
+
+
+class HeuristicTokenCounter(TokenCounter):
+    """Estimates tokens from the number of characters. The chars-per-token ratio starts
+    out conservative, and is calibrated with the usage reported by the API using an
+    exponential moving average.
+    """
+
+    chars_per_token: float
+    smoothing: float
+
+    def __init__(self, chars_per_token: float = 3.0, smoothing: float = 0.1):
+        self.chars_per_token = chars_per_token
+        self.smoothing = smoothing
+
+    @staticmethod
+    def _num_chars(messages: list[dict]) -> int:
+        return sum(len(msg["role"]) + len(msg["content"] or "") for msg in messages)
+
+    def count(self, messages: list[dict]) -> int:
+        num_chars = self._num_chars(messages)
+        overhead = TOKENS_PER_MESSAGE * len(messages) + TOKENS_PER_REPLY
+        return int(num_chars / self.chars_per_token) + overhead
+
+    def observe(self, messages: list[dict], prompt_tokens: int) -> None:
+        text_tokens = prompt_tokens - TOKENS_PER_MESSAGE * len(messages) - TOKENS_PER_REPLY
+        num_chars = self._num_chars(messages)
+        if text_tokens <= 0 or num_chars == 0:
+            return
+        observed_ratio = num_chars / text_tokens
+        self.chars_per_token += self.smoothing * (observed_ratio - self.chars_per_token)
+
+
+class TiktokenCounter(TokenCounter):
+    """Counts tokens exactly with the tokenizer used by openai models."""
+
+    def __init__(self, model: str):
+        import tiktoken
+
+        try:
+            self._encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, messages: list[dict]) -> int:
+        num_tokens = TOKENS_PER_REPLY
+        for msg in messages:
+            num_tokens += TOKENS_PER_MESSAGE
+            num_tokens += len(self._encoding.encode(msg["role"]))
+            num_tokens += len(self._encoding.encode(msg["content"] or ""))
+        return num_tokens
+
+
+def get_token_counter(model: str) -> TokenCounter:
+    """Use tiktoken for openai models when it is installed, else the heuristic."""
+    is_openai = model.startswith("gpt") or model.startswith("azure")
+    if is_openai and importlib.util.find_spec("tiktoken") is not None:
+        return TiktokenCounter(model.replace("azure/", ""))
+    return HeuristicTokenCounter()
+
+
+# -----------------------------------------------------------
+# Backing off on errors
+# -----------------------------------------------------------
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: str) -> t.Optional[float]:
+    """Parse durations like `20ms`, `1s` or `6m0s` as sent in openai's ratelimit headers."""
+    parts = _DURATION_PART.findall(value)
+    if not len(parts):
+        return None
+    return sum(float(num) * _DURATION_UNITS[unit] for num, unit in parts)
+
+
+def get_retry_after(exc: Exception) -> t.Optional[float]:
+    """Read how long to wait before retrying from the headers of the error response, if
+    the provider sent any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        value = headers["retry-after"]
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+
+    waits = [
+        _parse_duration(headers[name])
+        for name in ["x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"]
+        if name in headers
+    ]
+    waits = [w for w in waits if w is not None]
+    return max(waits) if len(waits) else None
+
+
+# -----------------------------------------------------------
+# Adapting concurrency to the provider's capacity
+# -----------------------------------------------------------
+
+
+class AIMDLimiter:
+    """Limits the number of concurrent requests, adapting the limit with additive
+    increase/multiplicative decrease - the limit grows by about one for every `limit`
+    successful requests, and is cut by `decrease_factor` when the provider throttles us.
+
+    Only the first throttle from requests started at the current limit reduces it, so a
+    burst of errors from requests already in flight doesn't collapse the limit to 1.
+
+    Attributes:
+        limit (float): Current concurrency limit.
+        max_limit (int): Upper bound for the limit.
+        min_limit (int): Lower bound for the limit.
+        backoff_base (float): Base delay for the exponential backoff, in seconds.
+        backoff_max (float): Maximum delay for the exponential backoff, in seconds.
+        throttle_backoff_min (float): Base delay when throttled without a retry-after hint, in seconds. Per-minute
+            quotas take up to a minute to reset, so these retries wait much longer than for other errors.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        initial_limit: t.Optional[float] = None,
+        decrease_factor: float = 0.5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        throttle_backoff_min: float = 20.0,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial_limit if initial_limit is not None else max_limit)
+        self.limit = min(max(self.limit, min_limit), max_limit)
+        self.decrease_factor = decrease_factor
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.throttle_backoff_min = throttle_backoff_min
+        self.num_throttled = 0
+        self._active = 0
+        self._epoch = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> int:
+        """Wait for a free slot. Returns the epoch to pass to `on_throttle`."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < int(self.limit))
+            self._active += 1
+            return self._epoch
+
+    async def release(self) -> None:
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(self.limit + 1.0 / self.limit, float(self.max_limit))
+
+    def on_throttle(self, epoch: int) -> None:
+        self.num_throttled += 1
+        if epoch == self._epoch:
+            self.limit = max(self.limit * self.decrease_factor, float(self.min_limit))
+            self._epoch += 1
+
+    def backoff_delay(
+        self, attempt: int, exc: t.Optional[Exception] = None, throttled: bool = False
+    ) -> float:
+        """Delay before the next retry. Honours the provider's retry-after hints if present.
+        Else throttled requests back off exponentially from `throttle_backoff_min`, and other
+        errors use exponential backoff with full jitter."""
+        retry_after = get_retry_after(exc) if exc is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max) * random.uniform(1.0, 1.25)
+        if throttled:
+            delay = min(self.backoff_max, self.throttle_backoff_min * 2**attempt)
+            return delay * random.uniform(1.0, 1.25)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
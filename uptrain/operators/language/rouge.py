@@ -6,9 +6,14 @@ This module provides the `RougeScore` class, which allows comparing a generated
 """
 
 from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import multiprocessing
+import os
 import typing as t
 
 from loguru import logger
+import numpy as np
 import polars as pl
 from uptrain.framework import Settings
 
@@ -18,6 +23,92 @@ from uptrain.operators.base import *
 from uptrain.utilities import lazy_load_dep
 
 rouge_scorer = lazy_load_dep("rouge_score.rouge_scorer", "rouge_score")
+rouge_tokenizers = lazy_load_dep("rouge_score.tokenizers", "rouge_score")
+
+# below this many rows, spawning worker processes costs more than it saves
+ROUGE_POOL_MIN_ROWS = 2_000
+
+# -----------------------------------------------------------
+# Batched Rouge-L scoring
+# -----------------------------------------------------------
+
+_TOKENIZER = None
+
+
+def _init_worker() -> None:
+    """Creates the tokenizer once per process, instead of once per row."""
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        _TOKENIZER = rouge_tokenizers.DefaultTokenizer(use_stemmer=False)
+
+
+def _tokenize(text: str) -> list[str]:
+    _init_worker()
+    return _TOKENIZER.tokenize(text)  # type: ignore
+
+
+@functools.lru_cache(maxsize=16_384)
+def _tokenize_reference(text: str) -> tuple[str, ...]:
+    """The same reference is often scored against many generations, so its tokens are
+    memoised."""
+    return tuple(_tokenize(text))
+
+
+def _score_chunk(
+    pairs: list[tuple[str | None, str | None]]
+) -> list[tuple[float, float, float]]:
+    """Scores (generated, source) pairs. Defined at the module level so it can be sent
+    to a process pool."""
+    scores = []
+    for generated, source in pairs:
+        if generated is None or source is None:
+            scores.append((0.0, 0.0, 0.0))
+        else:
+            score = rouge_scorer._score_lcs(_tokenize_reference(source), _tokenize(generated))  # type: ignore
+            scores.append((score.precision, score.recall, score.fmeasure))
+    return scores
+
+
+def rouge_l_scores(
+    text_generated: list[str | None],
+    text_source: list[str | None],
+    num_workers: int | None = None,
+    chunk_size: int = 1000,
+) -> np.ndarray:
+    """Computes Rouge-L precision, recall and f1 for each pair of generated and source
+    text, with the same tokenization and scores as `rouge_scorer.RougeScorer(["rougeL"])`.
+    Pairs with a missing text score 0.
+
+    Rows are sorted by their source text and split into chunks, so repeated sources
+    land in the same worker and hit its tokenization cache. Large inputs are scored
+    on a process pool of `num_workers` processes (defaults to the cpu count).
+
+    Returns:
+        np.ndarray: Array of shape (num_rows, 3), with columns precision, recall and f1.
+    """
+    assert len(text_generated) == len(text_source), "Expected one source per generated text"
+    num_rows = len(text_generated)
+    order = sorted(range(num_rows), key=lambda i: text_source[i] or "")
+    chunks = [
+        [(text_generated[i], text_source[i]) for i in order[start : start + chunk_size]]
+        for start in range(0, num_rows, chunk_size)
+    ]
+
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_rows < ROUGE_POOL_MIN_ROWS or num_workers <= 1 or len(chunks) <= 1:
+        chunk_scores = [_score_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(num_workers, len(chunks)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        ) as executor:
+            chunk_scores = list(executor.map(_score_chunk, chunks))
+
+    scores = np.zeros((num_rows, 3), dtype=np.float64)
+    if num_rows:
+        scores[order] = np.array([s for chunk in chunk_scores for s in chunk], dtype=np.float64)
+    return scores
 
 
 @register_op
@@ -30,6 +121,8 @@ class RougeScore(ColumnOp):
         col_in_generated (str): The name of the input column containing the generated text.
         col_in_source (str): The name of the input column containing the source text.
         col_out (str): The name of the output column containing the Rouge scores.
+        num_workers (int | None): Number of processes to score large inputs with. Defaults to the cpu count.
+        chunk_size (int): Number of rows sent to a worker at a time.
 
     Returns:
         dict: A dictionary containing the Rouge scores for each pair of generated and source text.
@@ -71,22 +164,15 @@ class RougeScore(ColumnOp):
     col_in_generated: str = "text_generated"
     col_in_source: str = "text_source"
     col_out: str = "rouge_score"
+    num_workers: t.Optional[int] = None
+    chunk_size: int = 1000
 
     def setup(self, settings: Settings):
         return self
 
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
-        text_generated = data.get_column(self.col_in_generated)
-        text_source = data.get_column(self.col_in_source)
-
-        results = []
-        scores = []
-        for i in range(len(text_generated)):
-            scorer = rouge_scorer.RougeScorer(["rougeL"])  # type: ignore
-            if text_source[i] is None or text_generated[i] is None:
-                scores.append({"rougeL": (0, 0, 0)})
-            else:
-                scores.append(scorer.score(text_source[i], text_generated[i]))
+        text_generated = data.get_column(self.col_in_generated).to_list()
+        text_source = data.get_column(self.col_in_source).to_list()
 
         type_to_index = {"precision": 0, "recall": 1, "f1": 2}
         if self.score_type not in type_to_index:
@@ -94,5 +180,11 @@ class RougeScore(ColumnOp):
         else:
             score_index = type_to_index[self.score_type]
 
-        results = pl.Series([int(x["rougeL"][score_index] * 100) for x in scores])
+        scores = rouge_l_scores(
+            text_generated,
+            text_source,
+            num_workers=self.num_workers,
+            chunk_size=self.chunk_size,
+        )
+        results = pl.Series((scores[:, score_index] * 100).astype(np.int64))
         return {"output": data.with_columns([results.alias(self.col_out)])}
@@ -7,6 +7,7 @@ Operators:
 """
 
 from __future__ import annotations
+import os
 import typing as t
 
 from loguru import logger
@@ -17,6 +18,9 @@ if t.TYPE_CHECKING:
     from uptrain.framework import Settings
 from uptrain.operators.base import *
 from uptrain.utilities import lazy_load_dep
+from uptrain.utilities.cache import get_cache_dir, hash_key
+from uptrain.utilities.vector_index import VectorIndex, get_vector_index, load_vector_index
+from uptrain.operators.clustering import stack_embeddings
 
 
 @register_op
@@ -33,8 +37,12 @@ class TopicAssignmentviaCluster(ColumnOp):
         col_out_cluster (str): The name of the column in the DataFrame to output the assigned cluster index.
         col_out_dist (str): The name of the column in the DataFrame to output the euclidean distance from its cluster centroid.
         col_aggs (list[str]): Optional,pecify name of columns to aggregate by which was used during clustering, ex: if you ran separate clustering for seperate organisations
+        index_kind (str): Nearest-neighbour index used to find the closest centroid - "exact" (default), or an approximate HNSW index with "hnswlib" or "faiss".
+        persist_index (bool): Whether to save the index built from the centroids in the cache folder and reuse it across runs.
     """
 
+    is_rowwise: t.ClassVar[bool] = False
+
     cluster_centroids: dict
     topics: dict
     col_embeddings: str = 'embedding'
@@ -42,15 +50,35 @@ class TopicAssignmentviaCluster(ColumnOp):
     col_out_cluster: str = "cluster_index"
     col_out_dist: str = 'cluster_index_distance'
     col_aggs: list[str] = []
+    index_kind: t.Literal["exact", "hnswlib", "faiss"] = "exact"
+    persist_index: bool = True
+    _indices: dict = {}
 
     def setup(self, settings: Settings):
         assert len(self.topics) > 0, "Topic list should not be empty"
         assert len(self.topics) == len(self.cluster_centroids), "Each group should have a topic"
+        index_dir = None
+        if self.persist_index and settings is not None:
+            index_dir = os.path.join(get_cache_dir(settings.logs_folder), "vector_index")
+
+        self._indices = {}
         for key in self.topics.keys():
             assert len(self.topics[key]) == len(self.cluster_centroids[key]), "Each cluster should have a topic"
             self.cluster_centroids[key] = np.array(self.cluster_centroids[key])
+            self._indices[key] = self._get_index(self.cluster_centroids[key], index_dir)
         return self
 
+    def _get_index(self, centroids: np.ndarray, index_dir: t.Optional[str]) -> VectorIndex:
+        """Load the index over these centroids saved by a previous run, or build (and save) it."""
+        if index_dir is None:
+            return get_vector_index(self.index_kind).build(centroids)
+        dirpath = os.path.join(index_dir, hash_key([self.index_kind, centroids.tolist()]))
+        index = load_vector_index(dirpath)
+        if index is None:
+            index = get_vector_index(self.index_kind).build(centroids)
+            index.save(dirpath)
+        return index
+
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:      
         res_data_arr = []
 
@@ -68,29 +96,17 @@ class TopicAssignmentviaCluster(ColumnOp):
                 for key,val in unique_agg_key.items():
                     cond = cond & (data[key] == val)
             data_subset = data.filter(cond)
-            embeddings = np.asarray(data_subset[self.col_embeddings])
 
-            if str(unique_agg_key) not in self.cluster_centroids:
-                cluster_centroids = None
-                topics = ['Not Defined']
+            if str(unique_agg_key) not in self._indices or not len(data_subset):
+                assigned_topics = ['Not Defined'] * len(data_subset)
+                assigned_clusters = np.full(len(data_subset), -1, dtype=np.int64)
+                cluster_index_distances = np.full(len(data_subset), -1.0)
             else:
-                cluster_centroids = np.array(self.cluster_centroids[str(unique_agg_key)])
-                topics = self.topics[str(unique_agg_key)]
-
-            assigned_topics = []
-            assigned_clusters = []
-            cluster_index_distances = []
-            for index in range(len(embeddings)):
-                if cluster_centroids is None:
-                    cluster_index_distances.append(float(-1))
-                    assigned_topics.append(topics[0])
-                    assigned_clusters.append(-1)
-                else:
-                    dists = np.linalg.norm(embeddings[index] - cluster_centroids, axis=1)
-                    assigned_cluster = np.argmin(dists)
-                    cluster_index_distances.append(np.min(dists))
-                    assigned_topics.append(topics[assigned_cluster])
-                    assigned_clusters.append(assigned_cluster)
+                embeddings = stack_embeddings(data_subset[self.col_embeddings])
+                labels, distances = self._indices[str(unique_agg_key)].search(embeddings, k=1)
+                assigned_clusters, cluster_index_distances = labels[:, 0], distances[:, 0]
+                topics = np.asarray(self.topics[str(unique_agg_key)], dtype=object)
+                assigned_topics = topics[assigned_clusters].tolist()
 
             data_subset = data_subset.with_columns([
                     pl.Series(assigned_topics).alias(self.col_out),
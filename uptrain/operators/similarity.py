@@ -26,6 +26,11 @@ class CosineSimilarity(ColumnOp):
         col_in_vector_1 (str): The name of the column containing the first vector.
         col_in_vector_2 (str): The name of the column containing the second vector.
         col_out (str): The name of the output column containing the cosine similarity scores.
+        max_memory_mb (float): Cap on the memory used for the stacked vectors, the columns are
+            processed in chunks of rows that fit within it.
+
+    Rows where either vector is null get a null score, and rows where either vector is all
+    zeros get a score of 0.
 
     Returns:
         dict: A dictionary containing the cosine similarity scores.
@@ -58,8 +63,8 @@ class CosineSimilarity(ColumnOp):
         shape: (2,)
         Series: '_col_0' [f64]
         [
-                1.861259
-                0.288437
+                0.959412
+                0.994612
         ]
         ```
 
@@ -68,6 +73,7 @@ class CosineSimilarity(ColumnOp):
     col_in_vector_1: str
     col_in_vector_2: str
     col_out: str = "cosine_similarity"
+    max_memory_mb: float = 256
 
     def setup(self, settings: Settings):
         return self
@@ -75,12 +81,70 @@ class CosineSimilarity(ColumnOp):
     def run(self, data: pl.DataFrame) -> TYPE_TABLE_OUTPUT:
         vector_1 = data.get_column(self.col_in_vector_1)
         vector_2 = data.get_column(self.col_in_vector_2)
-
-        results = []
-        for i in range(len(vector_1)):
-            v1 = np.array(vector_1[i])
-            v2 = np.array(vector_2[i])
-            similarity_score = np.dot(v1, v2) / np.linalg.norm(v1) * np.linalg.norm(v2)
-            results.append(similarity_score)
-
-        return {"output": data.with_columns(pl.Series(results).alias(self.col_out))}
+        results = cosine_similarity_columns(
+            vector_1, vector_2, max_memory_bytes=int(self.max_memory_mb * 1024 * 1024)
+        )
+        return {
+            "output": data.with_columns(
+                pl.Series(self.col_out, results, nan_to_null=True)
+            )
+        }
+
+
+def _to_list_series(series: pl.Series) -> pl.Series:
+    if isinstance(series.dtype, pl.Array):
+        return series.cast(pl.List(series.dtype.inner))  # type: ignore
+    return series
+
+
+def _stack_rows(series: pl.Series, dim: int) -> np.ndarray:
+    """Stack a list column with no nulls/empty lists into a contiguous float32 matrix."""
+    flat = series.explode().cast(pl.Float32).to_numpy()
+    if len(flat) != len(series) * dim:
+        raise ValueError(f"All vectors in column: {series.name} must have {dim} elements.")
+    return np.ascontiguousarray(flat, dtype=np.float32).reshape(len(series), dim)
+
+
+def cosine_similarity_columns(
+    vector_1: pl.Series, vector_2: pl.Series, max_memory_bytes: int = 256 * 1024 * 1024
+) -> np.ndarray:
+    """Row-wise cosine similarity between two columns of vectors.
+
+    The columns are processed in chunks of rows, sized so the float32 matrices for a chunk
+    stay within `max_memory_bytes`. Rows where either vector is null or empty get NaN
+    (null in the output column). If either vector has zero norm, the similarity is 0.
+    """
+    assert len(vector_1) == len(vector_2), "Both vector columns must have the same length"
+    vector_1, vector_2 = _to_list_series(vector_1), _to_list_series(vector_2)
+    results = np.full(len(vector_1), np.nan, dtype=np.float64)
+
+    lengths_1 = vector_1.list.len().fill_null(0).to_numpy()
+    lengths_2 = vector_2.list.len().fill_null(0).to_numpy()
+    valid = (lengths_1 > 0) & (lengths_2 > 0)
+    if not valid.any():
+        return results
+
+    dim = int(lengths_1[valid][0])
+    if (lengths_1[valid] != dim).any() or (lengths_2[valid] != dim).any():
+        raise ValueError("All vectors must have the same number of elements.")
+
+    valid_idx = np.flatnonzero(valid)
+    all_valid = len(valid_idx) == len(valid)
+    bytes_per_row = 2 * dim * np.dtype(np.float32).itemsize
+    chunk_size = max(int(max_memory_bytes // bytes_per_row), 1)
+    for start in range(0, len(valid_idx), chunk_size):
+        idx = valid_idx[start : start + chunk_size]
+        if all_valid:
+            chunk_1 = vector_1.slice(int(idx[0]), len(idx))
+            chunk_2 = vector_2.slice(int(idx[0]), len(idx))
+        else:
+            chunk_1, chunk_2 = vector_1[idx], vector_2[idx]
+        mat_1, mat_2 = _stack_rows(chunk_1, dim), _stack_rows(chunk_2, dim)
+
+        dots = np.einsum("ij,ij->i", mat_1, mat_2, dtype=np.float64)
+        norms = np.sqrt(np.einsum("ij,ij->i", mat_1, mat_1, dtype=np.float64)) * np.sqrt(
+            np.einsum("ij,ij->i", mat_2, mat_2, dtype=np.float64)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            results[idx] = np.where(norms > 0, dots / norms, 0.0)
+    return results
@@ -199,13 +199,16 @@ def polars_to_pandas(data: pl.DataFrame):
 # -----------------------------------------------------------
 
 
-def clear_directory(dir_path: str):
+def clear_directory(dir_path: str, exclude: t.Optional[list[str]] = None):
     """Clears the directory at dir_path but without deleting the directory itself. `shutil.rmtree` will
-    have difficulties with mounted volumes or network drives.
+    have difficulties with mounted volumes or network drives. Entries named in `exclude` are kept.
     """
     import shutil
 
+    exclude = exclude if exclude is not None else []
     for filename in os.listdir(dir_path):
+        if filename in exclude:
+            continue
         file_path = os.path.join(dir_path, filename)
         if os.path.isfile(file_path) or os.path.islink(file_path):
             os.unlink(file_path)
@@ -0,0 +1,334 @@
+"""
+On-disk caches used to avoid recomputing expensive results (LLM responses, parsed
+queries, etc.) across runs. Everything is kept under `<logs_folder>/.uptrain_cache`,
+which is preserved when a `CheckSet` clears its logs directory.
+"""
+
+from __future__ import annotations
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+
+import numpy as np
+
+from uptrain.utilities import jsondumps, jsondump, jsonload
+
+__all__ = ["CACHE_DIR_NAME", "get_cache_dir", "hash_key", "SqliteCache", "EmbeddingStore"]
+
+CACHE_DIR_NAME = ".uptrain_cache"
+
+
+def get_cache_dir(logs_folder: str) -> str:
+    """Returns the cache directory for the given logs folder, creating it if needed."""
+    cache_dir = os.path.join(logs_folder, CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def hash_key(obj: t.Any) -> str:
+    """Canonical hash of a json-serializable object, independent of dict key order."""
+    serialized = jsondumps(obj, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class SqliteCache:
+    """A persistent key-value store backed by a single SQLite table.
+
+    Entries older than `ttl` seconds are treated as missing. When the store grows beyond
+    `max_entries` rows or `max_bytes` of values, the least recently accessed entries
+    are evicted. A connection is opened per operation, so a cache object can be shared
+    across threads.
+
+    Attributes:
+        fpath (str): Path to the SQLite database file.
+        ttl (float | None): Time to live for each entry, in seconds. None means entries never expire.
+        max_entries (int | None): Maximum number of entries to retain.
+        max_bytes (int | None): Maximum total size of the stored values, in bytes.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that were not found or had expired.
+    """
+
+    _BATCH_SIZE = 500  # stay under SQLite's limit on the number of bound variables
+
+    def __init__(
+        self,
+        fpath: str,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+    ):
+        self.fpath = fpath
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_accessed_at ON cache (accessed_at)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self) -> t.Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.fpath, timeout=30)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        """Look up multiple keys at once. Missing/expired keys are absent from the result."""
+        found = {}
+        now = time.time()
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock, self._connect() as conn:
+            for i in range(0, len(unique_keys), self._BATCH_SIZE):
+                batch = unique_keys[i : i + self._BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, value, created_at FROM cache WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if self.ttl is None or now - created_at <= self.ttl:
+                        found[key] = value
+            if len(found):
+                found_keys = list(found)
+                for i in range(0, len(found_keys), self._BATCH_SIZE):
+                    batch = found_keys[i : i + self._BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    conn.execute(
+                        f"UPDATE cache SET accessed_at = ? WHERE key IN ({placeholders})",
+                        [now, *batch],
+                    )
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def get(self, key: str) -> bytes | None:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: dict[str, bytes | str]) -> None:
+        """Insert or overwrite multiple entries, then evict as needed."""
+        if not len(items):
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            rows.append((key, value, len(value), now, now))
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict(conn, now)
+
+    def set(self, key: str, value: bytes | str) -> None:
+        self.set_many({key: value})
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        if self.ttl is not None:
+            conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+
+        if self.max_entries is not None:
+            (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+        if self.max_bytes is not None:
+            (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+            if total > self.max_bytes:
+                # walk from the least recently used entry, until enough space is freed
+                excess, to_delete = total - self.max_bytes, []
+                for key, size in conn.execute(
+                    "SELECT key, size FROM cache ORDER BY accessed_at ASC"
+                ):
+                    if excess <= 0:
+                        break
+                    to_delete.append((key,))
+                    excess -= size
+                conn.executemany("DELETE FROM cache WHERE key = ?", to_delete)
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        return count
+
+
+# one lock per store directory, shared by every EmbeddingStore on it in this process
+_STORE_LOCKS: dict[str, threading.Lock] = {}
+_STORE_LOCKS_GUARD = threading.Lock()
+
+
+def _get_store_lock(dirpath: str) -> threading.Lock:
+    with _STORE_LOCKS_GUARD:
+        return _STORE_LOCKS.setdefault(os.path.realpath(dirpath), threading.Lock())
+
+
+class EmbeddingStore:
+    """A persistent store of float32 vectors for a single embedding model.
+
+    Vectors are appended to a raw float32 file that is read back as a memory-mapped
+    array, and the text hash for each row is appended to an index file. Vectors are
+    written before their index entries, so rows from an interrupted write are dropped
+    when the store is next opened.
+
+    Stores opened on the same directory in one process share a lock, and each picks up
+    the rows the others appended before every lookup and write. Only one process should
+    write to a store at a time.
+
+    Attributes:
+        dirpath (str): Directory holding the store files.
+        dim (int | None): Dimension of the stored vectors, known once the first vector is added.
+    """
+
+    def __init__(self, dirpath: str):
+        self.dirpath = dirpath
+        os.makedirs(dirpath, exist_ok=True)
+        self._vectors_fpath = os.path.join(dirpath, "vectors.f32")
+        self._index_fpath = os.path.join(dirpath, "index.txt")
+        self._meta_fpath = os.path.join(dirpath, "meta.json")
+        self._lock = _get_store_lock(dirpath)
+        self._mmap: np.memmap | None = None
+        self._index: dict[str, int] = {}
+        self._num_rows = 0
+        self._index_offset = 0  # bytes of the index file read so far
+        self.dim = None
+
+        with self._lock:
+            if os.path.exists(self._meta_fpath):
+                with open(self._meta_fpath, "r") as f:
+                    self.dim = jsonload(f)["dim"]
+                self._load()
+
+    def _load(self) -> None:
+        assert self.dim is not None
+        num_vectors = 0
+        if os.path.exists(self._vectors_fpath):
+            num_vectors = os.path.getsize(self._vectors_fpath) // (4 * self.dim)
+        keys = []
+        if os.path.exists(self._index_fpath):
+            with open(self._index_fpath, "r") as f:
+                keys = [line.rstrip("\n") for line in f]
+        num_rows = min(num_vectors, len(keys))
+
+        # drop anything left over from an interrupted write
+        if num_vectors > num_rows:
+            with open(self._vectors_fpath, "r+b") as f:
+                f.truncate(num_rows * 4 * self.dim)
+        if len(keys) > num_rows:
+            with open(self._index_fpath, "w") as f:
+                f.writelines(key + "\n" for key in keys[:num_rows])
+        self._index = {}
+        for row, key in enumerate(keys[:num_rows]):
+            self._index.setdefault(key, row)
+        self._num_rows = num_rows
+        self._index_offset = (
+            os.path.getsize(self._index_fpath) if os.path.exists(self._index_fpath) else 0
+        )
+
+    def _refresh(self) -> None:
+        """Read the rows appended to the index since we last looked, by another store on the
+        same directory. Call with the lock held."""
+        if self.dim is None:
+            if not os.path.exists(self._meta_fpath):
+                return
+            with open(self._meta_fpath, "r") as f:
+                self.dim = jsonload(f)["dim"]
+        if not os.path.exists(self._index_fpath):
+            return
+        if os.path.getsize(self._index_fpath) <= self._index_offset:
+            return
+        with open(self._index_fpath, "rb") as f:
+            f.seek(self._index_offset)
+            appended = f.read()
+        complete = appended[: appended.rfind(b"\n") + 1]
+        for key in complete.decode("utf-8").splitlines():
+            self._index.setdefault(key, self._num_rows)
+            self._num_rows += 1
+        self._index_offset += len(complete)
+
+    def _vectors(self) -> np.memmap:
+        if self._mmap is None or self._mmap.shape[0] != self._num_rows:
+            self._mmap = np.memmap(
+                self._vectors_fpath, dtype=np.float32, mode="r", shape=(self._num_rows, self.dim)
+            )
+        return self._mmap
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return key in self._index
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """Look up vectors for the given keys. Missing keys are absent from the result."""
+        with self._lock:
+            self._refresh()
+            found = [key for key in dict.fromkeys(keys) if key in self._index]
+            if not len(found):
+                return {}
+            rows = self._vectors()[[self._index[key] for key in found]]
+        return dict(zip(found, rows))
+
+    def add_many(self, keys: list[str], vectors: np.ndarray) -> None:
+        """Append vectors for keys that aren't in the store yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+        assert vectors.ndim == 2 and vectors.shape[0] == len(keys), "Expected one vector per key"
+
+        with self._lock:
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._meta_fpath, "w") as f:
+                    jsondump({"dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Vectors of dimension {vectors.shape[1]} don't match the store's dimension {self.dim}."
+                )
+
+            new_keys, new_rows, seen = [], [], set()
+            for i, key in enumerate(keys):
+                if key not in self._index and key not in seen:
+                    seen.add(key)
+                    new_keys.append(key)
+                    new_rows.append(i)
+            if not len(new_keys):
+                return
+
+            with open(self._vectors_fpath, "ab") as f:
+                f.write(np.ascontiguousarray(vectors[new_rows]).tobytes())
+            with open(self._index_fpath, "a") as f:
+                f.writelines(key + "\n" for key in new_keys)
+            # read back our own rows the same way as those of other stores
+            self._refresh()
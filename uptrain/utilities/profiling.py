@@ -0,0 +1,213 @@
+"""
+Per-operator profiling for compute DAGs and check sets. For every node that runs, a
+`NodeProfile` records the wall and cpu time, rows in and out, how much it raised the
+peak memory of the process, and the LLM tokens spent. Profiles can be exported as
+json, or as a Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev).
+"""
+
+from __future__ import annotations
+import contextlib
+import contextvars
+import dataclasses
+import os
+import sys
+import threading
+import time
+import typing as t
+
+import polars as pl
+
+from uptrain.utilities import Timer, jsondump
+
+__all__ = ["NodeProfile", "Profiler", "profile_node", "record_llm_usage"]
+
+
+@dataclasses.dataclass
+class NodeProfile:
+    """Measurements for a single run of an operator.
+
+    Attributes:
+        dag (str): Name of the DAG (or check set) the node belongs to.
+        node (str): Name of the node within the DAG.
+        op_name (str): Class name of the operator.
+        start_us (int): Wall clock time the node started at, in microseconds since the epoch.
+        wall_secs (float): Elapsed wall time.
+        cpu_secs (float): Cpu time used by the process while the node ran. Overlaps for nodes run concurrently.
+        rows_in (int): Total number of rows across the input dataframes.
+        rows_out (int | None): Number of rows in the output dataframe.
+        peak_rss_delta_bytes (int | None): How much the node raised the peak resident memory of the process.
+        llm_prompt_tokens (int): Prompt tokens sent to LLM providers.
+        llm_completion_tokens (int): Completion tokens received from LLM providers.
+        pid (int): Process the node ran in.
+        tid (int): Thread the node ran in.
+    """
+
+    dag: str
+    node: str
+    op_name: str
+    start_us: int = 0
+    wall_secs: float = 0.0
+    cpu_secs: float = 0.0
+    rows_in: int = 0
+    rows_out: t.Optional[int] = None
+    peak_rss_delta_bytes: t.Optional[int] = None
+    llm_prompt_tokens: int = 0
+    llm_completion_tokens: int = 0
+    pid: int = 0
+    tid: int = 0
+
+
+# -----------------------------------------------------------
+# Measuring a node
+# -----------------------------------------------------------
+
+# the profile of the node running in the current context, to attribute LLM usage to
+_CURRENT_PROFILE: contextvars.ContextVar[t.Optional[NodeProfile]] = contextvars.ContextVar(
+    "uptrain_current_profile", default=None
+)
+
+
+def record_llm_usage(usage: t.Any) -> None:
+    """Adds the token usage reported in an LLM response to the node being profiled, if any."""
+    profile = _CURRENT_PROFILE.get()
+    if profile is None or usage is None:
+        return
+    profile.llm_prompt_tokens += getattr(usage, "prompt_tokens", None) or 0
+    profile.llm_completion_tokens += getattr(usage, "completion_tokens", None) or 0
+
+
+def _peak_rss_bytes() -> t.Optional[int]:
+    try:
+        import resource
+    except ImportError:  # not available on windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # linux reports kilobytes
+
+
+def _num_rows(data: t.Any) -> int:
+    return len(data) if isinstance(data, pl.DataFrame) else 0
+
+
+@contextlib.contextmanager
+def profile_node(
+    dag: str, node: str, op: t.Any, inputs: t.Sequence[t.Any] = ()
+) -> t.Iterator[NodeProfile]:
+    """Profiles the enclosed block as a run of `op`. Set `rows_out` on the yielded profile
+    once the output is known."""
+    profile = NodeProfile(
+        dag=dag,
+        node=node,
+        op_name=type(op).__name__,
+        rows_in=sum(_num_rows(data) for data in inputs),
+        pid=os.getpid(),
+        tid=threading.get_ident(),
+    )
+    token = _CURRENT_PROFILE.set(profile)
+    peak_rss = _peak_rss_bytes()
+    cpu_start = time.process_time()
+    profile.start_us = time.time_ns() // 1000
+    try:
+        with Timer() as timer:
+            yield profile
+    finally:
+        profile.cpu_secs = round(time.process_time() - cpu_start, 3)
+        profile.wall_secs = timer.time
+        if peak_rss is not None:
+            profile.peak_rss_delta_bytes = (_peak_rss_bytes() or 0) - peak_rss
+        _CURRENT_PROFILE.reset(token)
+
+
+# -----------------------------------------------------------
+# Collecting and exporting profiles
+# -----------------------------------------------------------
+
+
+class Profiler:
+    """Collects node profiles from one or more DAG runs. Safe to share across threads."""
+
+    profiles: list[NodeProfile]
+
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: NodeProfile) -> None:
+        with self._lock:
+            self.profiles.append(profile)
+
+    @contextlib.contextmanager
+    def profile(
+        self, dag: str, node: str, op: t.Any, inputs: t.Sequence[t.Any] = ()
+    ) -> t.Iterator[NodeProfile]:
+        """Same as `profile_node`, adding the profile to this profiler once done."""
+        with profile_node(dag, node, op, inputs) as profile:
+            yield profile
+        self.add(profile)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            profiles = sorted(self.profiles, key=lambda p: p.start_us)
+        return {"nodes": [dataclasses.asdict(p) for p in profiles]}
+
+    def export_json(self, fpath: str) -> None:
+        with open(fpath, "w") as f:
+            jsondump(self.to_dict(), f, indent=2)
+
+    def export_chrome_trace(self, fpath: str) -> None:
+        """Writes the profiles as complete events in the Chrome trace event format."""
+        events = []
+        for p in self.to_dict()["nodes"]:
+            args = {
+                key: p[key]
+                for key in [
+                    "op_name",
+                    "cpu_secs",
+                    "rows_in",
+                    "rows_out",
+                    "peak_rss_delta_bytes",
+                    "llm_prompt_tokens",
+                    "llm_completion_tokens",
+                ]
+            }
+            events.append(
+                {
+                    "name": p["node"],
+                    "cat": p["dag"],
+                    "ph": "X",
+                    "ts": p["start_us"],
+                    "dur": int(p["wall_secs"] * 1e6),
+                    "pid": p["pid"],
+                    "tid": p["tid"],
+                    "args": args,
+                }
+            )
+        with open(fpath, "w") as f:
+            jsondump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def flame_summary(self, width: int = 40) -> str:
+        """A text summary of where the time went - wall time per DAG, and per node within
+        it, with bars scaled to the slowest DAG."""
+        by_dag: dict[str, list[NodeProfile]] = {}
+        with self._lock:
+            for profile in self.profiles:
+                by_dag.setdefault(profile.dag, []).append(profile)
+        if not len(by_dag):
+            return "No operators were profiled."
+
+        dag_times = {dag: sum(p.wall_secs for p in nodes) for dag, nodes in by_dag.items()}
+        scale = max(max(dag_times.values()), 1e-9)
+
+        def _line(label: str, secs: float, extra: str = "") -> str:
+            bar = "█" * max(int(round(width * secs / scale)), 1 if secs > 0 else 0)
+            return f"{label[:48]:<48} {secs:>9.3f}s  {bar:<{width}} {extra}".rstrip()
+
+        lines = []
+        for dag, nodes in sorted(by_dag.items(), key=lambda item: -dag_times[item[0]]):
+            lines.append(_line(dag, dag_times[dag]))
+            for p in sorted(nodes, key=lambda p: -p.wall_secs):
+                extra = f"rows {p.rows_in}->{p.rows_out if p.rows_out is not None else '-'}"
+                if p.llm_prompt_tokens or p.llm_completion_tokens:
+                    extra += f", tokens {p.llm_prompt_tokens}+{p.llm_completion_tokens}"
+                lines.append(_line(f"  {p.node} ({p.op_name})", p.wall_secs, extra))
+        return "\n".join(lines)
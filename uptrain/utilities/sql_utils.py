@@ -1,17 +1,44 @@
 import sqlite3
-from collections import defaultdict
-from typing import Dict, Any, Set
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import pathlib
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Set, Tuple
 
 import numpy as np
 import polars as pl
 
-from sqlglot import Expression
-from sqlglot.expressions import Table, Column, ColumnDef, Create, Schema
+import sqlglot
+from sqlglot.expressions import Expression, Table, Column, ColumnDef, Create, Schema
 
 from loguru import logger
 
 PLACEHOLDER_TABLE = "PLACEHOLDER_TABLE"
 
+# number of sqlite virtual machine instructions between checks of the query deadline
+PROGRESS_HANDLER_STEPS = 10_000
+# number of database connections each thread keeps open
+MAX_SNAPSHOTS = 32
+# total size of the databases each thread keeps in memory
+MAX_SNAPSHOT_BYTES = 512 * 1024 * 1024
+# databases larger than this are queried from the file instead of copied in memory
+SNAPSHOT_MAX_DB_BYTES = 64 * 1024 * 1024
+# below this many distinct (predicted, ground truth, db) rows, spawning processes costs more than it saves
+SQL_POOL_MIN_PAIRS = 1_000
+# below this many distinct statements to parse, spawning processes costs more than it saves
+SQL_PARSE_POOL_MIN = 2_000
+
+
+class QueryLimitExceeded(Exception):
+    pass
+
 
 def merge_dictionaries(dict1: Dict[Any, Set], dict2: Dict[Any, Set]):
     for key, value in dict2.items():
@@ -23,10 +50,13 @@ def merge_dictionaries(dict1: Dict[Any, Set], dict2: Dict[Any, Set]):
     return dict1
 
 
-def extract_tables_and_columns(expression: Expression, alias_mapping=None):
-    if alias_mapping is None:
-        alias_mapping = {}
+def _child_expressions(expression: Expression):
+    # older sqlglot versions yield (key, expression) pairs, newer ones the expressions alone
+    for child in expression.iter_expressions():
+        yield child[1] if isinstance(child, tuple) else child
 
+
+def _enter_expression(expression: Expression, alias_mapping):
     tables = defaultdict(set)
 
     # Handle tables and table aliases
@@ -36,10 +66,10 @@ def extract_tables_and_columns(expression: Expression, alias_mapping=None):
             tables[table_key] = set([])
         if expression.alias:
             alias_mapping[expression.alias] = table_key
+    return tables
 
-    for key, e in expression.iter_expressions():
-        merge_dictionaries(tables, extract_tables_and_columns(e, alias_mapping))
 
+def _exit_expression(expression: Expression, tables, alias_mapping):
     # Handle columns and their associated tables or table aliases
     if isinstance(expression, Column):
         table = f"{expression.db}.{expression.table}" if expression.db else expression.table
@@ -61,7 +91,35 @@ def extract_tables_and_columns(expression: Expression, alias_mapping=None):
     for table in alias_mapping:
         if table in tables:
             del tables[table]
-    return tables
+
+
+def extract_tables_and_columns(expression: Expression, alias_mapping=None):
+    """Collects the tables referenced by the expression, and the columns read from each.
+
+    The tree is walked with an explicit stack instead of recursion, so deeply nested
+    expressions (ex: a long chain of ORs) don't exceed the interpreter's recursion limit.
+    """
+    if alias_mapping is None:
+        alias_mapping = {}
+
+    # each frame is (expression, tables found under it so far, its remaining children)
+    stack = [
+        (expression, _enter_expression(expression, alias_mapping), _child_expressions(expression))
+    ]
+    while True:
+        node, tables, children = stack[-1]
+        child = next(children, None)
+        if child is not None:
+            stack.append(
+                (child, _enter_expression(child, alias_mapping), _child_expressions(child))
+            )
+            continue
+
+        stack.pop()
+        _exit_expression(node, tables, alias_mapping)
+        if not len(stack):
+            return tables
+        merge_dictionaries(stack[-1][1], tables)
 
 
 def extract_tables_and_columns_from_create(expression: Create):
@@ -75,18 +133,119 @@ def extract_tables_and_columns_from_create(expression: Create):
     return table_name, columns
 
 
-def run_query(query, connection):
-    cursor = connection.cursor()
-    cursor.execute(query)
+def parse_sql_tables(sql, dialect=None):
+    """Parses a SQL statement into a json dictionary Table -> [columns], and whether the
+    parser accepted it. Invalid SQL gives an empty dictionary."""
+    try:
+        parsed = sqlglot.parse(sql, read=dialect)
+        tables_and_columns = extract_tables_and_columns(parsed[0])
+    except sqlglot.errors.ParseError:
+        return json.dumps({}), False
+    # Since sets are not serializable, convert to (sorted, so the output is stable) lists
+    return json.dumps({table: sorted(columns) for table, columns in tables_and_columns.items()}), True
 
-    # Get data and column names from the cursor
-    data = cursor.fetchall()
-    columns = [description[0] for description in cursor.description]
+
+def parse_create_statements(create_statements, dialect="sqlite"):
+    """Parses the ";" separated CREATE TABLE statements into a json dictionary Table -> [columns]."""
+    tables_and_columns = {}
+    # SQL statements are separated by ';'
+    for statement in create_statements.split(";"):
+        if statement.upper().strip().startswith("CREATE TABLE"):
+            parsed = sqlglot.parse(statement.strip(), read=dialect)
+            table, columns = extract_tables_and_columns_from_create(parsed[0])
+            tables_and_columns[table] = sorted(columns)
+    return json.dumps(tables_and_columns)
+
+
+def _parse_chunk(parse_fn, texts):
+    return [parse_fn(text) for text in texts]
+
+
+def parse_batch(parse_fn, texts, num_workers=None, chunk_size=500):
+    """Applies `parse_fn` (ex: `parse_sql_tables`) once per distinct text, and returns the
+    results in the order of `texts`.
+
+    Large inputs are parsed on a process pool of `num_workers` processes (defaults to the cpu
+    count), `chunk_size` texts at a time. `parse_fn` must be picklable, ex: a module level
+    function or a `functools.partial` of one.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    chunks = [
+        unique_texts[start : start + chunk_size]
+        for start in range(0, len(unique_texts), chunk_size)
+    ]
+
+    num_workers = num_workers or os.cpu_count() or 1
+    if len(unique_texts) < SQL_PARSE_POOL_MIN or num_workers <= 1 or len(chunks) <= 1:
+        chunk_results = [_parse_chunk(parse_fn, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(num_workers, len(chunks)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            chunk_results = list(
+                executor.map(functools.partial(_parse_chunk, parse_fn), chunks)
+            )
+
+    parsed = dict(
+        zip(unique_texts, [result for chunk in chunk_results for result in chunk])
+    )
+    return [parsed[text] for text in texts]
+
+
+@contextlib.contextmanager
+def query_limits(connection, timeout=None):
+    """Interrupts queries on the connection once they run longer than `timeout` seconds."""
+    if timeout is None:
+        yield
+        return
+    deadline = time.monotonic() + timeout
+    connection.set_progress_handler(
+        lambda: 1 if time.monotonic() > deadline else 0, PROGRESS_HANDLER_STEPS
+    )
+    try:
+        yield
+    finally:
+        connection.set_progress_handler(None, 0)
+
+
+def run_query(query, connection, timeout=None, max_rows=None):
+    """Runs the query and returns its result as a dataframe.
+
+    If `timeout` (seconds) is set, the query is interrupted once it runs longer. If `max_rows`
+    is set, a query returning more rows raises QueryLimitExceeded.
+    """
+    with query_limits(connection, timeout):
+        cursor = connection.cursor()
+        cursor.execute(query)
+
+        # Get data and column names from the cursor
+        if max_rows is None:
+            data = cursor.fetchall()
+        else:
+            data = cursor.fetchmany(max_rows + 1)
+            if len(data) > max_rows:
+                raise QueryLimitExceeded(f"Query returned more than {max_rows} rows")
+        columns = [description[0] for description in cursor.description]
 
     df = pl.DataFrame(data, columns)
     return df
 
 
+def compare_results(pred_df, gt_df, ignore_column_order=True, ignore_row_order=True):
+    if ignore_column_order:
+        # Bring the columns to the same order
+        pred_df = pred_df.select(sorted(pred_df.columns, key=str.lower))
+        gt_df = gt_df.select(sorted(gt_df.columns, key=str.lower))
+
+    if ignore_row_order:
+        # Sort the dataframe rows to ignore row order
+        pred_df = pred_df.sort(list(pred_df.columns))
+        gt_df = gt_df.sort(list(gt_df.columns))
+
+    return np.array_equal(pred_df.to_numpy(), gt_df.to_numpy())
+
+
 # Execute predicted SQL, ground truth and compute execution accuracy of the predicted sql. We assume these queries to be
 # read queries.
 def execute_and_compare_sql(predicted_sql, ground_truth, db_path, ignore_column_order=True, ignore_row_order=True):
@@ -100,19 +259,314 @@ def execute_and_compare_sql(predicted_sql, ground_truth, db_path, ignore_column_
         # Close the connection
         conn.close()
 
-        if ignore_column_order:
-            # Bring the columns to the same order
-            pred_df = pred_df.select(sorted(pred_df.columns, key=str.lower))
-            gt_df = gt_df.select(sorted(gt_df.columns, key=str.lower))
-
-        if ignore_row_order:
-            # Sort the dataframe rows to ignore row order
-            pred_df = pred_df.sort(list(pred_df.columns))
-            gt_df = gt_df.sort(list(gt_df.columns))
-
-        res = np.array_equal(pred_df.to_numpy(), gt_df.to_numpy())
+        res = compare_results(pred_df, gt_df, ignore_column_order, ignore_row_order)
     except Exception as e:
         logger.warning(f"Error executing: {e}")
         pass
     return res
 
+
+# -----------------------------------------------------------
+# Streaming comparison of result-set fingerprints
+# -----------------------------------------------------------
+
+_MASK_64 = (1 << 64) - 1
+_ROLLING_BASE = 0x100000001B3
+
+
+def _mix_64(x: int) -> int:
+    """splitmix64 finaliser, so row hashes don't combine linearly in the sums below."""
+    x &= _MASK_64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return x ^ (x >> 31)
+
+
+def has_order_by(query: str) -> bool:
+    """Whether the outermost statement of the query sorts its rows."""
+    try:
+        parsed = sqlglot.parse_one(query, read="sqlite")
+    except Exception:
+        return re.search(r"\border\s+by\b", query, flags=re.IGNORECASE) is not None
+    return parsed is not None and parsed.args.get("order") is not None
+
+
+class ResultFingerprint:
+    """Incremental fingerprint of a query result, fed a batch of rows at a time.
+
+    Unordered results are fingerprinted as a multiset - the row count and the sum of the row
+    hashes - and ordered ones with a rolling hash over the rows in order. Values that compare
+    equal in python (ex: 1 and 1.0) hash the same, as they compare equal in `compare_results`.
+    """
+
+    def __init__(self, column_order: List[int], ordered: bool):
+        self.column_order = column_order
+        self.ordered = ordered
+        self.count = 0
+        self.digest = 0
+
+    def update(self, rows: List[tuple]) -> None:
+        order = self.column_order
+        digest = self.digest
+        for row in rows:
+            row_hash = _mix_64(hash(tuple(row[i] for i in order)))
+            if self.ordered:
+                digest = (digest * _ROLLING_BASE + row_hash) & _MASK_64
+            else:
+                digest = (digest + row_hash) & _MASK_64
+        self.digest = digest
+        self.count += len(rows)
+
+
+def _column_order(cursor, ignore_column_order: bool) -> List[int]:
+    columns = [description[0] for description in cursor.description]
+    if len(set(columns)) != len(columns):
+        # matches `run_query`, which can't build a dataframe with duplicate column names
+        raise ValueError(f"Duplicate column names in query result: {columns}")
+    if ignore_column_order:
+        return sorted(range(len(columns)), key=lambda i: columns[i].lower())
+    return list(range(len(columns)))
+
+
+def fingerprint_compare_sql(
+    predicted_sql: str,
+    ground_truth: str,
+    connection,
+    ignore_column_order: bool = True,
+    ignore_row_order: bool = True,
+    timeout: Optional[float] = None,
+    max_rows: Optional[int] = None,
+    batch_size: int = 1000,
+) -> bool:
+    """Streaming alternative to running both queries with `run_query` and comparing them with
+    `compare_results`, using constant memory whatever the size of the results.
+
+    Both cursors are read in lockstep, `batch_size` rows at a time, and fingerprinted with
+    `ResultFingerprint`. Rows are compared in order (rolling hash) when row order matters and
+    the ground truth query has an ORDER BY, and as a multiset otherwise. The comparison stops
+    at the first batch where the results differ in length, or for ordered results, in content.
+    """
+    ordered = not ignore_row_order and has_order_by(ground_truth)
+    with query_limits(connection, timeout):
+        pred_cursor = connection.cursor().execute(predicted_sql)
+        gt_cursor = connection.cursor().execute(ground_truth)
+        try:
+            pred_order = _column_order(pred_cursor, ignore_column_order)
+            gt_order = _column_order(gt_cursor, ignore_column_order)
+            if len(pred_order) != len(gt_order):
+                return False
+
+            pred_fp = ResultFingerprint(pred_order, ordered)
+            gt_fp = ResultFingerprint(gt_order, ordered)
+            while True:
+                pred_rows = pred_cursor.fetchmany(batch_size)
+                gt_rows = gt_cursor.fetchmany(batch_size)
+                if len(pred_rows) != len(gt_rows):
+                    return False
+                if not len(pred_rows):
+                    break
+                pred_fp.update(pred_rows)
+                gt_fp.update(gt_rows)
+                if max_rows is not None and pred_fp.count > max_rows:
+                    raise QueryLimitExceeded(f"Query returned more than {max_rows} rows")
+                if ordered and pred_fp.digest != gt_fp.digest:
+                    return False
+            return pred_fp.digest == gt_fp.digest
+        finally:
+            pred_cursor.close()
+            gt_cursor.close()
+
+
+# -----------------------------------------------------------
+# Batched execution against in-memory database snapshots
+# -----------------------------------------------------------
+
+_local = threading.local()
+
+
+def _connect_read_only(db_path: str) -> sqlite3.Connection:
+    return sqlite3.connect(pathlib.Path(db_path).absolute().as_uri() + "?mode=ro", uri=True)
+
+
+def get_snapshot(db_path: str) -> sqlite3.Connection:
+    """Returns a read-only connection to the database, reused by each thread until the file
+    changes. Databases up to SNAPSHOT_MAX_DB_BYTES are copied in memory with the sqlite
+    backup API, larger ones are queried from the file. The least recently used connections
+    are closed beyond MAX_SNAPSHOTS, or MAX_SNAPSHOT_BYTES of in-memory copies."""
+    snapshots = getattr(_local, "snapshots", None)
+    if snapshots is None:
+        snapshots = _local.snapshots = OrderedDict()
+
+    stat = os.stat(db_path)
+    key = (os.path.abspath(db_path), stat.st_mtime_ns, stat.st_size)
+    if key in snapshots:
+        snapshots.move_to_end(key)
+        return snapshots[key][0]
+
+    if stat.st_size > SNAPSHOT_MAX_DB_BYTES:
+        snapshot, size = _connect_read_only(db_path), 0
+    else:
+        source = _connect_read_only(db_path)
+        try:
+            snapshot = sqlite3.connect(":memory:")
+            source.backup(snapshot)
+        finally:
+            source.close()
+        size = stat.st_size
+    # predicted queries must not modify the snapshot shared by the rows that follow
+    snapshot.execute("PRAGMA query_only = ON")
+    snapshots[key] = (snapshot, size)
+    _local.snapshot_bytes = getattr(_local, "snapshot_bytes", 0) + size
+    while len(snapshots) > 1 and (
+        len(snapshots) > MAX_SNAPSHOTS or _local.snapshot_bytes > MAX_SNAPSHOT_BYTES
+    ):
+        evicted, evicted_size = snapshots.popitem(last=False)[1]
+        evicted.close()
+        _local.snapshot_bytes -= evicted_size
+    return snapshot
+
+
+def clear_snapshots() -> None:
+    """Close the connections cached by `get_snapshot` in the current thread."""
+    snapshots = getattr(_local, "snapshots", None)
+    while snapshots:
+        snapshots.popitem()[1][0].close()
+    _local.snapshot_bytes = 0
+
+
+def _compare_chunk(
+    db_path: str,
+    pairs: List[Tuple[str, str]],
+    ignore_column_order: bool = True,
+    ignore_row_order: bool = True,
+    timeout: Optional[float] = None,
+    max_rows: Optional[int] = None,
+    streaming: bool = False,
+) -> List[bool]:
+    """Executes and compares (predicted, ground truth) pairs against one database, running
+    each distinct query once, or streaming each pair through `fingerprint_compare_sql`.
+    Defined at the module level so it can be sent to a process pool."""
+    try:
+        conn = get_snapshot(db_path)
+    except Exception as e:
+        logger.warning(f"Error loading database {db_path}: {e}")
+        return [False] * len(pairs)
+
+    if streaming:
+        results = []
+        for predicted_sql, ground_truth in pairs:
+            try:
+                results.append(
+                    fingerprint_compare_sql(
+                        predicted_sql,
+                        ground_truth,
+                        conn,
+                        ignore_column_order=ignore_column_order,
+                        ignore_row_order=ignore_row_order,
+                        timeout=timeout,
+                        max_rows=max_rows,
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"Error executing: {e}")
+                results.append(False)
+        return results
+
+    query_results: Dict[str, Any] = {}
+
+    def _run(query):
+        if query not in query_results:
+            try:
+                query_results[query] = run_query(query, conn, timeout=timeout, max_rows=max_rows)
+            except Exception as e:
+                logger.warning(f"Error executing: {e}")
+                query_results[query] = e
+        return query_results[query]
+
+    results = []
+    for predicted_sql, ground_truth in pairs:
+        pred_df, gt_df = _run(predicted_sql), _run(ground_truth)
+        if isinstance(pred_df, Exception) or isinstance(gt_df, Exception):
+            results.append(False)
+            continue
+        try:
+            results.append(compare_results(pred_df, gt_df, ignore_column_order, ignore_row_order))
+        except Exception as e:
+            logger.warning(f"Error comparing: {e}")
+            results.append(False)
+    return results
+
+
+def _compare_chunk_star(args, **kwargs):
+    return _compare_chunk(*args, **kwargs)
+
+
+def execute_and_compare_sql_batch(
+    predicted_sqls: List[Optional[str]],
+    ground_truths: List[Optional[str]],
+    db_paths: List[str],
+    ignore_column_order: bool = True,
+    ignore_row_order: bool = True,
+    timeout: Optional[float] = None,
+    max_rows: Optional[int] = None,
+    num_workers: Optional[int] = None,
+    chunk_size: int = 200,
+    streaming: bool = False,
+) -> List[bool]:
+    """Batched `execute_and_compare_sql`, for rows of predicted sql, ground truth sql and
+    database path.
+
+    Each database is loaded once into a read-only in-memory snapshot, or opened read-only
+    if it's too large to copy (see `get_snapshot`), and released after the batch. Each
+    distinct (predicted, ground truth, db) row is compared once, running each distinct
+    query per database once. Queries are interrupted after `timeout` seconds, and fail if they return
+    more than `max_rows` rows. Large inputs run on a process pool of `num_workers`
+    processes (defaults to the cpu count), with the rows of a database kept together in
+    chunks of `chunk_size`. With `streaming`, results are compared by fingerprint instead of
+    being loaded in memory, see `fingerprint_compare_sql`.
+    """
+    assert len(predicted_sqls) == len(ground_truths) == len(db_paths), "Expected columns of equal length"
+    row_index: Dict[Tuple[str, str, str], int] = {}
+    inverse = [
+        row_index.setdefault(row, len(row_index))
+        for row in zip(db_paths, predicted_sqls, ground_truths)
+    ]
+    rows = list(row_index)
+    by_db: Dict[str, List[int]] = defaultdict(list)
+    for i, (db_path, _, _) in enumerate(rows):
+        by_db[db_path].append(i)
+    chunk_rows = [
+        indices[start : start + chunk_size]
+        for indices in by_db.values()
+        for start in range(0, len(indices), chunk_size)
+    ]
+    chunks = [(rows[indices[0]][0], [rows[i][1:] for i in indices]) for indices in chunk_rows]
+
+    compare_chunk = functools.partial(
+        _compare_chunk_star,
+        ignore_column_order=ignore_column_order,
+        ignore_row_order=ignore_row_order,
+        timeout=timeout,
+        max_rows=max_rows,
+        streaming=streaming,
+    )
+    num_workers = num_workers or os.cpu_count() or 1
+    if len(row_index) < SQL_POOL_MIN_PAIRS or num_workers <= 1 or len(chunks) <= 1:
+        try:
+            chunk_results = [compare_chunk(chunk) for chunk in chunks]
+        finally:
+            # don't hold on to the databases between batches, the workers of the pool
+            # below release theirs when they exit
+            clear_snapshots()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(num_workers, len(chunks)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            chunk_results = list(executor.map(compare_chunk, chunks))
+
+    unique_results = [False] * len(rows)
+    for indices, results in zip(chunk_rows, chunk_results):
+        for i, result in zip(indices, results):
+            unique_results[i] = result
+    return [unique_results[i] for i in inverse]
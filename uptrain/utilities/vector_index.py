@@ -0,0 +1,239 @@
+"""
+Nearest-neighbour indexes over a fixed set of vectors (ex: cluster centroids), that can be
+saved to disk and loaded back instead of being rebuilt on every run.
+
+All indexes search by euclidean distance. `ExactIndex` computes the distances to every
+vector with one matrix product per chunk of queries, and is the right choice up to tens
+of thousands of vectors. `HnswlibIndex` and `FaissIndex` build approximate HNSW graphs,
+using the optional `hnswlib` and `faiss-cpu` packages.
+"""
+
+from __future__ import annotations
+import os
+import typing as t
+
+import numpy as np
+
+from uptrain.utilities import jsondump, jsonload, lazy_load_dep
+
+hnswlib = lazy_load_dep("hnswlib", "hnswlib")
+faiss = lazy_load_dep("faiss", "faiss-cpu")
+
+__all__ = [
+    "VectorIndex",
+    "ExactIndex",
+    "HnswlibIndex",
+    "FaissIndex",
+    "get_vector_index",
+    "load_vector_index",
+]
+
+META_FNAME = "meta.json"
+
+
+class VectorIndex:
+    """Base class for nearest-neighbour indexes. Subclasses implement `_build`, `search`,
+    and saving/loading their data to a directory."""
+
+    kind: t.ClassVar[str]
+    dim: int | None
+    num_vectors: int
+
+    def __init__(self):
+        self.dim = None
+        self.num_vectors = 0
+
+    def build(self, vectors: np.ndarray) -> "VectorIndex":
+        vectors = np.asarray(vectors)
+        assert vectors.ndim == 2 and len(vectors) > 0, "Expected a non-empty 2d array of vectors"
+        self.dim, self.num_vectors = int(vectors.shape[1]), int(vectors.shape[0])
+        self._build(vectors)
+        return self
+
+    def _build(self, vectors: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def search(self, queries: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Find the `k` nearest vectors to each query.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The indices of the nearest vectors and their euclidean
+                distances, both of shape (num_queries, k), nearest first.
+        """
+        raise NotImplementedError
+
+    def save(self, dirpath: str) -> None:
+        os.makedirs(dirpath, exist_ok=True)
+        self._save(dirpath)
+        # written last, so an interrupted save isn't mistaken for a complete index
+        with open(os.path.join(dirpath, META_FNAME), "w") as f:
+            jsondump({"kind": self.kind, "dim": self.dim, "num_vectors": self.num_vectors}, f)
+
+    def _save(self, dirpath: str) -> None:
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls, dirpath: str) -> "VectorIndex":
+        with open(os.path.join(dirpath, META_FNAME), "r") as f:
+            meta = jsonload(f)
+        index = cls()
+        index.dim, index.num_vectors = meta["dim"], meta["num_vectors"]
+        index._load(dirpath)
+        return index
+
+    def _load(self, dirpath: str) -> None:
+        raise NotImplementedError
+
+
+class ExactIndex(VectorIndex):
+    """Exact search. Squared distances are computed as |q|^2 - 2 q.v + |v|^2, so the only
+    heavy operation is a single matrix product of a chunk of queries with all the vectors.
+
+    Attributes:
+        chunk_size (int): Number of queries to search at a time, to bound memory.
+    """
+
+    kind = "exact"
+    FNAME = "vectors.npy"
+
+    def __init__(self, chunk_size: int = 4096):
+        super().__init__()
+        self.chunk_size = chunk_size
+        self._vectors: np.ndarray | None = None
+        self._sq_norms: np.ndarray | None = None
+
+    def _build(self, vectors: np.ndarray) -> None:
+        self._vectors = np.ascontiguousarray(vectors, dtype=np.float64)
+        self._sq_norms = np.einsum("ij,ij->i", self._vectors, self._vectors)
+
+    def search(self, queries: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        assert self._vectors is not None and self._sq_norms is not None, "The index is empty"
+        queries = np.asarray(queries, dtype=np.float64)
+        k = min(k, self.num_vectors)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        distances = np.empty((len(queries), k), dtype=np.float64)
+        for start in range(0, len(queries), self.chunk_size):
+            chunk = queries[start : start + self.chunk_size]
+            sq_dists = (
+                np.einsum("ij,ij->i", chunk, chunk)[:, None]
+                - 2 * (chunk @ self._vectors.T)
+                + self._sq_norms[None, :]
+            )
+            if k < self.num_vectors:
+                nearest = np.argpartition(sq_dists, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(k), (len(chunk), k))
+            nearest_dists = np.take_along_axis(sq_dists, nearest, axis=1)
+            order = np.argsort(nearest_dists, axis=1, kind="stable")
+            indices[start : start + len(chunk)] = np.take_along_axis(nearest, order, axis=1)
+            distances[start : start + len(chunk)] = np.sqrt(
+                np.maximum(np.take_along_axis(nearest_dists, order, axis=1), 0.0)
+            )
+        return indices, distances
+
+    def _save(self, dirpath: str) -> None:
+        assert self._vectors is not None
+        np.save(os.path.join(dirpath, self.FNAME), self._vectors)
+
+    def _load(self, dirpath: str) -> None:
+        self._build(np.load(os.path.join(dirpath, self.FNAME)))
+
+
+class HnswlibIndex(VectorIndex):
+    """Approximate search over an HNSW graph built with `hnswlib`.
+
+    Attributes:
+        m (int): Number of links per node in the graph.
+        ef_construction (int): Size of the candidate list while building the graph.
+        ef_search (int): Size of the candidate list while searching, higher is more accurate.
+    """
+
+    kind = "hnswlib"
+    FNAME = "index.bin"
+
+    def __init__(self, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        super().__init__()
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index = None
+
+    def _build(self, vectors: np.ndarray) -> None:
+        self._index = hnswlib.Index(space="l2", dim=self.dim)
+        self._index.init_index(
+            max_elements=self.num_vectors, M=self.m, ef_construction=self.ef_construction
+        )
+        self._index.add_items(np.asarray(vectors, dtype=np.float32), np.arange(self.num_vectors))
+
+    def search(self, queries: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        assert self._index is not None, "The index is empty"
+        k = min(k, self.num_vectors)
+        self._index.set_ef(max(self.ef_search, k))
+        labels, sq_dists = self._index.knn_query(np.asarray(queries, dtype=np.float32), k=k)
+        return labels.astype(np.int64), np.sqrt(np.maximum(sq_dists, 0.0)).astype(np.float64)
+
+    def _save(self, dirpath: str) -> None:
+        assert self._index is not None
+        self._index.save_index(os.path.join(dirpath, self.FNAME))
+
+    def _load(self, dirpath: str) -> None:
+        self._index = hnswlib.Index(space="l2", dim=self.dim)
+        self._index.load_index(os.path.join(dirpath, self.FNAME), max_elements=self.num_vectors)
+
+
+class FaissIndex(VectorIndex):
+    """Approximate search over an HNSW graph built with `faiss`.
+
+    Attributes:
+        m (int): Number of links per node in the graph.
+        ef_search (int): Size of the candidate list while searching, higher is more accurate.
+    """
+
+    kind = "faiss"
+    FNAME = "index.faiss"
+
+    def __init__(self, m: int = 32, ef_search: int = 64):
+        super().__init__()
+        self.m = m
+        self.ef_search = ef_search
+        self._index = None
+
+    def _build(self, vectors: np.ndarray) -> None:
+        self._index = faiss.IndexHNSWFlat(self.dim, self.m)
+        self._index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    def search(self, queries: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        assert self._index is not None, "The index is empty"
+        k = min(k, self.num_vectors)
+        self._index.hnsw.efSearch = max(self.ef_search, k)
+        sq_dists, labels = self._index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        return labels.astype(np.int64), np.sqrt(np.maximum(sq_dists, 0.0)).astype(np.float64)
+
+    def _save(self, dirpath: str) -> None:
+        assert self._index is not None
+        faiss.write_index(self._index, os.path.join(dirpath, self.FNAME))
+
+    def _load(self, dirpath: str) -> None:
+        self._index = faiss.read_index(os.path.join(dirpath, self.FNAME))
+
+
+_INDEX_CLASSES: dict[str, type[VectorIndex]] = {
+    cls.kind: cls for cls in [ExactIndex, HnswlibIndex, FaissIndex]
+}
+
+
+def get_vector_index(kind: t.Literal["exact", "hnswlib", "faiss"] = "exact") -> VectorIndex:
+    """Construct an empty index by name."""
+    if kind not in _INDEX_CLASSES:
+        raise ValueError(f"Unknown vector index: {kind}")
+    return _INDEX_CLASSES[kind]()
+
+
+def load_vector_index(dirpath: str) -> VectorIndex | None:
+    """Load an index saved to the directory, or return None if there isn't a complete one."""
+    meta_fpath = os.path.join(dirpath, META_FNAME)
+    if not os.path.exists(meta_fpath):
+        return None
+    with open(meta_fpath, "r") as f:
+        kind = jsonload(f)["kind"]
+    return _INDEX_CLASSES[kind].load(dirpath)